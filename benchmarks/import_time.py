@@ -0,0 +1,89 @@
+""" import_time.py
+
+    Benchmark:  how long does 'import gmutils' take, and which heavy dependencies does it pull in?
+
+    Each case runs in a fresh interpreter several times; the median wall time is reported along with the heavy top-level packages found
+    in sys.modules afterwards.  The 'eager' cases set GM_EAGER_IMPORT=1, which reproduces the old import-everything behavior.
+
+    Usage:
+
+        python benchmarks/import_time.py [--repeat 5]
+
+"""
+import os, sys, re
+import json
+import argparse
+import subprocess
+
+################################################################################
+# CONFIG
+
+HEAVY = ['tensorflow', 'spacy', 'elasticsearch', 'pymongo', 'boto3', 'torch', 'sklearn', 'pandas', 'scipy']
+
+CASES = [
+    ('import gmutils',                           "import gmutils",                                         {}),
+    ('normalize + damerauLevenshtein',           "from gmutils import normalize, damerauLevenshtein",      {}),
+    ('Document (loads spaCy)',                   "from gmutils import Document",                           {}),
+    ('import gmutils (eager)',                   "import gmutils",                                         {'GM_EAGER_IMPORT':'1'}),
+]
+
+PROBE = """
+import sys, time, json
+t0 = time.perf_counter()
+%s
+t1 = time.perf_counter()
+heavy = [ m for m in %s if m in sys.modules ]
+print(json.dumps({'seconds':t1 - t0, 'heavy':heavy}))
+"""
+
+################################################################################
+# FUNCTIONS
+
+def run_case(statement, env_extra, repeat):
+    """
+    Time <statement> in <repeat> fresh interpreters
+
+    Returns
+    -------
+    (median seconds, list of heavy modules loaded) or (None, error message)
+
+    """
+    env = dict(os.environ)
+    env.pop('GM_EAGER_IMPORT', None)
+    env.update(env_extra)
+    code = PROBE % (statement, repr(HEAVY))
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    times = []
+    heavy = []
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, '-c', code], cwd=root, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if proc.returncode != 0:
+            lines = proc.stderr.decode('utf-8', 'replace').strip().split('\n')
+            return None, lines[-1]
+        result = json.loads(proc.stdout.decode('utf-8').strip().split('\n')[-1])
+        times.append(result['seconds'])
+        heavy = result['heavy']
+
+    times.sort()
+    return times[len(times) // 2], heavy
+
+
+################################################################################
+# MAIN
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Import-time benchmark for gmutils")
+    parser.add_argument('--repeat', help='Fresh interpreters per case', type=int, default=5)
+    args = parser.parse_args()
+
+    for name, statement, env_extra in CASES:
+        seconds, heavy = run_case(statement, env_extra, args.repeat)
+        if seconds is None:
+            print("%-36s  FAILED: %s"% (name, heavy))
+        else:
+            print("%-36s  %8.3fs   loaded: %s"% (name, seconds, ', '.join(heavy) or '-'))
+
+
+################################################################################
+################################################################################
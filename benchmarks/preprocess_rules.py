@@ -0,0 +1,53 @@
+""" preprocess_rules.py
+
+    Benchmark:  time spent in Document.preprocess() by each rewrite rule (agglomerations and delegations), summed over many Documents,
+    with the number of candidate Nodes, calls, changes and re-queued Nodes for each rule, and the hit rate of the per-Node caches of
+    token attributes.
+
+    Usage:
+
+        python benchmarks/preprocess_rules.py [--file corpus.txt] [--num 500]
+
+"""
+import os, sys, re
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from spacy_pipeline import load_texts
+
+################################################################################
+# MAIN
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Per-rule cost of the tree rewriting done by Document.preprocess()")
+    parser.add_argument('--file', help='Text file, one document per line (default: built-in samples)', type=str, required=False)
+    parser.add_argument('--num',  help='Number of documents', type=int, default=500)
+    args = parser.parse_args()
+
+    from gmutils.document import Document
+    from gmutils.rewrite import PREPROCESS, add_stats, format_stats
+    from gmutils.node import attribute_cache_stats
+
+    texts = load_texts(args.file, args.num)
+    docs  = list(Document.from_texts(texts))
+    num_nodes = sum( doc.get_num_nodes() for doc in docs )
+
+    total = {}
+    t0 = time.perf_counter()
+    for doc in docs:
+        doc.rewrite(PREPROCESS)
+        add_stats(total, doc.rewrite_stats)
+    seconds = time.perf_counter() - t0
+
+    print("%d documents, %d nodes:  %.3fs  (%.1f us/node)\n"% (len(docs), num_nodes, seconds, 1e6 * seconds / max(num_nodes, 1)))
+    print(format_stats(total))
+
+    cache = attribute_cache_stats()
+    print("\ntoken attributes:  %d hits, %d misses, %d invalidations  (hit rate %.1f%%)"% (cache['hits'], cache['misses'],
+                                                                                       cache['invalidations'], 100 * cache['hit_rate']))
+
+
+################################################################################
+################################################################################
@@ -0,0 +1,108 @@
+""" sentence_boundaries.py
+
+    Benchmark:  the array-based sentence boundary pass in nlp.py (set_sentence_starts, find_sentence_offsets, get_sentences) against
+    the earlier per-token Python implementations, on long documents.  Outputs are checked for equality.
+
+    Usage:
+
+        python benchmarks/sentence_boundaries.py [--sentences 20000] [--repeat 3]
+
+"""
+import os, sys, re
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from spacy_pipeline import SAMPLE
+
+################################################################################
+# LEGACY IMPLEMENTATIONS (for comparison)
+
+def legacy_find_sentence_offsets(doc):
+    sen_offsets = [ [sen.start, sen.end] for sen in list(doc.sents) ]
+    final_offsets = []
+    for offsets in sen_offsets:
+        start, end = offsets
+        if start > 0  and  not re.search(r'\S', doc[start].text, flags=re.I):
+            prev_start, prev_end = final_offsets[-1]
+            final_offsets[-1] = [prev_start, prev_end+1]
+            final_offsets.append( [start+1, end] )
+        else:
+            final_offsets.append(offsets)
+    return final_offsets
+
+
+def legacy_set_sentence_starts(doc):
+    starts = set([ start for start, end in legacy_find_sentence_offsets(doc) ])
+    for token in doc[:-1]:
+        token.is_sent_start = token.i in starts
+    return doc
+
+
+def legacy_get_sentences(doc):
+    sentences     = []
+    this_sentence = set([])
+    for i, token in enumerate(doc[:-1]):
+        if token.is_sent_start:
+            if len(this_sentence) > 0:
+                sentences.append( doc[min(this_sentence):max(this_sentence)] )
+            this_sentence = set([i])
+        else:
+            this_sentence.add(i)
+    if len(this_sentence) > 0:
+        sentences.append( doc[min(this_sentence):max(this_sentence)] )
+    return sentences
+
+
+################################################################################
+# FUNCTIONS
+
+def best_of(repeat, func, *args):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = func(*args)
+        t = time.perf_counter() - t0
+        best = t if best is None else min(best, t)
+    return best, out
+
+
+def spans(sentences):
+    return [ (sen.start, sen.end) for sen in sentences ]
+
+
+################################################################################
+# MAIN
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Array-based vs per-token sentence boundary pass")
+    parser.add_argument('--sentences', help='Approximate number of sentences in the test document', type=int, default=20000)
+    parser.add_argument('--repeat',    help='Timing repetitions (best is reported)', type=int, default=3)
+    args = parser.parse_args()
+
+    from gmutils import nlp
+    text = '  \n'.join( SAMPLE[i % len(SAMPLE)] for i in range(args.sentences // 2) )
+    doc  = nlp.process(text, 'sentences')
+    print("document: %d tokens, %d sentences"% (len(doc), len(nlp.find_sentence_offsets(doc))))
+
+    t_old, old = best_of(args.repeat, legacy_find_sentence_offsets, doc)
+    t_new, new = best_of(args.repeat, nlp.find_sentence_offsets, doc)
+    print("find_sentence_offsets   legacy %8.4fs   arrays %8.4fs   %6.1fx   same: %s"% (t_old, t_new, t_old / t_new, old == new))
+
+    t_old, old = best_of(args.repeat, legacy_get_sentences, doc)
+    t_new, new = best_of(args.repeat, nlp.get_sentences, doc)
+    print("get_sentences           legacy %8.4fs   arrays %8.4fs   %6.1fx   same: %s"% (t_old, t_new, t_old / t_new, spans(old) == spans(new)))
+
+    a = nlp.process(text, 'tokenize')
+    b = nlp.process(text, 'tokenize')
+    nlp.profile_pipeline().get_pipe('sentencizer')(a)
+    nlp.profile_pipeline().get_pipe('sentencizer')(b)
+    t_old, _ = best_of(1, legacy_set_sentence_starts, a)
+    t_new, _ = best_of(1, nlp.set_sentence_starts, b)
+    same = all( x.is_sent_start == y.is_sent_start for x, y in zip(a, b) )
+    print("set_sentence_starts     legacy %8.4fs   arrays %8.4fs   %6.1fx   same: %s"% (t_old, t_new, t_old / t_new, same))
+
+
+################################################################################
+################################################################################
@@ -0,0 +1,111 @@
+""" spacy_pipeline.py
+
+    Benchmark:  per-document cost of nlp.generate_spacy_data() with one shared spaCy pipeline (the default) versus the older two-model
+    setup (GM_TWO_MODELS=1).  Each setup runs in its own interpreter, so that model loading and peak memory are measured separately.
+
+    Usage:
+
+        python benchmarks/spacy_pipeline.py [--file corpus.txt] [--num 200]
+
+"""
+import os, sys, re
+import json
+import time
+import argparse
+import resource
+import subprocess
+
+################################################################################
+# CONFIG
+
+SAMPLE = [
+    "Apple is looking at buying a U.K. startup for $1 billion.  The deal was first reported by Bloomberg on Tuesday.",
+    "Dr. Smith went to Washington.  She met with Senator Jones (D-NY) about the new bill, which passed 52-48.",
+    "San Francisco considers banning sidewalk delivery robots.  Critics say the robots block pedestrians and wheelchairs.",
+    "The quick brown fox jumps over the lazy dog.  Then it ran away into the woods near Lake Tahoe, Nevada.",
+]
+
+################################################################################
+# FUNCTIONS
+
+def load_texts(file, num):
+    """
+    Up to <num> non-empty lines of <file>, or the built-in sample texts repeated
+    """
+    texts = []
+    if file:
+        with open(file) as FH:
+            for line in FH:
+                line = line.strip()
+                if line:
+                    texts.append(line)
+                if len(texts) >= num:
+                    break
+    else:
+        while len(texts) < num:
+            texts.extend(SAMPLE)
+    return texts[:num]
+
+
+def measure(texts):
+    """
+    Run in a child process:  load the models, then time generate_spacy_data() over <texts>
+    """
+    t0 = time.perf_counter()
+    from gmutils import nlp
+    t1 = time.perf_counter()
+
+    nlp.generate_spacy_data(texts[0])                  # Warm up
+    t2 = time.perf_counter()
+    for text in texts:
+        nlp.generate_spacy_data(text)
+    t3 = time.perf_counter()
+
+    return { 'load_seconds':t1 - t0, 'ms_per_doc':1000. * (t3 - t2) / len(texts),
+             'max_rss_mb':resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024., 'shared':nlp.spacy_ner is nlp.spacy_parsing }
+
+
+def run_setup(two_models, args):
+    env = dict(os.environ)
+    env.pop('GM_TWO_MODELS', None)
+    if two_models:
+        env['GM_TWO_MODELS'] = '1'
+    cmd = [ sys.executable, os.path.abspath(__file__), '--child', '--num', str(args.num) ]
+    if args.file:
+        cmd.extend(['--file', os.path.abspath(args.file)])
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    proc = subprocess.run(cmd, cwd=root, env=env, stdout=subprocess.PIPE)
+    if proc.returncode != 0:
+        return None
+    return json.loads(proc.stdout.decode('utf-8').strip().split('\n')[-1])
+
+
+################################################################################
+# MAIN
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="One versus two spaCy pipelines in generate_spacy_data")
+    parser.add_argument('--file',   help='Text file, one document per line (default: built-in samples)', type=str)
+    parser.add_argument('--num',    help='Number of documents', type=int, default=200)
+    parser.add_argument('--child',  help=argparse.SUPPRESS, action='store_true')
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(load_texts(args.file, args.num))))
+        sys.exit(0)
+
+    results = {}
+    for name, two_models in [('one shared pipeline', False), ('two models (GM_TWO_MODELS=1)', True)]:
+        results[name] = result = run_setup(two_models, args)
+        if result is None:
+            print("%-30s  FAILED"% name)
+            continue
+        print("%-30s  %8.2f ms/doc   load %6.1fs   peak RSS %8.0f MB"% (name, result['ms_per_doc'], result['load_seconds'], result['max_rss_mb']))
+
+    one, two = results.get('one shared pipeline'), results.get('two models (GM_TWO_MODELS=1)')
+    if one and two:
+        print("speedup per document: %.2fx"% (two['ms_per_doc'] / one['ms_per_doc']))
+
+
+################################################################################
+################################################################################
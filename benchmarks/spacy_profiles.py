@@ -0,0 +1,60 @@
+""" spacy_profiles.py
+
+    Benchmark:  throughput of each pipeline profile in nlp.py (tokenize, tag, parse, full) over the same texts, and a check that the
+    'tag' profile gives the same lemmas as the full pipeline.
+
+    Usage:
+
+        python benchmarks/spacy_profiles.py [--file corpus.txt] [--num 500] [--batch_size 64]
+
+"""
+import os, sys, re
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from spacy_pipeline import load_texts
+
+################################################################################
+# FUNCTIONS
+
+def time_profile(nlp, profile, texts, batch_size):
+    """
+    Returns
+    -------
+    (seconds, list of spaCy Doc)
+
+    """
+    list(nlp.process_batch(texts[:8], profile, batch_size))           # Warm up
+    t0 = time.perf_counter()
+    docs = list(nlp.process_batch(texts, profile, batch_size))
+    return time.perf_counter() - t0, docs
+
+
+################################################################################
+# MAIN
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Throughput of the spaCy pipeline profiles in nlp.py")
+    parser.add_argument('--file',        help='Text file, one document per line (default: built-in samples)', type=str)
+    parser.add_argument('--num',         help='Number of documents', type=int, default=500)
+    parser.add_argument('--batch_size',  help='nlp.pipe batch size', type=int, default=64)
+    args = parser.parse_args()
+
+    from gmutils import nlp
+    texts = load_texts(args.file, args.num)
+
+    results = {}
+    for profile in ['full', 'parse', 'tag', 'tokenize']:
+        seconds, docs = time_profile(nlp, profile, texts, args.batch_size)
+        results[profile] = (seconds, docs)
+        print("%-10s  disabled: %-50s  %8.1f docs/s   %5.2fx vs full"% (profile, ','.join(nlp.profile_disable(profile)) or '-',
+                                                                         len(texts) / seconds, results['full'][0] / seconds))
+
+    same = all( a[:].lemma_ == b[:].lemma_ for a, b in zip(results['full'][1], results['tag'][1]) )
+    print("lemmas from 'tag' identical to 'full': %s"% same)
+
+
+################################################################################
+################################################################################
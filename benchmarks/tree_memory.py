@@ -0,0 +1,114 @@
+""" tree_memory.py
+
+    Benchmark:  memory held by, and time to build, the Node trees of many Documents, with the array-backed trees (TreeArrays plus
+    __slots__ Nodes) against the earlier trees of full Objects, each with its own options dict and list of children.  Both are built
+    from the same spaCy parses, and the resulting trees are checked for equality.
+
+    Usage:
+
+        python benchmarks/tree_memory.py [--file corpus.txt] [--num 2000]
+
+"""
+import os, sys, re
+import gc
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from spacy_pipeline import load_texts
+
+from gmutils.objects import Object
+from gmutils.node import token_is_prunable
+
+################################################################################
+# LEGACY IMPLEMENTATION (for comparison)
+
+class LegacyNode(Object):
+    """
+    The Node trees as they were built before TreeArrays
+    """
+    def __init__(self, doc, spacy_token, parent=None, options={}):
+        self.set_options(options)
+        self.is_dead = False
+        self.doc = doc
+        self.tokens = [ token for token in [spacy_token] if re.search(r'\S', token.text) ]
+        self.parent = parent
+        self.children = []
+        for token in self.tokens:
+            for i, child in enumerate(list(token.children)):
+                if token_is_prunable(child):
+                    continue
+                options['ID'] = self.get('ID') + '.' + str(i)
+                node = LegacyNode(self.doc, child, parent=self, options=options)
+                if len(node.tokens) > 0:
+                    self.children.append(node)
+
+
+def legacy_trees(spacy_doc):
+    return [ LegacyNode(spacy_doc, sen.root, options={'ID':'root.T'+str(i)}) for i, sen in enumerate(spacy_doc.sents) ]
+
+
+################################################################################
+# FUNCTIONS
+
+def shape(node):
+    """
+    Comparable nested form of a tree
+    """
+    return ( node.get('ID'), tuple( token.i for token in node.tokens ), tuple( shape(child) for child in node.children ) )
+
+
+def measure(func, items):
+    """
+    Run <func> over <items>, keeping every result alive.  Returns the results, seconds taken, and bytes allocated (net).
+    """
+    gc.collect()
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    out = [ func(item) for item in items ]
+    seconds = time.perf_counter() - t0
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return out, seconds, current
+
+
+################################################################################
+# MAIN
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Array-backed vs Object-based Node trees: memory and construction time")
+    parser.add_argument('--file', help='Text file, one document per line (default: built-in samples)', type=str, required=False)
+    parser.add_argument('--num',  help='Number of documents', type=int, default=2000)
+    args = parser.parse_args()
+
+    from gmutils.nlp import generate_spacy_data_batch
+    from gmutils.document import Document
+
+    texts  = load_texts(args.file, args.num)
+    parsed = list(generate_spacy_data_batch(texts))
+    print("%d documents, %d tokens"% (len(parsed), sum( len(spacy_doc) for spacy_doc, ner, vocab in parsed )))
+
+    def new_trees(data):
+        doc = Document.__new__(Document)
+        doc.set_options({})
+        doc.set_spacy_data(*data)
+        return doc
+
+    old, t_old, m_old = measure(lambda data: legacy_trees(data[0]), parsed)
+    new, t_new, m_new = measure(new_trees, parsed)
+    num_nodes = sum( len(tree.get_nodes()) for doc in new for tree in doc.trees )
+
+    slotted = not any( hasattr(node, '__dict__') for doc in new for tree in doc.trees for node in tree.get_nodes() )
+    assert slotted, "Nodes have a per-instance __dict__ (a base class without __slots__?)"
+
+    same = all( [ shape(tree) for tree in a ] == [ shape(tree) for tree in b.trees ] for a, b in zip(old, new) )
+    print("nodes: %d   same trees: %s"% (num_nodes, same))
+    print("build time   legacy %8.3fs   arrays %8.3fs   %6.2fx"% (t_old, t_new, t_old / t_new))
+    print("memory       legacy %8.1fMB  arrays %8.1fMB  %6.2fx   (%d vs %d bytes/node)"% (m_old / 1e6, m_new / 1e6, float(m_old) / m_new,
+                                                                                          m_old // max(num_nodes, 1), m_new // max(num_nodes, 1)))
+
+
+################################################################################
+################################################################################
@@ -1,56 +1,85 @@
+""" gmutils
+
+    Only the core utilities are imported eagerly.  Everything else (TensorFlow, spaCy, Elasticsearch, MongoDB, Kinesis, sklearn models)
+    is exported lazily (PEP 562):  a submodule is imported the first time one of its names is accessed, e.g.
+
+        import gmutils
+        gmutils.normalize(text)            # cheap
+        from gmutils import Document       # spaCy and en_core_web_lg load here
+
+    Set GM_EAGER_IMPORT=1 to import everything up front, as older versions did.
+
+"""
 import sys, os
+import importlib
 verbose = False
 
 if verbose:  sys.stderr.write("\tLoading utils ...\n")
-from .utils import err, argparser, argparser_ml, serialize, deserialize, set_missing_attributes, isTrue, read_file, iter_file, read_dir, generate_file_iterator, monitor_setup, monitor, read_conceptnet_vectorfile, cosine_similarity, binary_distance, mkdirs, json_dump_gz, json_load_gz, deepcopy_list, deepcopy_dict, file_exists, dir_exists, file_timestamp, concat_from_list_of_dicts, binary_F1
+from .utils import err, argparser, argparser_ml, serialize, deserialize, set_missing_attributes, isTrue, read_file, iter_file, iter_file_chunks, read_dir, generate_file_iterator, monitor_setup, monitor, read_conceptnet_vectorfile, cosine_similarity, binary_distance, mkdirs, json_dump_gz, json_load_gz, deepcopy_list, deepcopy_dict, file_exists, dir_exists, file_timestamp, concat_from_list_of_dicts, binary_F1
 
 if verbose:  sys.stderr.write("\tLoading normalize ...\n")
-from .normalize import normalize, ascii_fold, simplify_for_distance
+from .normalize import normalize, ascii_fold, simplify_for_distance    # Eager: the function 'normalize' shadows its submodule
+
+from .line_index import LineIndex
+from .progress import Monitor
+
+################################################################################
+# LAZY EXPORTS
 
-try:
-    if verbose:  sys.stderr.write("\tLoading Elasticsearch ...\n")
-    from .elastic_utils import list_indices, index_dicts, index_dict, index_text_with_synonyms, match_all, match_search, prefix_search, wildcard_search, synonym_search
-except Exception as e:
-    err([], {'exception':e, 'level':0})
+_lazy = {
+    'elastic_utils'     : ['list_indices', 'index_dicts', 'index_dict', 'index_text_with_synonyms', 'match_all', 'match_search', 'prefix_search', 'wildcard_search', 'synonym_search'],
+    'kinesis_utils'     : ['KinesisStream'],
+    'mongo_utils'       : ['mongo_iterator', 'mongo_find_one', 'mongo_count'],
+    'nlp'               : ['generate_spacy_data', 'spacy_ner', 'spacy_parsing'],
+    'document'          : ['Document'],
+    'node'              : ['get_group_ancestor'],
+    'dataset'           : ['Dataset'],
+    'model'             : ['Model'],
+    'sklearn_model'     : ['SklearnModel'],
+    'objects'           : ['Object', 'Options'],
+    'lexical'           : ['damerauLevenshtein'],
+    'tensorflow_layer'  : ['TensorflowLayer'],
+    'tensorflow_graph'  : ['TensorflowGraph'],
+    'tensorflow_model'  : ['TensorflowModel'],
+}
 
-try:
-    from .kinesis_utils import KinesisStream
-except Exception as e: err([], {'exception':e, 'level':0})
+_nlp_modules = set(['nlp', 'document', 'node'])       # Not exported when GM_NO_NLP is set
 
-try:
-    from .mongo_utils import mongo_iterator, mongo_find_one, mongo_count
-except Exception as e: err([], {'exception':e, 'level':0})
+_exports = { name:module for module, names in _lazy.items() for name in names }
 
-try:
-    if not os.environ.get('GM_NO_NLP'):
-        if verbose:  sys.stderr.write("\tLoading spacy ...")
-        from .nlp import generate_spacy_data, spacy_ner, spacy_parsing
-        
-        if verbose:  sys.stderr.write("\tLoading Document ...\n")
-        from .document import Document
 
-        if verbose:  sys.stderr.write("\tLoading Node ...\n")
-        from .node import get_group_ancestor
-except Exception as e: err([], {'exception':e, 'level':0})
+def __getattr__(name):
+    """
+    Import the submodule that provides <name> on first access, and cache the result in this package's namespace.  If the submodule
+    fails to import, raise ImportError from the original exception.
+    """
+    module = _exports.get(name)
+    if module is None  or  (module in _nlp_modules  and  os.environ.get('GM_NO_NLP')):
+        raise AttributeError("module '%s' has no attribute '%s'"% (__name__, name))
 
-if verbose:  sys.stderr.write("\tLoading Dataset ...\n")
-from .dataset import Dataset
+    if verbose:  sys.stderr.write("\tLoading %s ...\n"% module)
+    try:
+        submodule = importlib.import_module('.' + module, __name__)
+    except Exception as e:
+        # Not left as an AttributeError (or anything else), which 'from gmutils import ...' and hasattr() would hide
+        raise ImportError("gmutils.%s could not be imported (needed for '%s')"% (module, name)) from e
+    val = getattr(submodule, name)
+    globals()[name] = val
+    return val
 
-if verbose:  sys.stderr.write("\tLoading Model ...\n")
-from .model import Model
 
-if verbose:  sys.stderr.write("\tLoading SklearnModel ...\n")
-from .sklearn_model import SklearnModel
+def __dir__():
+    return sorted( set(globals().keys()) | set(_exports.keys()) )
 
-from .objects import Object, Options
 
-from .lexical import damerauLevenshtein
+if os.environ.get('GM_EAGER_IMPORT'):
+    for _module, _names in _lazy.items():
+        try:
+            for _name in _names:
+                __getattr__(_name)
+        except Exception as e:
+            err([], {'exception':e, 'level':0})
 
-try:
-    if verbose:  sys.stderr.write("\tLoading TensorFlow ...\n")
-    from .tensorflow_layer import TensorflowLayer
-    from .tensorflow_graph import TensorflowGraph
-    from .tensorflow_model import TensorflowModel
-except Exception as e:
-    err([], {'exception':e, 'level':0})
 
+################################################################################
+################################################################################
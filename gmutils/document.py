@@ -10,12 +10,17 @@ import numpy as np
 import pandas as pd
 from spacy.matcher import Matcher
 from spacy.matcher import PhraseMatcher
+from spacy.attrs import IDX, LENGTH
 
-from gmutils.utils import err, argparser, deserialize, read_file, read_conceptnet_vectorfile, start_with_same_word, cosine_similarity, deepcopy_list
+from gmutils import log
+from gmutils.utils import err, argparser, isTrue, deserialize, read_file, read_conceptnet_vectorfile, start_with_same_word, cosine_similarity, deepcopy_list
 from gmutils.normalize import normalize, clean_spaces, ascii_fold, ends_with_punctuation, close_enough, simplify_for_distance, naked_words
-from gmutils.nlp import generate_spacy_data, tokenize, get_sentences
-from gmutils.objects import Object
-from gmutils.node import Node, iprint
+from gmutils.nlp import generate_spacy_data, generate_spacy_data_batch, tokenize, get_sentences
+from gmutils.objects import Object, memoized
+from gmutils.node import Node, iprint, build_trees, role_vectors, CHECK_TREES
+from gmutils.tree_index import TreeIndex
+from gmutils.embedding_resolver import EmbeddingResolver
+from gmutils.rewrite import RewriteEngine, Rule, RULES, PREPROCESS, verbs_preps_rule, add_stats, format_stats
 
 ################################################################################
 
@@ -35,6 +40,22 @@ class Document(Object):
     trees : array of Node
         Each of these Node objects represents the root of a parse tree
 
+    tree_arrays : TreeArrays
+        The shape of the trees, and which Node holds each token (see tree_arrays.py)
+
+    tree_version : int
+        Incremented by every change to the shape of the trees (see get_tree_index)
+
+    rewrite_stats : dict { rule name -> dict }
+        Counts and time taken for each rewrite rule applied to the trees so far (see rewrite.py)
+
+    embeddings : numpy array, one row per Node (see embed)
+
+    embedded_nodes : array of Node, in the order of the rows of self.embeddings
+
+    resolver : EmbeddingResolver
+        Used by the last call to embed() (see get_resolver)
+
     vocab : spacy Vocabulary
 
     """
@@ -63,13 +84,60 @@ class Document(Object):
             text = normalize(text, options=options)
 
         try:
-            self.spacy_doc, self.ner, self.vocab = generate_spacy_data(text)    # Parse with spacy, get NER
-            self.generate_trees()                                               # Generate Node trees representing sentences
+            self.set_spacy_data(*generate_spacy_data(text))                     # Parse with spacy, get NER
         except:
             raise
 
         if verbose:
             self.print_sentences()
+
+
+    @classmethod
+    def from_texts(cls, texts, batch_size=64, n_process=1, options={}):
+        """
+        Instantiate many Documents at once.  The texts are streamed through spaCy's nlp.pipe, so that parsing is batched and (with
+        <n_process> > 1) spread over worker processes.  Node trees hold references to spaCy tokens, which cannot be sent between
+        processes, so each tree is built here as its parse arrives.
+
+        Parameters
+        ----------
+        texts : iterable of str
+
+        batch_size : int
+
+        n_process : int
+
+        options : dict or namespace
+            Passed to each Document
+
+        Returns
+        -------
+        generator of Document, in input order
+
+        """
+        if isTrue(options, 'normalize'):
+            texts = ( normalize(text, options=options) for text in texts )
+
+        for spacy_doc, ner, vocab in generate_spacy_data_batch(texts, batch_size=batch_size, n_process=n_process):
+            doc = cls.__new__(cls)
+            doc.set_options(options)
+            doc.set_spacy_data(spacy_doc, ner, vocab)
+            yield doc
+
+
+    def set_spacy_data(self, spacy_doc, ner, vocab):
+        """
+        Take on the output of generate_spacy_data() and build the Node trees
+
+        """
+        self.spacy_doc, self.ner, self.vocab = spacy_doc, ner, vocab
+        self.token_offsets  = None                                              # Built on first use (see get_token_offsets)
+        self.word_index     = None                                              # Built on first use (see get_word_index)
+        self.rewrite_stats  = {}
+        self.embeddings     = None                                              # Set by embed()
+        self.embedded_nodes = None
+        self.resolver       = None                                              # Set by embed()
+        self.generate_trees()                                                   # Generate Node trees representing sentences
         
             
     def __repr__(self):
@@ -148,10 +216,9 @@ class Document(Object):
 
         """
         verbose = False
-        self.trees = []     # array of Node
-        spacy_sentences = self.spacy_doc.sents
-        for i, sen in enumerate(spacy_sentences):
-            self.trees.append(Node(self, sen.root, options={'ID':'root.T'+str(i)}))
+        self.tree_version = 0
+        self.tree_index   = None
+        self.trees = build_trees(self)      # array of Node.  Also sets self.tree_arrays, which Node operations then keep up to date
             
 
     def analyze_trees(self):
@@ -162,11 +229,112 @@ class Document(Object):
             tree.analyze()
         
 
+    def set_token_owner(self, tokens, node):
+        """
+        Record <node> as the owner of each of <tokens> in the token index
+        """
+        owner = self.tree_arrays.owner
+        for token in tokens:
+            owner[token.i] = node.i
+        if self.tree_arrays.touched is not None:
+            self.tree_arrays.touched.add(node.i)
+
+
+    def release_tokens(self, node):
+        """
+        Remove <node> (about to be killed) from the token index, for any tokens it still owns
+        """
+        if node.tokens is None:
+            return
+        owner = self.tree_arrays.owner
+        for token in node.tokens:
+            if owner[token.i] == node.i:
+                owner[token.i] = -1
+        if self.tree_arrays.touched is not None:
+            self.tree_arrays.touched.add(node.i)
+
+
+    def get_node_of_token(self, token):
+        """
+        The Node owning <token>, in any tree, or None (e.g. pruned punctuation)
+        """
+        i = self.tree_arrays.owner[token.i]
+        if i < 0:
+            return None
+        return self.tree_arrays.nodes[i]
+
+
+    def check_token_index(self):
+        """
+        For debugging:  verify the token index against a full traversal of the trees.  Each token held by a live Node must be indexed
+        to that Node (and no other), and the index must hold nothing else.
+
+        Returns
+        -------
+        True, or raises ValueError
+
+        """
+        expected = [ None for token in self.spacy_doc ]
+        problems = []
+        stack = list(self.trees)
+        while stack:
+            node = stack.pop()
+            if node.is_dead:
+                problems.append("Dead Node in a tree: %s"% node.get('ID'))
+                continue
+            for token in node.tokens:
+                if expected[token.i] is not None:
+                    problems.append("Token %d held by two Nodes: [%s] and [%s]"% (token.i, expected[token.i], node))
+                expected[token.i] = node
+            stack.extend(node.children)
+
+        for i, node in enumerate(expected):
+            indexed = self.get_node_of_token(self.spacy_doc[i])
+            if node is not indexed:
+                problems.append("Token %d held by [%s] but indexed to [%s]"% (i, node, indexed))
+
+        if len(problems) > 0:
+            err([], {'ex':"Token index is inconsistent:\n\t" + "\n\t".join(problems)})
+        return True
+
+
+    def tree_changed(self):
+        """
+        Called by every operation that changes the shape of the trees, or the tokens of a Node.  Invalidates the TreeIndex, and results
+        memoized on tree_version.
+        """
+        self.tree_version = getattr(self, 'tree_version', 0) + 1
+
+
+    def get_tree_index(self):
+        """
+        The TreeIndex of the current trees (for ancestry, LCA and distance queries), rebuilt if the trees have changed since it was
+        last built
+
+        """
+        index = self.current_tree_index()
+        if index is None:
+            index = TreeIndex(self.trees)
+            self.tree_index = (getattr(self, 'tree_version', 0), index)
+        return index
+
+
+    def current_tree_index(self):
+        """
+        The TreeIndex if it is up to date, else None (without rebuilding it)
+        """
+        cached = getattr(self, 'tree_index', None)
+        if cached is not None  and  cached[0] == getattr(self, 'tree_version', 0):
+            return cached[1]
+        return None
+
+
     def disown(self, node):
         """
         Remove <node> from self.trees
         """
         self.trees.remove(node)
+        self.tree_changed()
         
 
     def adopt(self, node):
@@ -174,6 +342,7 @@ class Document(Object):
         Add <node> to self.trees
         """
         self.trees.append(node)
+        self.tree_changed()
         
 
     def get_head_verb_nodes(self):
@@ -275,30 +444,56 @@ class Document(Object):
             print(token, iob)
             
 
+    def rewrite(self, rules, options={}):
+        """
+        Apply rewrite rules to the trees, one after the other, each until nothing more changes (see rewrite.py)
+
+        Parameters
+        ----------
+        rules : array of Rule, or of str (names in rewrite.RULES)
+
+        Options
+        -------
+        max_visits : int
+            See RewriteEngine
+
+        Returns
+        -------
+        bool : whether anything was altered
+
+        """
+        engine  = RewriteEngine(self, options=options)
+        altered = False
+        for rule in rules:
+            if not isinstance(rule, Rule):
+                rule = RULES[rule]
+            if engine.run(rule):
+                altered = True
+            if CHECK_TREES:  self.check_token_index()
+
+        add_stats(self.rewrite_stats, engine.stats)
+        return altered
+
+
+    def print_rewrite_stats(self):
+        """
+        Print the counts and time taken for each rewrite rule, most costly first
+        """
+        print(format_stats(self.rewrite_stats))
+
+
     def agglomerate_entities(self):
         """
         For the purpose of dealing sensibly with extracted entities, agglomerate tokens from a single entity into a node
         """
-        altered = True
-        while altered:
-            altered = False
-            for tree in self.trees:
-                for node in tree.get_entity_beginners():
-                    a = node.agglomerate_entities()
-                    if a:  altered = a  # only switch if going to True
+        return self.rewrite(['entities'])
         
 
     def agglomerate_idioms(self):
         """
         For the purpose of dealing sensibly with extracted meaning, agglomerate tokens from a single idiom into a node
         """
-        altered = True
-        while altered:
-            altered = False
-            for tree in self.trees:
-                for node in tree.get_idiom_parents():
-                    a = node.agglomerate_idiom()
-                    if a:  altered = a  # only switch if going to True
+        return self.rewrite(['idioms'])
         
 
     def agglomerate_verbs_preps(self, vocab=None):
@@ -310,13 +505,7 @@ class Document(Object):
         When an embedding (vocab) is provided, it will be consulted for the best embedding before agglomeration.
 
         """
-        altered = True
-        while altered:
-            altered = False
-            for tree in self.trees:
-                for node in tree.get_verbs():
-                    a = node.agglomerate_verbs_preps(vocab=vocab)
-                    if a:  altered = a  # only switch if going to True
+        return self.rewrite([verbs_preps_rule(vocab=vocab)])
         
 
     def agglomerate_compound_adj(self, vocab=None):
@@ -326,52 +515,28 @@ class Document(Object):
         When an embedding (vocab) is provided, it will be consulted before agglomeration for the best embedding.
 
         """
-        altered = True
-        while altered:
-            altered = False
-            for tree in self.trees:
-                for node in tree.get_compound_prefixes():
-                    a = node.agglomerate_compound_adj()   #  vocab=vocab)  No vocab for now!
-                    if a:  altered = a  # only switch if going to True
+        return self.rewrite(['compound_adj'])     #  vocab=vocab)  No vocab for now!
 
 
     def agglomerate_modifiers(self):
         """
         For the purpose of tree simplification (lower branching factor), absorb childless modifiers into their parents
         """
-        altered = True
-        while altered:
-            altered = False
-            for tree in self.trees:
-                for node in tree.get_modifiers():
-                    a = node.agglomerate_modifier()
-                    if a:  altered = a  # only switch if going to True
+        return self.rewrite(['modifiers'])
 
 
     def agglomerate_twins(self):
         """
         For the purpose of tree simplification (lower branching factor), absorb childless modifiers into their parents
         """
-        altered = True
-        while altered:
-            altered = False
-            for tree in self.trees:
-                for node in tree.get_parents_of_twins():
-                    a = node.agglomerate_twins()
-                    if a:  altered = a  # only switch if going to True
+        return self.rewrite(['twins'])
 
 
     def agglomerate_verbauxes(self):
         """
         For the purpose of tree simplification (lower branching factor), absorb verb auxilaries
         """
-        altered = True
-        while altered:
-            altered = False
-            for tree in self.trees:
-                for node in tree.get_verbs():
-                    a = node.agglomerate_verbaux()
-                    if a:  altered = a  # only switch if going to True
+        return self.rewrite(['verbauxes'])
 
 
     def delegate_to_conjunctions(self):
@@ -379,43 +544,123 @@ class Document(Object):
         For the purpose of tree simplification (lower branching factor), and logical faithfulness, take conjunction arguments and bring them in under
         the conjunction node.
         """
-        verbose = False
-        altered = True
-        while altered:
-            altered = False
-            if verbose:  err([altered])
-            for tree in self.trees:
-                for node in tree.get_conjunctions():
-                    if verbose:  err([tree, "calling:", node])
-                    a = node.delegate_to_conjunction()
-                    if a:  altered = a  # only switch if going to True
-                if verbose:  err([tree, altered])
+        return self.rewrite(['conjunctions'])
 
 
     def delegate_to_negations(self):
         """
         For the purpose of logical faithfulness, delegate the subject of a negation under it.
         """
-        altered = True
-        while altered:
-            altered = False
-            for tree in self.trees:
-                for node in tree.get_negations():
-                    a = node.delegate_to_negation()
-                    if a:  altered = a  # only switch if going to True
+        return self.rewrite(['negations'])
+
+
+    def get_resolver(self, vocab, resolver=None):
+        """
+        The EmbeddingResolver to embed Nodes of this Document with <vocab>:  <resolver> if given (e.g. one shared by many Documents),
+        else the one this Document used last if it was for the same vocab, else a new one.  It is kept as self.resolver, so that it is
+        released along with this Document.
+
+        """
+        if resolver is not None:
+            if resolver.vocab is not vocab:
+                err([], {'ex':"EmbeddingResolver is for a different vocab"})
+            self.resolver = resolver
+        elif self.resolver is None  or  self.resolver.vocab is not vocab:
+            self.resolver = EmbeddingResolver(vocab)
+        return self.resolver
 
 
-    def embed(self, vocab):
+    def embed(self, vocab, resolver=None):
         """
-        Use a given vocab to embed each node in some vector space
+        Use a given vocab to embed each node in some vector space.  All Nodes are looked up together (see embedding_resolver.py), and
+        their embeddings are the rows of self.embeddings, in the order of self.embedded_nodes (pre-order, tree after tree).  Each
+        node.embedding is a view of its row.
+
+        Parameters
+        ----------
+        vocab : dict { lemma string -> vector }
+
+        resolver : EmbeddingResolver (optional)
+            For <vocab>, to share lookups with other Documents (see get_resolver)
+
         """
-        for tree in self.trees:
-            tree.embed(vocab)
+        arrays = self.tree_arrays
+        self.embedded_nodes = [ arrays.nodes[i] for i in arrays.pre_order([ tree.i for tree in self.trees ]) ]
+        self.embeddings     = self.get_resolver(vocab, resolver).embed(self.embedded_nodes)
                         
 
+    def vectorize(self, vocab=None, resolver=None):
+        """
+        All Nodes of all trees as one feature matrix, with the shape of the trees as arrays of row numbers:  a compact alternative to
+        get_embedding() and get_trinary_embedding() that can be fed to a model, or saved with numpy.savez(file, **arrays).
+
+        Each row is what Node.get_vector() gives:  the role vector, then the embedding.  Rows are in pre-order, tree after tree, so
+        that each subtree is a contiguous block of rows.
+
+        Parameters
+        ----------
+        vocab : dict { lemma string -> vector }
+            If given, the Nodes are embedded (again) first.  Otherwise they must already have been (see preprocess, embed).
+
+        resolver : EmbeddingResolver (optional)
+            For <vocab> (see embed)
+
+        Returns
+        -------
+        dict of numpy arrays, with (for n Nodes):
+            vectors      : (n, width) float32
+            parent       : (n,) int32, row of the parent (-1 for roots)
+            first_child  : (n,) int32, row of the first child (-1 for leaves)
+            next_sibling : (n,) int32, row of the next sibling (-1 for the last child, and for roots)
+            roots        : (number of trees,) int32, row of each root
+            ID           : (n,) str, ID of each Node
+
+        """
+        if vocab is not None:
+            self.embed(vocab, resolver)
+
+        arrays = self.tree_arrays
+        order  = np.array(arrays.pre_order([ tree.i for tree in self.trees ]), dtype=np.int64)
+        nodes  = [ arrays.nodes[i] for i in order ]
+        n      = len(nodes)
+
+        # Embeddings:  the matrix from embed(), if it is still for these Nodes in this order, and no Node has been embedded again since
+        # (each node.embedding still a view of its row)
+        embedded = self.embedded_nodes
+        if embedded is not None  and  len(embedded) == n  and  all( a is b for a, b in zip(embedded, nodes) )  and \
+           all( node.embedding is not None  and  node.embedding.base is self.embeddings for node in nodes ):
+            embeddings = self.embeddings
+        elif any( node.embedding is None for node in nodes ):
+            err([], {'ex':"Nodes must be embedded before vectorizing (see embed)"})
+        elif n > 0:
+            embeddings = np.stack([ node.embedding for node in nodes ])
+        else:
+            embeddings = np.zeros((0, 0))
+
+        roles   = role_vectors(nodes)
+        width   = roles.shape[1]
+        vectors = np.empty((n, width + embeddings.shape[1]), dtype=np.float32)
+        vectors[:, :width] = roles
+        vectors[:, width:] = embeddings
+
+        # Links between nodes (node numbers) -> links between rows
+        row = np.full(len(arrays) + 1, -1, dtype=np.int32)          # row[-1] stays -1, for "none"
+        row[order] = np.arange(n, dtype=np.int32)
+
+        return {
+            'vectors'      : vectors,
+            'parent'       : row[ arrays.parent[order] ],
+            'first_child'  : row[ arrays.first_child[order] ],
+            'next_sibling' : row[ arrays.next_sibling[order] ],
+            'roots'        : row[ np.array([ tree.i for tree in self.trees ], dtype=np.int64) ],
+            'ID'           : np.array([ str(node.get('ID')) for node in nodes ], dtype=str),
+        }
+
+
     def get_embedding(self, options={}):
         """
-        After a given embedding (vocab) has already been used to vectorize each node, use this method to compile it together.
+        After a given embedding (vocab) has already been used to vectorize each node, use this method to compile it together.  (For
+        all Nodes as one matrix instead of nested dicts, see vectorize.)
 
         Options
         -------
@@ -437,7 +682,7 @@ class Document(Object):
     def get_trinary_embedding(self, options={}):
         """
         After a given embedding (vocab) has already been used to vectorize each node, use this method to compile it together with reverse in-order
-        traversal, connecting each node to firstborn child and next sibling only.
+        traversal, connecting each node to firstborn child and next sibling only.  (vectorize() gives the same links as arrays.)
 
         Returns
         -------
@@ -474,7 +719,7 @@ class Document(Object):
                 return node
 
         
-    def preprocess(self, vocab):
+    def preprocess(self, vocab, resolver=None):
         """
         Collapse the parse tree to a more simplified format where sensible,  Identify the verb nodes and find their theta roles
 
@@ -482,29 +727,17 @@ class Document(Object):
         ----------
         vocab : dict { lemma string -> vector }
 
+        resolver : EmbeddingResolver (optional)
+            For <vocab> (see embed)
+
         """
         verbose = False
         # self.agglomerate_verbs_preps(vocab)
-        if verbose:  err()
-        self.agglomerate_compound_adj(vocab)
-        if verbose:  err()
-        self.agglomerate_entities()
-        if verbose:  err()
-        self.delegate_to_negations()
-        if verbose:  err()
-        self.agglomerate_modifiers()
-        if verbose:  err()
-        self.agglomerate_twins()
-        if verbose:  err()
-        self.agglomerate_verbauxes()
-        if verbose:  err()
-        self.delegate_to_conjunctions()
-        if verbose:  err()
-        self.agglomerate_idioms()
-        if verbose:  err()
+        self.rewrite(PREPROCESS)                  # Agglomerations and delegations, in order (see rewrite.py)
+        if verbose:  self.print_rewrite_stats()
             
         # self.analyze_trees()                    # For debugging
-        self.embed(vocab)
+        self.embed(vocab, resolver)
         if verbose:  err()
 
         
@@ -541,18 +774,33 @@ class Document(Object):
             node.print_semantic_roles()
 
 
+    def get_token_offsets(self):
+        """
+        Start and end character offsets of every token, built once per Document.  Tokens never overlap, so both arrays are sorted, and
+        char -> token queries can be answered by binary search.
+
+        Returns
+        -------
+        pair of numpy int64 arrays
+
+        """
+        if getattr(self, 'token_offsets', None) is None:
+            offsets = self.spacy_doc.to_array([IDX, LENGTH]).astype(np.int64).reshape((-1, 2))
+            starts  = offsets[:,0]
+            self.token_offsets = (starts, starts + offsets[:,1])
+        return self.token_offsets
+
+
     def get_token_at_char_index(self, index):
         """
-        Return the token containing character index 'index'
+        Return the token containing character index 'index' (the last token starting at or before it)
 
         """
-        last_token = None
-        for token in self.spacy_doc:
-            if token.idx > index:
-                return last_token
-            last_token = token
-            
-        return last_token
+        starts, ends = self.get_token_offsets()
+        i = int(np.searchsorted(starts, index, side='right')) - 1
+        if i < 0:
+            return None
+        return self.spacy_doc[i]
         
 
     def char_span(self, start, end):
@@ -569,20 +817,49 @@ class Document(Object):
         -------
         spacy.Span
 
+        """
+        return self.char_spans([(start, end)])[0]
+
+
+    def char_spans(self, pairs):
+        """
+        Get the spans for many pairs of start/end char indices at once (e.g. every answer of a SQuAD context).  Where the offsets fall
+        exactly on token boundaries, the span is the one spaCy's Doc.char_span() gives.  Otherwise, it runs from the token containing
+        <start> through the token containing <end>.
+
+        Parameters
+        ----------
+        pairs : list of (int, int)
+
+        Returns
+        -------
+        list of spacy.Span
+
         """
         verbose = False
-        span = self.spacy_doc.char_span(start, end)
-        if span is None:
-            start_token = self.get_token_at_char_index(start)
-            end_token   = self.get_token_at_char_index(end)
-            if verbose:
-                err([start_token.i, end_token.i, end_token.text])
-            if start_token.i == end_token.i:
-                span = self.spacy_doc[start_token.i:start_token.i+1]
-            else:
-                span = self.spacy_doc[start_token.i:end_token.i+1]     # Adding 1 here very important
+        if len(pairs) == 0:
+            return []
+        starts, ends = self.get_token_offsets()
+        n = len(starts)
+        if n == 0:
+            return [ None for pair in pairs ]
+
+        pairs = np.asarray(pairs, dtype=np.int64).reshape((-1, 2))
+        start, end = pairs[:,0], pairs[:,1]
+
+        # Exact token boundaries: what spaCy's char_span() would find
+        first = np.searchsorted(starts, start, side='left')
+        last  = np.searchsorted(ends, end, side='left')
+        exact = (first < n) & (last < n)
+        exact &= (starts[np.minimum(first, n-1)] == start) & (ends[np.minimum(last, n-1)] == end) & (last + 1 >= first)
+
+        # Otherwise: the tokens containing each offset
+        first = np.where(exact, first, np.maximum(np.searchsorted(starts, start, side='right') - 1, 0))
+        last  = np.where(exact, last, np.searchsorted(starts, end, side='right') - 1)
+        if verbose:
+            err([first, last, exact])
 
-        return span
+        return [ self.spacy_doc[f:l+1] for f, l in zip(first.tolist(), last.tolist()) ]     # Adding 1 here very important
 
 
     def matching_words_from_start(self, awords, bwords):
@@ -610,50 +887,136 @@ class Document(Object):
             return []
     
     
-    def text_to_char_offsets(self, text, start_char=0):
+    def get_word_index(self):
         """
-        Search in the text of this Document for the first substring matching text
+        Index of the space-separated words of this Document, built once, for aligning answer strings with text_to_char_offsets()
+
+        Returns
+        -------
+        dict
+            'raw'        : list of str, the words as they appear in the text
+            'simple'     : list of str, each word after simplify_for_distance()
+            'starts'     : list of int, char offset of each word
+            'positions'  : dict { simplified word -> list of word positions }
+            'containing' : dict { query word -> sorted list of positions whose simplified word contains it } (filled in as queried)
+
+        """
+        if getattr(self, 'word_index', None) is None:
+            raw       = self.get_text().split(' ')
+            simple    = []
+            starts    = []
+            positions = {}
+            simplified = {}                     # Each distinct word is only simplified once
+            index = 0
+            for i, word in enumerate(raw):
+                sword = simplified.get(word)
+                if sword is None:
+                    sword = simplified[word] = simplify_for_distance(word)
+                simple.append(sword)
+                starts.append(index)
+                positions.setdefault(sword, []).append(i)
+                index += len(word) + 1
+            self.word_index = { 'raw':raw, 'simple':simple, 'starts':starts, 'positions':positions, 'containing':{} }
+        return self.word_index
+
+
+    def word_positions(self, word):
+        """
+        Positions of the Document words that contain <word> (a simplified query word), in order
+
+        """
+        index = self.get_word_index()
+        found = index['containing'].get(word)
+        if found is None:
+            found = []
+            for sword, positions in index['positions'].items():
+                if word in sword:
+                    found.extend(positions)
+            found.sort()
+            index['containing'][word] = found
+        return found
+
+
+    def find_char_offsets(self, text, start_char=0):
+        """
+        Search in the text of this Document for the first substring matching text.  Each query word (simplified) must be found within
+        the corresponding Document word (simplified), as in matching_words_from_start().
 
         Parameters
         ----------
         text : str
 
         start_char : index
+            Ignore matches starting before this offset
 
         Returns
         -------
-        pair of int
-            start/end char offsets
+        pair of int (start/end char offsets), or None if there is no match
 
         """
         verbose = False
         words   = naked_words(text)             # Words to find
-        dwords  = self.get_text().split(' ')    # Document words
+        index   = self.get_word_index()
+        simple, starts = index['simple'], index['starts']
         offsets = None
-        index   = 0
-        if verbose:  err([text, words, dwords])
-        
-        for i, dw in enumerate(dwords):
-            dw = simplify_for_distance(dw)
-            if re.search(words[0], dw, flags=re.I):
-                matched = self.matching_words_from_start(words, dwords[i:])
-                if len(matched) == len(words):
-                    matched_phrase = ' '.join(matched)
-                    end_index = index + len(matched_phrase)
-                    offsets = (index, end_index)
-                    break
-                
-            if i == 0:
-                index += len(dw)
-            else:
-                index += 1 + len(dw)
-            
+        if verbose:  err([text, words])
+
+        for i in self.word_positions(words[0]):
+            if starts[i] < start_char:
+                continue
+            if i + len(words) > len(simple):
+                break
+            if all( words[k] in simple[i+k] for k in range(1, len(words)) ):
+                matched_phrase = ' '.join(index['raw'][i:i+len(words)])
+                offsets = (starts[i], starts[i] + len(matched_phrase))
+                break
+
+        return offsets
+
+
+    def text_to_char_offsets(self, text, start_char=0):
+        """
+        Search in the text of this Document for the first substring matching text (see find_char_offsets)
+
+        Parameters
+        ----------
+        text : str
+
+        start_char : index
+            Ignore matches starting before this offset
+
+        Returns
+        -------
+        pair of int
+            start/end char offsets
+
+        """
+        offsets = self.find_char_offsets(text, start_char=start_char)
         if offsets is None:
             err([], {'ex':"No best span for [%s] in:\n%s"% (text, self.get_text())})
-                
+
         return offsets  # pair of (int, int)
 
 
+    def texts_to_char_offsets(self, texts, start_char=0):
+        """
+        Align many strings (e.g. all the answers for one SQuAD context) with this Document in one call
+
+        Parameters
+        ----------
+        texts : list of str
+
+        start_char : index
+
+        Returns
+        -------
+        list of (pair of int, or None)
+            None for each text not found (where text_to_char_offsets() would raise)
+
+        """
+        return [ self.find_char_offsets(text, start_char=start_char) for text in texts ]
+
+
     def get_nodes(self):
         """
         Return all nodes under this Document, in order of lowest token index
@@ -670,15 +1033,12 @@ class Document(Object):
         return sorted(final, key=lambda x: x.get_index())
         
 
+    @memoized(depends=lambda doc: doc.tree_version)
     def get_num_nodes(self):
         """
         Return int number of nodes in this Document
         """
-        if not self.done():
-            nodes = self.get_nodes()
-            self.set('num_nodes', len(nodes))
-
-        return self.get('num_nodes')
+        return len(self.get_nodes())
     
     
     def get_related_nodes(self, head, thresh=0.7):
@@ -787,16 +1147,13 @@ class Document(Object):
 def generate_documents(input, options={'normalize':True, 'remove_brackets':True}):
     documents = []
 
-    it = str(type(input))
-    logger.info(" >>> input type: %s\n", it)
+    log.info(" >>> input type: %s", type(input))
     
     if isinstance(input, pd.core.frame.DataFrame):
-        for index, row in input.iterrows():
-            documents.append( Document(text=row['content'], options=options) )
+        documents.extend( Document.from_texts(input['content'], options=options) )
 
     elif isinstance(input, list):
-        for text in input:
-            documents.append( Document(text=text, options=options) )
+        documents.extend( Document.from_texts(input, options=options) )
 
     else:  # Default: input is a str
         documents.append( Document(text=input, options=options) )
@@ -831,9 +1188,10 @@ if __name__ == '__main__':
             docs.append( Document(text) )
 
     elif args.str:
+        resolver = EmbeddingResolver(vocab)                 # Shared by all of these Documents
         for text in args.str:
             doc = Document(text)
-            doc.preprocess(vocab)
+            doc.preprocess(vocab, resolver)
             print("\nTEXT:", doc.get_text())
             options = { 'supporting_text':True, 'trinary':args.trinary }
             doc.pretty_print(options=options)
@@ -0,0 +1,200 @@
+""" embedding_resolver.py
+
+    Batched lookup of Node embeddings in a vocab (dict { word -> vector }).
+
+    Each Node is embedded by the first of these that the vocab can provide:
+      - its lemmas joined by underscores (e.g. "take_part", "full-time")
+      - the same without hyphens, then without underscores (only for strings without digits)
+      - the average of the vectors of its lemmas (if it has several), missing ones counting as zeros
+      - the average of the vectors of its words (token texts), likewise
+      - failing all of these, zeros
+
+    An EmbeddingResolver gathers the keys needed by a whole batch of Nodes, looks each distinct key up in the vocab once, and remembers
+    the answers (misses too) for later batches, since the same lemmas recur across Nodes and Documents.  The embeddings are written as
+    the rows of one matrix, and each Node's 'embedding' is a view of its row.
+
+    A resolver lives only as long as whoever holds it:  each Document keeps its own (see Document.embed), and a caller embedding many
+    Documents with one vocab can make a single resolver and pass it to each, so that they share what has been looked up.  What it
+    remembers (misses included) assumes the vocab doesn't change; call clear() after changing it.
+
+"""
+import os, sys, re
+import numpy as np
+
+################################################################################
+# CONFIG
+
+default = {
+    'dim'      : 300,               # Of the zero embedding, if the vocab has nothing for a whole batch
+    'max_keys' : 1000000,           # Remembered keys (hits and misses).  Beyond this, they are all forgotten.
+}
+
+################################################################################
+# FUNCTIONS
+
+def candidate_keys(lemmas_str):
+    """
+    The vocab keys to try, in order, for a Node with lemmas <lemmas_str> (space-separated)
+
+    Returns
+    -------
+    array of str
+
+    """
+    key = re.sub(r' - ', '-', lemmas_str)
+    key = re.sub(r' ', '_', key)
+    key = re.sub(r'_+', '_', key)
+    keys = [key]
+
+    if '-' in key  and  not re.search(r'\d', key):      # Remove hyphens
+        key = re.sub(r'_+', '_', key.replace('-', ''))
+        keys.append(key)
+
+    if '_' in key  and  not re.search(r'\d', key):      # Remove underscores
+        keys.append(key.replace('_', ''))
+
+    return keys
+
+
+################################################################################
+# OBJECTS
+
+class EmbeddingResolver(object):
+    """
+    Embeds batches of Nodes using one vocab, remembering each key looked up
+
+    Attributes
+    ----------
+    vocab : dict { str -> vector }
+
+    row : dict { str -> int }
+        Key -> index of its vector in self.vectors, or -1 if the vocab doesn't have it
+
+    vectors : list of vector
+
+    plans : dict { (lemmas, texts) -> (key rows, lemma rows, text rows) }
+        What has been looked up for each distinct Node content
+
+    stats : dict
+        Counts of keys looked up in the vocab (hits, misses) and of keys answered from memory (remembered)
+
+    """
+    def __init__(self, vocab, options={}):
+        """
+        Options
+        -------
+        max_keys : int
+
+        """
+        self.vocab    = vocab
+        self.max_keys = options.get('max_keys') or default['max_keys']
+        self.row      = {}
+        self.vectors  = []
+        self.plans    = {}
+        self.stats    = { 'hits':0, 'misses':0, 'remembered':0 }
+
+
+    def clear(self):
+        """
+        Forget every key looked up so far (e.g. after the vocab has changed)
+        """
+        self.row.clear()
+        self.plans.clear()
+        self.vectors = []
+
+
+    def lookup(self, key):
+        """
+        Row of <key> in self.vectors (-1 if the vocab doesn't have it), looking it up in the vocab only the first time
+        """
+        r = self.row.get(key)
+        if r is not None:
+            self.stats['remembered'] += 1
+            return r
+
+        vec = self.vocab.get(key)
+        if vec is None:
+            r = -1
+            self.stats['misses'] += 1
+        else:
+            r = len(self.vectors)
+            self.vectors.append(vec)
+            self.stats['hits'] += 1
+        self.row[key] = r
+        return r
+
+
+    def plan(self, node):
+        """
+        Rows of the vectors that can embed <node>:  for the candidate keys, for its lemmas, and for its words
+        """
+        attrs = node.get_token_attributes()
+        content = (attrs.lemmas, tuple(node.get_texts()))
+        plan = self.plans.get(content)
+        if plan is None:
+            lemmas, texts = content
+            key_rows   = [ self.lookup(key) for key in candidate_keys(attrs.lemmas_str) ]
+            lemma_rows = [ self.lookup(lemma) for lemma in lemmas ] if len(lemmas) > 1 else []
+            text_rows  = [ self.lookup(text) for text in texts ]
+            plan = self.plans[content] = (key_rows, lemma_rows, text_rows)
+        return plan
+
+
+    def embed(self, nodes):
+        """
+        Embed each of <nodes>:  look up everything needed, then fill one matrix, one row per Node, and point each node.embedding at
+        its row.
+
+        Parameters
+        ----------
+        nodes : array of Node
+
+        Returns
+        -------
+        numpy array, shape (len(nodes), dim)
+
+        """
+        if len(self.row) > self.max_keys:
+            self.clear()
+        plans = [ self.plan(node) for node in nodes ]
+
+        # Each Node gets either one vector (direct) or an average of several (averaged)
+        direct_nodes, direct_rows = [], []
+        avg_nodes, avg_rows, avg_weights = [], [], []
+        for k, (key_rows, lemma_rows, text_rows) in enumerate(plans):
+            hit = next(( r for r in key_rows if r >= 0 ), -1)
+            if hit >= 0:
+                direct_nodes.append(k)
+                direct_rows.append(hit)
+                continue
+            for rows in (lemma_rows, text_rows):
+                found = [ r for r in rows if r >= 0 ]
+                if len(found) > 0:
+                    avg_nodes.extend( [k] * len(found) )
+                    avg_rows.extend(found)
+                    avg_weights.extend( [1.0 / len(rows)] * len(found) )
+                    break
+
+        # Stack only the vectors used by this batch
+        used = sorted(set(direct_rows) | set(avg_rows))
+        if len(used) > 0:
+            table = np.stack([ np.asarray(self.vectors[r]) for r in used ])
+            local = { r:j for j, r in enumerate(used) }
+            dim, dtype = table.shape[1], np.result_type(table.dtype, np.float32)
+        else:
+            dim, dtype = default['dim'], np.float64
+
+        matrix = np.zeros((len(nodes), dim), dtype=dtype)
+        if len(direct_nodes) > 0:
+            matrix[direct_nodes] = table[[ local[r] for r in direct_rows ]]
+        if len(avg_nodes) > 0:
+            weighted = table[[ local[r] for r in avg_rows ]] * np.array(avg_weights)[:, None]
+            np.add.at(matrix, np.array(avg_nodes), weighted)
+
+        for k, node in enumerate(nodes):
+            node.embedding = matrix[k]
+        return matrix
+
+
+################################################################################
+################################################################################
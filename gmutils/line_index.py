@@ -0,0 +1,256 @@
+""" line_index.py
+
+    Random access into large text files by line number.
+
+    A single pass over a memory-mapped file records the byte offset at which every line starts.  Any line (or any percentage of the way
+    through the file) can then be reached with one seek, and the file can be split into byte ranges for parallel workers.  On request
+    ({'save':True}), the offsets are saved as a compact uint64 array next to the file ('<file>.lidx.npy'), so that later indexes and
+    line counts are O(1).  Nothing is written next to a file unless asked for.
+
+"""
+import os, sys, re
+import mmap
+import numpy as np
+
+from gmutils.serialization import atomic_write
+
+################################################################################
+# CONFIG
+
+SUFFIX     = '.lidx.npy'
+SCAN_BYTES = 1 << 26            # Bytes examined per step of the newline scan (bounds the scan's working memory)
+
+################################################################################
+# FUNCTIONS
+
+def index_path(filepath):
+    """
+    Where the line index for <filepath> is stored
+    """
+    return filepath + SUFFIX
+
+
+def build_line_index(filepath):
+    """
+    Scan <filepath> once via mmap and find the starting byte offset of every line.
+
+    Returns
+    -------
+    numpy array of uint64, of length (number of lines + 1).  Line i occupies bytes [offsets[i], offsets[i+1]) including its newline.
+    The final element is the size of the file.
+
+    """
+    size = os.path.getsize(filepath)
+    if size == 0:
+        return np.zeros(1, dtype=np.uint64)
+
+    parts = [ np.zeros(1, dtype=np.uint64) ]
+    with open(filepath, 'rb') as FH:
+        with mmap.mmap(FH.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for start in range(0, size, SCAN_BYTES):
+                count = min(SCAN_BYTES, size - start)
+                arr = np.frombuffer(mm, dtype=np.uint8, count=count, offset=start)
+                newlines = np.flatnonzero(arr == 10)
+                parts.append( (newlines + (start + 1)).astype(np.uint64) )
+                del arr                                               # Release the buffer export before the mmap closes
+
+    offsets = np.concatenate(parts)
+    if offsets[-1] != size:                                           # Last line lacks a trailing newline
+        offsets = np.append(offsets, np.uint64(size))
+
+    return offsets
+
+
+def save_line_index(filepath, offsets):
+    """
+    Atomically save a line index next to <filepath>
+    """
+    with atomic_write(index_path(filepath)) as FH:
+        np.save(FH, offsets.astype(np.uint64))
+
+
+def load_line_index(filepath):
+    """
+    Load the saved line index for <filepath> if it exists and is still valid (i.e. not older than the file and ending at the file's
+    current size).
+
+    Returns
+    -------
+    numpy array of uint64, or None
+
+    """
+    ipath = index_path(filepath)
+    try:
+        if os.path.getmtime(ipath) < os.path.getmtime(filepath):
+            return None
+        offsets = np.load(ipath, mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+
+    if len(offsets) == 0  or  int(offsets[-1]) != os.path.getsize(filepath):
+        return None
+    return offsets
+
+
+def num_lines(filepath):
+    """
+    Number of lines in <filepath> (a last line without a newline counts), building and saving the line index if needed
+    """
+    return len(LineIndex(filepath, {'save':True}))
+
+
+def count_lines(filepath):
+    """
+    Number of newlines in <filepath>, as counted by 'wc -l' (a last line without a newline does not count).  Uses the saved line index
+    if there is a valid one, else scans the file.  Never writes an index.
+    """
+    offsets = load_line_index(filepath)
+    if offsets is not None:
+        n = len(offsets) - 1
+        if n > 0:
+            with open(filepath, 'rb') as FH:
+                FH.seek(-1, os.SEEK_END)
+                if FH.read(1) != b'\n':
+                    n -= 1
+        return n
+
+    n = 0
+    with open(filepath, 'rb') as FH:
+        while True:
+            chunk = FH.read(SCAN_BYTES)
+            if not chunk:
+                return n
+            n += chunk.count(b'\n')
+
+
+################################################################################
+# OBJECTS
+
+class LineIndex(object):
+    """
+    Line-offset index over an uncompressed text file
+
+    Attributes
+    ----------
+    filepath : str
+
+    offsets : numpy array of uint64
+        Starting byte offset of each line, followed by the file size
+
+    """
+    def __init__(self, filepath, options={}):
+        """
+        Load the saved index for <filepath>, or build it (and save it if options['save'] is True)
+        """
+        self.filepath = filepath
+        self.offsets  = load_line_index(filepath)
+        if self.offsets is None:
+            self.offsets = build_line_index(filepath)
+            if options.get('save'):
+                try:
+                    save_line_index(filepath, self.offsets)
+                except OSError:
+                    pass                                              # e.g. read-only directory: use the index in memory only
+
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+
+    def offset(self, n):
+        """
+        Byte offset at which line <n> begins (line len(self) is the end of the file)
+        """
+        n = min(max(n, 0), len(self))
+        return int(self.offsets[n])
+
+
+    def line_at_percent(self, percent):
+        """
+        The line number <percent>% of the way through the file (same rounding as utils.monitor_setup's 'skipped' option)
+        """
+        return int( (float(len(self)) * float(percent)) / 100. )
+
+
+    def line_at_offset(self, offset):
+        """
+        The number of the line containing byte <offset>
+        """
+        return int(np.searchsorted(self.offsets, np.uint64(offset), side='right')) - 1
+
+
+    def seek(self, FH, n):
+        """
+        Position an open binary file at the beginning of line <n>
+        """
+        FH.seek(self.offset(n))
+        return FH
+
+
+    def get_line(self, n, encoding='utf-8'):
+        """
+        Read line <n> (without its line ending)
+        """
+        if n < 0  or  n >= len(self):
+            raise IndexError("Line %d out of range for %s (%d lines)"% (n, self.filepath, len(self)))
+        start, end = self.offset(n), self.offset(n + 1)
+        with open(self.filepath, 'rb') as FH:
+            FH.seek(start)
+            return FH.read(end - start).decode(encoding).rstrip('\r\n')
+
+
+    def iter_lines(self, start=0, stop=None, encoding='utf-8'):
+        """
+        Yield lines [start, stop) without reading anything before line <start>
+        """
+        if stop is None:
+            stop = len(self)
+        end = self.offset(stop)
+        with open(self.filepath, 'rb') as FH:
+            self.seek(FH, start)
+            for n in range(start, stop):
+                line = FH.readline()
+                if not line  or  FH.tell() > end:
+                    break
+                yield line.decode(encoding).rstrip('\r\n')
+
+
+    def split(self, k):
+        """
+        Split the file into (at most) <k> contiguous parts of roughly equal byte size, each beginning and ending on a line boundary.
+        Meant for handing work to parallel workers.
+
+        Returns
+        -------
+        list of (start_line, stop_line, start_byte, stop_byte)
+
+        """
+        n = len(self)
+        if n == 0:
+            return []
+        size    = int(self.offsets[-1])
+        targets = [ (size * i) // k for i in range(1, k) ]
+        cuts    = np.searchsorted(self.offsets, np.array(targets, dtype=np.uint64), side='left')
+        lines   = sorted(set([0] + [int(c) for c in cuts if 0 < c < n] + [n]))
+
+        return [ (a, b, self.offset(a), self.offset(b)) for a, b in zip(lines[:-1], lines[1:]) ]
+
+
+################################################################################
+# MAIN
+
+if __name__ == '__main__':
+    from gmutils.utils import argparser
+    parser = argparser({'desc': "Build line-offset indices: line_index.py"})
+    args = parser.parse_args()   # Get inputs and options
+
+    if args.file:
+        for file in args.file:
+            index = LineIndex(file, {'save':True})
+            print("%s: %d lines (index: %s)"% (file, len(index), index_path(file)))
+    else:
+        print(__doc__)
+
+
+################################################################################
+################################################################################
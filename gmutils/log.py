@@ -0,0 +1,247 @@
+""" log.py
+
+    Cheap, level-filtered logging to STDERR.  utils.err() is built on top of this module.
+
+    The urgency of each message is compared with the GM_LEVEL environment variable before anything else is done.  Only a message that
+    will actually be written looks up its caller (via sys._getframe, never inspect.stack(), which reads source lines for the whole
+    stack) and formats its arguments.  Arguments that are expensive to compute can be wrapped in Lazy so that they are never computed
+    for filtered messages.
+
+    Output is either the classic human-readable block, or one JSON object per line (GM_LOG_FORMAT=json, or the 'format' option).
+
+    Usage:
+
+        log.debug("Parsed %d sentences in %s", n, Lazy(describe, doc))
+        log.info("Wrote %s", filepath, options={'format':'json'})
+
+"""
+import os, sys, re
+import json
+import time
+
+################################################################################
+# CONFIG
+
+LEVEL_VAR   = 'GM_LEVEL'            # Lowest value allows all errors and warnings to print
+FORMAT_VAR  = 'GM_LOG_FORMAT'       # 'text' (default) or 'json'
+
+DEBUG    = 1
+INFO     = 2                        # The level of a plain err() call
+WARNING  = 3
+ERROR    = 4
+
+LEVEL_NAMES = { DEBUG:'DEBUG', INFO:'INFO', WARNING:'WARNING', ERROR:'ERROR' }
+
+_env = { 'raw':None, 'level':0 }    # Last seen value of GM_LEVEL, and its parse
+
+################################################################################
+# OBJECTS
+
+class Lazy(object):
+    """
+    A deferred value:  <func>(*args, **kwargs) is only called if the message containing it is written
+    """
+    __slots__ = ('func', 'args', 'kwargs')
+
+    def __init__(self, func, *args, **kwargs):
+        self.func   = func
+        self.args   = args
+        self.kwargs = kwargs
+
+    def __call__(self):
+        return self.func(*self.args, **self.kwargs)
+
+    def __str__(self):
+        return str(self())
+
+    def __repr__(self):
+        return repr(self())
+
+
+################################################################################
+# FUNCTIONS
+
+def os_level():
+    """
+    The threshold set by GM_LEVEL (0 if unset or not an int).  Re-parsed only when the variable changes.
+    """
+    raw = os.environ.get(LEVEL_VAR)
+    if raw != _env['raw']:
+        try:
+            level = int(raw)
+        except (TypeError, ValueError):
+            level = 0
+        _env['raw']   = raw
+        _env['level'] = level
+    return _env['level']
+
+
+def enabled(level=INFO):
+    """
+    Whether a message of urgency <level> will be written (same test err() has always applied)
+    """
+    return level + 1 >= os_level()
+
+
+def resolve(value):
+    """
+    Compute a Lazy value, pass anything else through
+    """
+    if isinstance(value, Lazy):
+        return value()
+    return value
+
+
+def caller(depth=1):
+    """
+    (filename, line number, function name) of the frame <depth> levels above the caller of this function
+    """
+    frame = sys._getframe(depth + 1)
+    code  = frame.f_code
+    return code.co_filename, frame.f_lineno, code.co_name
+
+
+def output_format(options={}):
+    fmt = options.get('format') or os.environ.get(FORMAT_VAR) or 'text'
+    return fmt.lower()
+
+
+def make_record(level, msg=None, args=(), vars=None, exception=None, depth=1):
+    """
+    Gather everything about one message into a dict.  Only called once the message is known to be written.
+
+    Parameters
+    ----------
+    level : int
+
+    msg : str
+        Optional %-format string, formatted with <args>
+
+    vars : str or list
+        Values to print (as in err())
+
+    exception : Exception
+
+    depth : int
+        How many frames above the caller of make_record() the message originated
+
+    """
+    filename, lineno, function = caller(depth + 1)
+    record = { 'time':time.time(), 'level':LEVEL_NAMES.get(level, level), 'file':filename, 'line':lineno, 'function':function }
+
+    if msg is not None:
+        args = tuple( resolve(a) for a in args )
+        try:
+            record['msg'] = msg % args if args else str(msg)
+        except (TypeError, ValueError):
+            record['msg'] = ' '.join( [str(msg)] + [str(a) for a in args] )
+
+    if vars:
+        if isinstance(vars, str):
+            record['vars'] = [ { 'value':vars } ]
+        else:
+            record['vars'] = []
+            for v in vars:
+                v = resolve(v)
+                record['vars'].append( { 'value':str(v), 'type':str(type(v)) } )
+
+    if exception is not None:
+        record['error'] = [ str(arg) for arg in exception.args ]
+        record['exc_type'] = str(sys.exc_info()[0])
+
+    return record
+
+
+def format_text(record):
+    """
+    The classic err() layout
+    """
+    lines = [ "\nDEBUG (Line %d) from file %s:\n"% (record['line'], record['file']) ]
+    if record.get('msg') is not None:
+        lines.append('\t%s\n'% record['msg'])
+
+    vars = record.get('vars')
+    if vars:
+        if len(vars) == 1  and  'type' not in vars[0]:
+            lines.append('\tVAR  |%s|\n' % vars[0]['value'])
+        else:
+            for v in vars:
+                lines.append('\tVAR  |%s|  %s\n'% (v['value'], v['type']))
+            lines.append('\n')
+
+    return ''.join(lines)
+
+
+def format_error(record):
+    """
+    The exception part of the classic err() layout
+    """
+    lines = [ "ERROR: {}\n".format(arg) for arg in record['error'] ]
+    lines.append("\n\t"+ record['exc_type'] +"\n")
+    return ''.join(lines)
+
+
+def write(record, options={}, header=True):
+    """
+    Write a record to STDERR in the configured format.  With <header> False (text format only), just the exception is written.
+    """
+    if output_format(options) == 'json':
+        sys.stderr.write(json.dumps(record, default=str) + '\n')
+        return
+
+    out = ''
+    if header:
+        out += format_text(record)
+    if record.get('error') is not None:
+        out += format_error(record)
+    sys.stderr.write(out)
+
+
+def log(level, msg, *args, **kwargs):
+    """
+    Write <msg> % <args> if <level> passes the GM_LEVEL threshold.  Nothing (not even the caller lookup) is done otherwise.
+
+    Keyword Arguments
+    -----------------
+    options : dict
+        'format' : 'text' or 'json'
+
+    exception : Exception
+
+    """
+    if level + 1 < os_level():
+        return
+    options = kwargs.get('options') or {}
+    write( make_record(level, msg, args, exception=kwargs.get('exception'), depth=kwargs.get('depth', 1)), options )
+
+
+def debug(msg, *args, **kwargs):
+    if DEBUG + 1 < os_level():
+        return
+    kwargs['depth'] = 2
+    log(DEBUG, msg, *args, **kwargs)
+
+
+def info(msg, *args, **kwargs):
+    if INFO + 1 < os_level():
+        return
+    kwargs['depth'] = 2
+    log(INFO, msg, *args, **kwargs)
+
+
+def warning(msg, *args, **kwargs):
+    if WARNING + 1 < os_level():
+        return
+    kwargs['depth'] = 2
+    log(WARNING, msg, *args, **kwargs)
+
+
+def error(msg, *args, **kwargs):
+    if ERROR + 1 < os_level():
+        return
+    kwargs['depth'] = 2
+    log(ERROR, msg, *args, **kwargs)
+
+
+################################################################################
+################################################################################
@@ -8,22 +8,34 @@ import os, re
 import numpy as np
 import itertools
 from copy import deepcopy
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 from sklearn.model_selection import train_test_split
 import spacy
+from spacy.attrs import SENT_START, IS_SPACE
 
 from gmutils.objects import Options
 from gmutils.normalize import normalize
 from gmutils.utils import err, argparser, read_file, read_dir, iter_file, isTrue, monitor_setup, monitor, serialize, deserialize
+from gmutils.serialization import atomic_write
 
 ################################################################################
 # SPACY INTEGRATION
 
+# By default a single pipeline produces the parse, the corrected sentence starts, and the NER in one pass, so 'spacy_ner' and
+# 'spacy_parsing' are the same object.  GM_TWO_MODELS=1 restores the older setup:  a second, unaltered copy of the model supplies
+# the NER tags (twice the memory, two parses per text).
+TWO_MODELS = bool(os.environ.get('GM_TWO_MODELS'))
+
 spacy_parsing = spacy_ner = None
 try:
     spacy_ner     = spacy.load('en_core_web_lg')    # download separately: https://spacy.io/models/
     if not os.environ.get('GM_NERONLY'):
-        spacy_parsing = spacy.load('en_core_web_lg')
+        if TWO_MODELS:
+            spacy_parsing = spacy.load('en_core_web_lg')
+        else:
+            spacy_parsing = spacy_ner
 except Exception as e: pass
 
     
@@ -33,21 +45,15 @@ def set_sentence_starts(doc):
 
     This function is designed to be a spaCy pipeline element
     """
-    verbose = False
-    starts = set([])
-    
-    for offsets in find_sentence_offsets(doc):
-        if verbose:  err([offsets])
-        start, end = offsets
-        starts.add(start)
-
-    for token in doc[:-1]:
-        if token.i in starts:
-            token.is_sent_start = True
-            if verbose:  err(["START", token])
-        else:
-            token.is_sent_start = False
-            if verbose:  err([token])
+    n = len(doc)
+    if n < 2:
+        return doc
+
+    values = np.full(n, -1, dtype=np.int64)                  # -1: not a sentence start
+    starts = sentence_offsets(doc)[:,0]
+    values[starts[starts < n]] = 1                           # A shifted, now empty, final sentence may start at n
+    values[-1] = sent_start_array(doc)[-1]                   # The last token is left as it was
+    doc.from_array([SENT_START], values.astype(np.uint64).reshape(n, 1))
             
     return doc
 
@@ -72,37 +78,216 @@ except Exception as e:
     raise
     err([], {'exception':e})
 
+
 ################################################################################
+# PIPELINE PROFILES
+#
+# Each profile names the pipeline components a task needs.  The others are switched off per call with spaCy's 'disable' argument, so
+# the shared pipeline is never modified.  Lemmas come from the tagger (English lemmas depend on the POS tag), so 'tag' is the
+# lightest profile that gives the same lemmas as the full pipeline.
+
+PROFILES = {
+    'tokenize'  : [],                                                             # Tokenizer only
+    'sentences' : ['sentencizer', 'set_sentence_starts'],                         # + corrected sentence boundaries
+    'tag'       : ['tagger'],                                                     # + POS tags and lemmas
+    'parse'     : ['sentencizer', 'set_sentence_starts', 'tagger', 'parser'],     # + corrected sentences and dependency parse
+    'full'      : None,                                                           # Everything, including NER
+}
+
+
+def profile_pipeline():
+    """
+    The pipeline that profiles select components from
+    """
+    if spacy_parsing is not None:
+        return spacy_parsing
+    return spacy_ner
 
-def get_sentences(doc):
+
+def profile_disable(profile, nlp=None):
     """
-    Even after adding a custom func to the spacy pipeline, the sentence tokenization still gets messed up.  Use this for a final split.
+    Names of the components to disable for <profile>
+
+    Parameters
+    ----------
+    profile : str
+        One of the keys of PROFILES
+
+    nlp : spaCy Language (default: profile_pipeline())
+
+    Returns
+    -------
+    list of str
+
     """
-    verbose       = False
-    starts        = set([])
-    sentences     = []
-    this_sentence = set([])
+    if profile not in PROFILES:
+        raise ValueError("Unknown pipeline profile: %s (choose from %s)"% (str(profile), ', '.join(sorted(PROFILES.keys()))))
+    if nlp is None:
+        nlp = profile_pipeline()
+    keep = PROFILES[profile]
+    if keep is None:
+        return []
+    return [ name for name in nlp.pipe_names if name not in keep ]
+
+
+def process(text, profile='full'):
     """
-    for offsets in find_sentence_offsets(doc):
-        if verbose:  err([offsets])
-        start, end = offsets
-        starts.add(start)
+    Run <text> through only the components needed for <profile>
+
+    Returns
+    -------
+    spaCy Doc
+
     """
-    for i, token in enumerate(doc[:-1]):
-        # if token.i in starts:
-        if token.is_sent_start:
-            if verbose:  err(["START", token])
-            if len(this_sentence) > 0:
-                sentences.append( doc[min(this_sentence):max(this_sentence)] )
-            this_sentence = set([i])
-        else:
-            if verbose:  err([token])
-            this_sentence.add(i)
+    nlp = profile_pipeline()
+    disable = profile_disable(profile, nlp)
+    if len(disable) == len(nlp.pipe_names):
+        return nlp.make_doc(text)                         # Tokenizer only
+    return nlp(text, disable=disable)
+
+
+def process_batch(texts, profile='full', batch_size=64, n_process=1):
+    """
+    Stream <texts> through nlp.pipe with only the components needed for <profile>
+
+    Returns
+    -------
+    generator of spaCy Doc, in input order
+
+    """
+    nlp = profile_pipeline()
+    kwargs = { 'batch_size':batch_size, 'disable':profile_disable(profile, nlp) }
+    if n_process > 1:
+        kwargs['n_process'] = n_process
+    return nlp.pipe(texts, **kwargs)
+
+
+################################################################################
+# PARSE CACHE
+
+parse_cache = None     # ParseCache, or None to always run the model
+
+
+def set_parse_cache(directory, options={}):
+    """
+    Cache parses on disk in <directory> (see parse_cache.py), or stop caching if <directory> is None.  Entries are tied to the
+    current model, its version and the pipeline, so changing any of them never returns a stale parse.
+
+    Options
+    -------
+    max_bytes : int
+        Size bound for the cache
+
+    """
+    global parse_cache
+    if directory is None:
+        parse_cache = None
+        return None
 
-    if len(this_sentence) > 0:
-        sentences.append( doc[min(this_sentence):max(this_sentence)] )
+    from gmutils.parse_cache import ParseCache, pipeline_signature
+    options = dict(options)
+    options['signature'] = pipeline_signature(spacy_parsing, 'two_models' if spacy_ner is not spacy_parsing else '')
+    parse_cache = ParseCache(directory, options)
+    return parse_cache
 
-    return sentences
+
+if os.environ.get('GM_PARSE_CACHE'):
+    try:
+        set_parse_cache(os.environ['GM_PARSE_CACHE'], {'max_bytes':int(os.environ.get('GM_PARSE_CACHE_BYTES') or 0)})
+    except Exception as e:
+        err([], {'exception':e, 'level':0, 'warning':True})
+
+################################################################################
+# SENTENCE DEDUPLICATION
+
+sentence_cache = None  # SentenceCache, or None to parse whole texts
+
+
+def set_sentence_dedup(max_sentences=None):
+    """
+    Parse each unique sentence only once (see sentence_cache.py).  Texts are split into sentences first; each sentence is looked up in
+    a bounded in-memory cache, then in the on-disk parse cache (if any), and only then parsed.  Whole-document Docs are reassembled
+    from the sentence parses.  Pass max_sentences=0 to turn this off.
+
+    """
+    global sentence_cache
+    if max_sentences == 0:
+        sentence_cache = None
+        return None
+
+    from gmutils.sentence_cache import SentenceCache
+    sentence_cache = SentenceCache({'max_sentences':max_sentences})
+    return sentence_cache
+
+
+if os.environ.get('GM_SENTENCE_DEDUP'):
+    set_sentence_dedup(int(os.environ['GM_SENTENCE_DEDUP']))     # Value: number of sentences to keep in memory
+
+
+def generate_spacy_data_dedup(texts, batch_size=64, n_process=1):
+    """
+    Like generate_spacy_data_batch(), but parsing each unique sentence only once
+
+    Returns
+    -------
+    generator of (spaCy Doc, dict of NER tags, spaCy Vocab), in input order
+
+    """
+    from gmutils.sentence_cache import sentence_spans, make_record, assemble
+    vocab = spacy_ner.vocab
+
+    for group in batched(texts, batch_size * max(1, n_process)):
+        splits = [ sentence_spans(spacy_doc) for spacy_doc in process_batch(group, 'sentences', batch_size) ]
+
+        # Resolve each unique sentence of this group:  memory, then disk, then the model
+        records = {}                                    # Held here too, so that LRU eviction can't drop what this group needs
+        todo = []
+        for text, spans in zip(group, splits):
+            for start, end in spans:
+                sentence = text[start:end]
+                if sentence in records:
+                    continue
+                record = sentence_cache.get(sentence)
+                if record is None  and  parse_cache is not None:
+                    cached = parse_cache.get(sentence, vocab)
+                    if cached is not None:
+                        record = make_record(*cached)
+                        sentence_cache.put(sentence, record)
+                records[sentence] = record
+                if record is None:
+                    todo.append(sentence)
+
+        for sentence, (spacy_doc, ner) in zip(todo, parse_batch(todo, batch_size, n_process)):
+            if parse_cache is not None:
+                parse_cache.put(sentence, spacy_doc, ner)
+            records[sentence] = make_record(spacy_doc, ner)
+            sentence_cache.put(sentence, records[sentence])
+
+        for text, spans in zip(group, splits):
+            spacy_doc, ner = assemble(vocab, text, spans, [ records[text[start:end]] for start, end in spans ])
+            yield spacy_doc, ner, vocab
+
+
+################################################################################
+
+def get_sentences(doc):
+    """
+    Even after adding a custom func to the spacy pipeline, the sentence tokenization still gets messed up.  Use this for a final split.
+
+    A sentence runs from one token flagged is_sent_start up to the next.  The final token of the Doc is not considered, and each
+    returned Span stops one token short of the next sentence start (as this function always has).
+    """
+    n = len(doc)
+    if n < 2:
+        return []
+
+    flags  = sent_start_array(doc)[:n-1] > 0
+    starts = np.flatnonzero(flags)
+    if len(starts) == 0  or  starts[0] != 0:
+        starts = np.concatenate(( [0], starts ))
+    ends = np.append(starts[1:], n-1) - 1
+
+    return [ doc[start:end] for start, end in zip(starts.tolist(), ends.tolist()) ]
             
 
 def sanity_check(spacy_doc):
@@ -117,6 +302,28 @@ def sanity_check(spacy_doc):
             if verbose:  err([token])
 
 
+def ner_dict(spacy_doc, spacy_nerdoc=None):
+    """
+    Map each token index to its (entity type, IOB tag)
+
+    Parameters
+    ----------
+    spacy_doc : spaCy Doc
+
+    spacy_nerdoc : spaCy Doc
+        A separate parse of the same text to take the NER tags from (default: <spacy_doc> itself)
+
+    Returns
+    -------
+    dict : int -> (str, str)
+
+    """
+    if spacy_nerdoc is None:
+        spacy_nerdoc = spacy_doc
+    assert( len(spacy_doc) == len(spacy_nerdoc) )
+    return { token.i:(token.ent_type_, token.ent_iob_) for token in spacy_nerdoc }
+
+
 def generate_spacy_data(text):
     """
     Used in the creation of Document objects
@@ -127,21 +334,101 @@ def generate_spacy_data(text):
 
     Returns
     -------
-    spaCy Doc
+    spaCy Doc, dict of NER tags (see ner_dict), spaCy Vocab
 
     """
-    # Perform NER corrections
-    # err([text])
+    if sentence_cache is not None:
+        return next(generate_spacy_data_dedup([text]))
+
+    if parse_cache is not None:
+        cached = parse_cache.get(text, spacy_ner.vocab)
+        if cached is not None:
+            spacy_doc, ner = cached
+            return spacy_doc, ner, spacy_ner.vocab
+
     spacy_doc = spacy_parsing(text)
-    spacy_nerdoc = spacy_ner(text)
-    assert( len(spacy_doc) == len(spacy_nerdoc) )
-    ner = {}
-    for i, token in enumerate(spacy_doc):
-        ner[token.i]  = (spacy_nerdoc[i].ent_type_, spacy_nerdoc[i].ent_iob_)
+    if spacy_ner is spacy_parsing:
+        ner = ner_dict(spacy_doc)                       # One pass:  NER comes from the same Doc
+    else:
+        ner = ner_dict(spacy_doc, spacy_ner(text))      # GM_TWO_MODELS:  NER from an unaltered pipeline
+
+    if parse_cache is not None:
+        parse_cache.put(text, spacy_doc, ner)
 
     return spacy_doc, ner, spacy_ner.vocab
 
 
+def generate_spacy_data_batch(texts, batch_size=64, n_process=1):
+    """
+    Batched version of generate_spacy_data().  Texts are streamed through spaCy's nlp.pipe, which batches them internally and, with
+    <n_process> > 1, parses them in worker processes (spaCy >= 2.2).
+
+    Parameters
+    ----------
+    texts : iterable of str
+
+    batch_size : int
+
+    n_process : int
+
+    Returns
+    -------
+    generator of (spaCy Doc, dict of NER tags, spaCy Vocab), in input order
+
+    """
+    if sentence_cache is not None:
+        for result in generate_spacy_data_dedup(texts, batch_size, n_process):
+            yield result
+        return
+
+    if parse_cache is None:
+        for spacy_doc, ner in parse_batch(texts, batch_size, n_process):
+            yield spacy_doc, ner, spacy_ner.vocab
+        return
+
+    # Only cache misses go to the model.  <pending> holds every text read so far, with its cached parse if any, so that results
+    # can be given back in input order as the model's output arrives.
+    pending = deque()
+    def misses():
+        for text in texts:
+            cached = parse_cache.get(text, spacy_ner.vocab)
+            pending.append( (text, cached) )
+            if cached is None:
+                yield text
+
+    for spacy_doc, ner in parse_batch(misses(), batch_size, n_process):
+        while pending[0][1] is not None:
+            yield pending.popleft()[1] + (spacy_ner.vocab,)
+        text, _ = pending.popleft()
+        parse_cache.put(text, spacy_doc, ner)
+        yield spacy_doc, ner, spacy_ner.vocab
+
+    while pending:
+        yield pending.popleft()[1] + (spacy_ner.vocab,)
+
+
+def parse_batch(texts, batch_size=64, n_process=1):
+    """
+    Run texts through nlp.pipe
+
+    Returns
+    -------
+    generator of (spaCy Doc, dict of NER tags), in input order
+
+    """
+    kwargs = { 'batch_size':batch_size }
+    if n_process > 1:
+        kwargs['n_process'] = n_process
+
+    if spacy_ner is spacy_parsing:
+        for spacy_doc in spacy_parsing.pipe(texts, **kwargs):
+            yield spacy_doc, ner_dict(spacy_doc)
+    else:
+        texts, ner_texts = itertools.tee(texts)         # GM_TWO_MODELS:  run both pipelines side by side
+        for spacy_doc, spacy_nerdoc in zip(spacy_parsing.pipe(texts, **kwargs), spacy_ner.pipe(ner_texts, **kwargs)):
+            yield spacy_doc, ner_dict(spacy_doc, spacy_nerdoc)
+
+
 def combine_with_previous(previous, current):
     """
     Correct for some errors made by the spaCy sentence splitter
@@ -191,6 +478,48 @@ def combine_with_previous(previous, current):
     return False
     
     
+def sent_start_array(doc):
+    """
+    The sent_start value of each token (1: starts a sentence, -1: does not, 0: unknown) as a NumPy array of int64
+    """
+    return doc.to_array([SENT_START]).astype(np.int64).reshape(-1)
+
+
+def sentence_offsets(doc):
+    """
+    Begin with spaCy sentence splits, then correct for some mistakes.  A single linear pass over the token arrays.
+
+    Parameters
+    ----------
+    doc : spaCy Doc
+
+    Returns
+    -------
+    numpy array of int64, shape (number of sentences, 2):  (start, end) token offsets
+
+    """
+    n = len(doc)
+    if n == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+
+    values = doc.to_array([SENT_START, IS_SPACE]).astype(np.int64)
+
+    # spaCy sentences (as Doc.sents):  one begins at token 0 and at every later token whose sent_start is 1
+    starts = np.flatnonzero(values[:,0] == 1)
+    starts = np.concatenate(( [0], starts[starts > 0] ))
+    ends   = np.append(starts[1:], n)
+
+    # A sentence starting with whitespace gives that token to the previous sentence
+    shift = values[starts, 1] != 0
+    shift[0] = False
+    offsets = np.empty((len(starts), 2), dtype=np.int64)
+    offsets[:,0] = starts + shift
+    offsets[:,1] = ends
+    offsets[:-1,1] += shift[1:]
+
+    return offsets
+
+
 def find_sentence_offsets(doc):
     """
     Begin with spaCy sentence splits, then correct for some mistakes.
@@ -204,59 +533,18 @@ def find_sentence_offsets(doc):
     array of pair (start, end)
 
     """
-    verbose = False
-    sen_offsets = []                                   # Sentence offset pairs -- starts empty
-    spacy_sentences = list(doc.sents)
-    previous = None
-    
-    for i, current in enumerate(spacy_sentences):
-
-        # Current Sentence
-        start = current.start
-        end   = current.end
-        if verbose:  err([current, start, end])
-
-        # Previous Sentence
-        if len(sen_offsets) > 0:
-            p_start = previous.start
-            p_end   = previous.end
-            if verbose:
-                err([previous.text, (p_start, p_end), current.text, (start, end)])
-
-        # Correct for mistakes
-        if previous is not None  and  combine_with_previous(previous, current)  and  False:      ### NEVER
-            sen_offsets[-1] = [p_start, end]           # Fold this sentence's tokens into previous sentence
-            if verbose:  err(sen_offsets)
-        else:
-            sen_offsets.append( [start, end] )         # Add current offsets to list
-            if verbose:  err(sen_offsets)
-
-        previous = current
-                
-    # Shift sentence starting token to previous sentence when necessary
-    final_offsets = []
-    for offsets in sen_offsets:
-        start, end = offsets
-        if start > 0:            # Not the first sentence start
-            if not re.search(r'\S', doc[start].text, flags=re.I):   # Current sentence starts with whitespace
-                prev_start, prev_end = final_offsets[-1]
-                final_offsets[-1] = [prev_start, prev_end+1]   # Make previous sentence longer
-                final_offsets.append( [start+1, end] )         # Start current sentence one char later
-            else:
-                final_offsets.append(offsets)
-        else:
-            final_offsets.append(offsets)
-                
-    sen_offsets = final_offsets
-    
-    if verbose:
-        err(sen_offsets)
-    return sen_offsets
+    return sentence_offsets(doc).tolist()
     
 
 ################################################################################
 # FUNCTIONS
 
+HYPHENATED      = re.compile(r'[a-zA-Z]-[a-zA-Z]')
+CONTRACTED      = re.compile(r"\w'\w+$")
+CONTRACTION_END = re.compile(r"'(\w+)$")
+BEFORE_ENDING   = re.compile(r"^.*'(\w+)$")
+
+
 def split_words(text):
     """
     Poor man's tokenization
@@ -266,7 +554,7 @@ def split_words(text):
     
     ready = []
     for word in words:
-        if re.search(r'[a-zA-Z]-[a-zA-Z]', word):       # Handle hyphens
+        if '-' in word  and  HYPHENATED.search(word):  # Handle hyphens
             parts = word.split('-')
             ready.append(parts[0])
             for part in parts:
@@ -279,9 +567,9 @@ def split_words(text):
     
     ready = []
     for word in words:
-        if re.search(r"\w'\w+$", word):                # Handle apostrophes
-            starting = re.sub(r"'(\w+)$", '', word)
-            ending   = re.sub(r"^.*'(\w+)$", r'\1', word)
+        if "'" in word  and  CONTRACTED.search(word):  # Handle apostrophes
+            starting = CONTRACTION_END.sub('', word)
+            ending   = BEFORE_ENDING.sub(r'\1', word)
             ready.extend( [starting, "'" + ending] )
         else:
             ready.append(word)
@@ -330,17 +618,184 @@ def tokenize(text):
     
 
 def lemmatize(text):
-    spacy_doc = spacy_parsing(text)
+    spacy_doc = process(text, 'tag')                    # The tagger is all that lemmas need
     span = spacy_doc[:]
     return span.lemma_
 
 
-def lemmatize_file(file):
-    lines = []
-    for line in read_file(file):
-        line = normalize(line)
-        lines.append(lemmatize(line))
-    return lines
+def tokenize_batch(texts):
+    """
+    tokenize() each of a list of texts.  The unit of work for worker processes in tokenize_stream().
+    """
+    final = []
+    for spacy_doc in tokenizer.pipe(texts):
+        words = []
+        for token in spacy_doc:
+            words.extend( split_words(token.text) )
+        final.append(words)
+    return final
+
+
+def batched(items, batch_size):
+    """
+    Generate consecutive lists of up to <batch_size> elements from any iterable
+    """
+    it = iter(items)
+    while True:
+        batch = list(itertools.islice(it, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def map_batches(func, items, batch_size=1000, n_process=1):
+    """
+    Apply <func> (which takes a list and returns a list) to consecutive batches of <items>, in up to <n_process> worker processes.
+    At most 2 x n_process batches are in flight, so <items> may be far larger than memory.
+
+    Returns
+    -------
+    generator over the concatenated outputs, in input order
+
+    """
+    batches = batched(items, batch_size)
+    if n_process <= 1:
+        for batch in batches:
+            for out in func(batch):
+                yield out
+        return
+
+    with ProcessPoolExecutor(max_workers=n_process) as pool:
+        pending = deque()
+        for batch in batches:
+            pending.append( pool.submit(func, batch) )
+            if len(pending) >= 2 * n_process:
+                for out in pending.popleft().result():
+                    yield out
+        while pending:
+            for out in pending.popleft().result():
+                yield out
+
+
+def tokenize_stream(lines, options={}):
+    """
+    tokenize() a stream of texts
+
+    Parameters
+    ----------
+    lines : iterable of str
+
+    Options
+    -------
+    batch_size : int
+
+    n_process : int
+        Number of worker processes
+
+    Returns
+    -------
+    generator of (list of str), one per line, in input order
+
+    """
+    return map_batches(tokenize_batch, lines, options.get('batch_size') or 1000, options.get('n_process') or 1)
+
+
+def lemmatize_stream(lines, options={}):
+    """
+    lemmatize() a stream of texts, batched through nlp.pipe with only the tagger enabled
+
+    Parameters
+    ----------
+    lines : iterable of str
+
+    Options
+    -------
+    normalize : boolean
+        Normalize each line first (default True, as lemmatize_file() always has)
+
+    batch_size : int
+
+    n_process : int
+        Number of worker processes
+
+    Returns
+    -------
+    generator of str, one per line, in input order
+
+    """
+    if options.get('normalize', True):
+        lines = ( normalize(line) for line in lines )
+    for spacy_doc in process_batch(lines, 'tag', options.get('batch_size') or 256, options.get('n_process') or 1):
+        yield spacy_doc[:].lemma_
+
+
+def write_lines(lines, outfile):
+    """
+    Write each str of <lines> to <outfile> as it arrives (atomically:  <outfile> only appears once complete)
+
+    Returns
+    -------
+    int : number of lines written
+
+    """
+    n = 0
+    with atomic_write(outfile, 'w') as FH:
+        for line in lines:
+            FH.write(line + '\n')
+            n += 1
+    return n
+
+
+def lemmatize_file(file, outfile=None, options={}):
+    """
+    Lemmatize each line of a (possibly compressed) file, streaming it rather than reading it all in
+
+    Parameters
+    ----------
+    file : str
+
+    outfile : str
+        If given, lemmatized lines are written here incrementally and the number of lines is returned
+
+    Options
+    -------
+    See lemmatize_stream()
+
+    Returns
+    -------
+    list of str, or int if <outfile> is given
+
+    """
+    lemmas = lemmatize_stream(iter_file(file), options)
+    if outfile is not None:
+        return write_lines(lemmas, outfile)
+    return list(lemmas)
+
+
+def tokenize_file(file, outfile=None, options={}):
+    """
+    Tokenize each line of a (possibly compressed) file, streaming it rather than reading it all in
+
+    Parameters
+    ----------
+    file : str
+
+    outfile : str
+        If given, space-separated tokens are written here, one line per input line, and the number of lines is returned
+
+    Options
+    -------
+    See tokenize_stream()
+
+    Returns
+    -------
+    list of (list of str), or int if <outfile> is given
+
+    """
+    tokens = tokenize_stream(iter_file(file), options)
+    if outfile is not None:
+        return write_lines( (' '.join(words) for words in tokens), outfile )
+    return list(tokens)
         
 
 def series_to_dict(names, row):
@@ -375,24 +830,123 @@ def generate_onehot_vocab(words):
     For a list of words, generate a one-hot vocab of the appropriate size
     """
     vocab = {}
-    vocab['_empty_'] = np.array([0] * len(words))
+    vocab['_empty_'] = np.zeros(len(words), dtype=int)
+    eye = np.eye(len(words), dtype=int)
     for i, word in enumerate(words):
-        vocab[word] = deepcopy(vocab['_empty_'])
-        vocab[word][i] = 1
+        vocab[word] = eye[i]                            # Each row is its own memory: no copies needed
         
     return vocab
 
 
+def multi_hot(id_lists, size, options={}):
+    """
+    Build one multi-hot row per list of integer ids, by setting indices in a single preallocated matrix
+
+    Parameters
+    ----------
+    id_lists : list of (list of int)
+
+    size : int
+        Width of each row
+
+    Options
+    -------
+    sparse : boolean
+        Return a scipy.sparse CSR matrix instead of a dense NumPy array
+
+    Returns
+    -------
+    (len(id_lists), size) matrix of int, 1 where an id is present
+
+    """
+    rows = np.repeat( np.arange(len(id_lists)), [ len(ids) for ids in id_lists ] )
+    cols = np.fromiter( itertools.chain.from_iterable(id_lists), dtype=np.int64, count=len(rows) )
+
+    if options.get('sparse'):
+        import scipy.sparse
+        matrix = scipy.sparse.csr_matrix( (np.ones(len(rows), dtype=int), (rows, cols)), shape=(len(id_lists), size) )
+        matrix.data[:] = 1                              # Repeated ids were summed: keep it binary
+        return matrix
+
+    matrix = np.zeros((len(id_lists), size), dtype=int)
+    matrix[rows, cols] = 1
+    return matrix
+
+
+################################################################################
+# OBJECTS
+
+class MultiHotEncoder(object):
+    """
+    Index-based alternative to the dense vectors of generate_onehot_vocab(), with the same layout:  label i of <labels> sets element i.
+    Labels are mapped to integer ids once; a vector (or a matrix for a batch) is made by setting those ids in a preallocated array.
+
+    Attributes
+    ----------
+    labels : list of str
+
+    index : dict
+        label -> id
+
+    """
+    def __init__(self, labels):
+        self.labels = list(labels)
+        self.index  = { label:i for i, label in enumerate(self.labels) }
+
+
+    def __len__(self):
+        return len(self.labels)
+
+
+    def ids(self, labels):
+        """
+        Integer ids of <labels>.  Raises KeyError for an unknown label, as a lookup in a onehot vocab does.
+        """
+        index = self.index
+        return [ index[label] for label in labels ]
+
+
+    def encode(self, labels):
+        """
+        Multi-hot vector for one list of labels (all zeros if empty):  identical to OR-ing their generate_onehot_vocab() vectors
+        """
+        vector = np.zeros(len(self.labels), dtype=int)
+        vector[self.ids(labels)] = 1
+        return vector
+
+
+    def encode_batch(self, label_lists, options={}):
+        """
+        Multi-hot matrix with one row per list of labels.  options['sparse']:  return a scipy.sparse CSR matrix.
+        """
+        return multi_hot([ self.ids(labels) for labels in label_lists ], len(self.labels), options)
+
+
 ################################################################################
 # MAIN
 
 if __name__ == '__main__':
 
     parser = argparser({'desc': "Some general NLP tasks: nlp.py"})
+    parser.add_argument('--lemmatize',  help='Lemmatize each line of --file, streaming', required=False, action='store_true')
+    parser.add_argument('--tokenize',   help='Tokenize each line of --file, streaming', required=False, action='store_true')
+    parser.add_argument('--outfile',    help='Where to write the output of --lemmatize or --tokenize', required=False, type=str)
+    parser.add_argument('--n_process',  help='Number of worker processes', required=False, type=int, default=1)
     args = parser.parse_args()
 
     text = ''
     
+    if args.file  and  (args.lemmatize  or  args.tokenize):
+        options = { 'n_process':args.n_process }
+        for file in args.file:
+            outfile = args.outfile or file + ('.lemmas' if args.lemmatize else '.tokens')
+            if args.lemmatize:
+                n = lemmatize_file(file, outfile, options)
+            else:
+                n = tokenize_file(file, outfile, options)
+            sys.stderr.write("Wrote %d lines to %s\n"% (n, outfile))
+        exit()
+
     if args.file:
         for file in args.file:
             text += read_file(file)
@@ -7,10 +7,13 @@ import os, sys, re, json
 from time import sleep
 from functools import reduce
 import numpy as np
+from spacy.attrs import ORTH, POS
+from spacy.symbols import PUNCT
 
-from gmutils.objects import Object
+from gmutils.objects import Object, memoized
 from gmutils.utils import err, argparser, vector_average, cosine_similarity, deepcopy_list
-from gmutils.nlp import generate_onehot_vocab
+from gmutils.nlp import generate_onehot_vocab, MultiHotEncoder, multi_hot
+from gmutils.tree_arrays import TreeArrays, head_array, depth_array, sibling_ranks
 
 ################################################################################
 # DEFAULTS
@@ -28,6 +31,14 @@ PREPOSITION_LEMMAS = set(['with', 'at', 'from', 'into', 'during', 'including', '
 # Words that are sometimes mis-tagged by the spacy POS-tagger when root
 ROOT_VERBS  = set(['record'])
 
+# Verify the Document's token -> Node index against a full traversal after each tree operation (slow; for debugging)
+CHECK_TREES = bool(os.environ.get('GM_CHECK_TREES'))
+
+PLACEHOLDER_LEMMA = re.compile(r'^-[A-Z]+-$')     # e.g. spaCy's '-PRON-'
+
+# Use of the per-Node caches of token attributes (see Node.get_token_attributes)
+attribute_stats = { 'hits':0, 'misses':0, 'invalidations':0 }
+
 default = {
     'empty_embedding' : np.array( [0.0] * 300 ),
     'pos_embedding' : generate_onehot_vocab(pos_indices),
@@ -36,13 +47,64 @@ default = {
     'compound_adj_prefixes' : set(['all', 'cross', 'full', 'part', 'half', 'high', 'low', 'upper', 'lower', 'middle', 'mid', 'like', 'self'])
     }
 
+# Index-based encoders with the same layout as the onehot vocabs above
+pos_encoder = MultiHotEncoder(pos_indices)
+ner_encoder = MultiHotEncoder(ner_indices)
+dep_encoder = MultiHotEncoder(dep_indices)
+
 ################################################################################
 # OBJECTS
 
+class TokenAttributes(object):
+    """
+    The attributes of a Node derived from its tokens, computed together on first use and kept until its tokens change
+
+    Attributes
+    ----------
+    lemmas, pos, dep, ner : tuple of str
+        As returned (in list form) by Node.get_lemmas(), get_pos(), get_dep() and get_ner().  'dep' is sorted.
+
+    lemma_set, pos_set, dep_set : frozenset of str
+
+    lemmas_str, pos_str, dep_str : str
+
+    entity_position : str
+        'B', 'I', or 'O' (see Node.get_entity_position)
+
+    """
+    __slots__ = ('lemmas', 'lemma_set', 'lemmas_str', 'pos', 'pos_set', 'pos_str', 'dep', 'dep_set', 'dep_str', 'ner', 'entity_position')
+
+    def __init__(self, node):
+        tokens = node.tokens or []
+        self.lemmas     = tuple(token_lemmas(tokens, picky=False))
+        self.lemma_set  = frozenset(self.lemmas)
+        self.lemmas_str = ' '.join(self.lemmas)
+        self.pos        = tuple( token.pos_ for token in tokens )
+        self.pos_set    = frozenset(self.pos)
+        self.pos_str    = ' '.join(self.pos)
+        self.dep        = tuple(sorted( token.dep_ for token in tokens ))
+        self.dep_set    = frozenset(self.dep)
+        self.dep_str    = ' '.join(self.dep)
+        self.ner        = tuple( token.ent_type_ for token in tokens if token.ent_type > 0 )
+
+        position = 'O'
+        ner = node.doc.ner
+        for token in tokens:
+            iob = ner.get(token.i, ('', 'O'))[1]
+            if iob == 'B':
+                position = 'B'
+            if iob == 'I'  and  position == 'O':
+                position = 'I'
+        self.entity_position = position
+
+
 class Node(Object):
     """
     A node in a dependency parse tree.  Based on an underlying Spacy Doc
 
+    A Node is a lightweight view:  the shape of the tree (parent, children) and the Node IDs are held in the Document's TreeArrays
+    (see tree_arrays.py), indexed by the Node's number 'i'.
+
     Attributes
     ----------
     is_dead : boolean
@@ -50,6 +112,9 @@ class Node(Object):
 
     doc : Document object (as defined in document.py)
 
+    i : int
+        Number of this Node in doc.tree_arrays (the index of the token it was created for)
+
     tokens : array of spacy.Token
 
     parent : Node
@@ -63,58 +128,31 @@ class Node(Object):
         Of a format like: "root.T1.2.3.x etc." where each dot implies a level down, and the integer indicates sibling number
 
     """
-    def __init__(self, doc, spacy_token, parent=None, options={}):
+    __slots__ = ('doc', 'i', 'tokens', 'is_dead', 'embedding', '_value_', '_attrs_', '_memo_')
+
+    def __init__(self, doc, i, tokens):
         """
-        Instantiate the object and set options
+        A Node for node number <i> of doc.tree_arrays, holding <tokens>.  Its place in the trees is whatever the TreeArrays already
+        hold for <i>; nothing is built below it (see build_trees).
 
         doc : Document (as defined in document.py)
-        
-        spacy_token : spacy.Token
 
-        parent : Node
+        i : int
 
-        """
-        verbose = False
-        self.set_options(options)        # For more on 'self.set_options()' see object.Object
-        self.is_dead = False
-        self.doc = doc
-        self.tokens = []
-        
-        if isinstance(spacy_token, list):
-            tokens = spacy_token
-        else:
-            tokens = [spacy_token]
-
-        # Remove whitespace tokens
-        for token in tokens:
-            if re.search(r'\S', token.text):
-                self.tokens.append(token)
-            
-        self.parent = parent
-        self.children = []
-        # NOTE: do not attempt to create sibling relationships.  It is safer to determine them given the current state of the tree
+        tokens : array of spacy.Token
 
-        if verbose:
-            if len(self.tokens) < 1:
-                print("No tokens in this Node. See parent:\n%s\n\nSee Document:\n%s"% (self.parent.get_text(), self.doc.get_text()))
-                sleep(1)
-                # err([], {'ex':"No tokens in this Node. See parent:\n%s\n\nSee Document:\n%s"% (self.parent.get_text(), self.doc.get_text())})
-                
-        # Base original tree on spacy Token tree.  Add a Node-child for every token-child
-        for token in self.tokens:
-            children = list(token.children)
-            for i, child in enumerate(children):
+        """
+        self.doc       = doc
+        self.i         = i
+        self.tokens    = tokens
+        self.is_dead   = False
+        self._value_   = None
+        self._attrs_   = None
+        self._memo_    = None
+        self.embedding = None
+        doc.tree_arrays.nodes[i] = self
 
-                if token_is_prunable(child):
-                    # print("Skipping (%s): %s"% (child.pos_, child))
-                    continue
-                
-                options['ID'] = self.get('ID') + '.' + str(i)
-                node = Node(self.doc, child, parent=self, options=options)
-                if len(node.tokens) > 0:
-                    self.children.append(node)
 
-                
     def kill(self):
         """
         Remove a Node and make sure it doesn't get used accidentally
@@ -122,8 +160,64 @@ class Node(Object):
         if self.is_dead:
             err([], {'ex':"ERROR: Node was already dead!"})
             
+        self.doc.release_tokens(self)
         self.is_dead = True
-        self.tokens = self.children = self.embedding = None
+        self.tokens = self.embedding = None     # 'children' is None once dead
+        self.tokens_changed()
+        self.doc.tree_changed()
+
+
+    ############################################################################
+    # Views onto the Document's TreeArrays
+
+    @property
+    def parent(self):
+        arrays = self.doc.tree_arrays
+        p = arrays.parent[self.i]
+        if p < 0:
+            return None
+        return arrays.nodes[p]
+
+
+    @parent.setter
+    def parent(self, node):
+        if node is None:
+            self.doc.tree_arrays.unlink(self.i)
+        else:
+            self.doc.tree_arrays.link(node.i, self.i)
+        self.doc.tree_changed()
+
+
+    @property
+    def children(self):
+        """
+        A new list of the children, in order (None if this Node is dead)
+        """
+        if self.is_dead:
+            return None
+        arrays = self.doc.tree_arrays
+        nodes  = arrays.nodes
+        return [ nodes[c] for c in arrays.children(self.i) ]
+
+
+    def get(self, key):
+        """
+        Get an option value (None if unset).  The ID is kept in the TreeArrays.
+        """
+        if key == 'ID':
+            return self.doc.tree_arrays.ids[self.i]
+        if self._value_ is None:
+            return None
+        return self._value_.get(key)
+
+
+    def set(self, key, val):
+        if key == 'ID':
+            self.doc.tree_arrays.ids[self.i] = val
+            return
+        if self._value_ is None:
+            self._value_ = {}
+        self._value_[key] = val
         
                 
     def __repr__(self):
@@ -160,14 +254,15 @@ class Node(Object):
             for n in node:
                 self.adopt(n)
         else:
-            if node in self.children:
+            arrays = self.doc.tree_arrays
+            if arrays.parent[node.i] == self.i:
                 return
             if node == self:
                 return
             if verbose:
                 err([self, "adopts:", node])
-            node.parent = self
-            self.children.append(node)
+            arrays.link(self.i, node.i)
+            self.doc.tree_changed()
     
 
     def disown(self, node):
@@ -175,12 +270,48 @@ class Node(Object):
         Break both sides of parent-child relationship.  'self' is parent
         """
         verbose = False
-        self.children.remove(node)
-        node.parent = None
+        arrays = self.doc.tree_arrays
+        if arrays.parent[node.i] != self.i:
+            err([self, node], {'ex':"Node to disown is not a child"})
+        arrays.unlink(node.i)
+        self.doc.tree_changed()
         if verbose:
             err([self, "disowns:", node])
         
         
+    def claim_tokens(self, tokens):
+        """
+        Add <tokens> to this Node and record it as their owner in the Document's token index
+        """
+        self.tokens.extend(tokens)
+        self.doc.set_token_owner(tokens, self)
+        self.tokens_changed()
+
+
+    def tokens_changed(self):
+        """
+        Called by every operation that changes the tokens of this Node.  Discards the cached TokenAttributes, and (as for a change of
+        shape) anything remembered about the trees.
+        """
+        self.doc.tree_changed()
+        if self._attrs_ is not None:
+            self._attrs_ = None
+            attribute_stats['invalidations'] += 1
+
+
+    def get_token_attributes(self):
+        """
+        The TokenAttributes of this Node (computed once until its tokens change)
+        """
+        attrs = self._attrs_
+        if attrs is None:
+            attrs = self._attrs_ = TokenAttributes(self)
+            attribute_stats['misses'] += 1
+        else:
+            attribute_stats['hits'] += 1
+        return attrs
+
+
     def absorb(self, node, verbose=False):
         """
         Merge one Node with another.  Afterwards, nothing should link to 'node', only to 'self'
@@ -242,7 +373,7 @@ class Node(Object):
             return
         
         self.parent.disown(node)               # Cut old parental ties
-        self.tokens.extend(node.tokens)        # Make sure to pull in the other tokens since they match actual spans
+        self.claim_tokens(node.tokens)         # Make sure to pull in the other tokens since they match actual spans
         self.adopt(node.children)              # Adopt their children (if any)
         node.kill()
         
@@ -265,7 +396,7 @@ class Node(Object):
         """
         parent = node.parent               # Might be self
         parent.disown(node)                # Separate child from old parent
-        self.tokens.extend(node.tokens)    # Absorb their tokens
+        self.claim_tokens(node.tokens)     # Absorb their tokens
         self.adopt(node.children)          # Adopt their children
         node.kill()
 
@@ -281,15 +412,16 @@ class Node(Object):
             node = self.parent
             self.doc.disown(node)              # take parent out of the list of doc.trees
             self.doc.adopt(self)               # add self to that list
-            self.tokens.extend(node.tokens)    # Absorb node's tokens
+            self.claim_tokens(node.tokens)     # Absorb node's tokens
             self.adopt(node.children)          # Adopt node's children (ignores self, of course)
             self.parent = None                        # self is the new root
+            self.doc.tree_changed()
             
         else:
             node = self.parent
             grandparent = node.parent          # grandparent of self is new parent
             grandparent.disown(node)
-            self.tokens.extend(node.tokens)    # Absorb node's tokens
+            self.claim_tokens(node.tokens)     # Absorb node's tokens
             self.adopt(node.children)          # Adopt node's children (ignores self, of course)
             grandparent.adopt(self)            # New parental relationship with grandparent
             node.kill()
@@ -313,7 +445,7 @@ class Node(Object):
         """
         old_parent = node.parent
         old_parent.disown(node)                # Cut old parental ties
-        self.tokens.extend(node.tokens)        # Absorb their tokens
+        self.claim_tokens(node.tokens)         # Absorb their tokens
         self.adopt(node.children)              # Adopt their children (if any)
         node.kill()
 
@@ -622,6 +754,11 @@ class Node(Object):
             pass
         node.tokens = orig_tokens
 
+        self.doc.set_token_owner(self.tokens, self)
+        self.doc.set_token_owner(node.tokens, node)
+        self.tokens_changed()
+        node.tokens_changed()
+
     
     def delegate_to_negation(self, options={}):
         """
@@ -701,13 +838,13 @@ class Node(Object):
     ############################################################################
     
     def is_root(self):
-        if self.parent is None:
+        if self.doc.tree_arrays.parent[self.i] < 0:
             return True
         return False
         
             
     def is_leaf(self):
-        if len(self.children) == 0:
+        if self.doc.tree_arrays.first_child[self.i] < 0:
             return True
         return False
 
@@ -726,15 +863,19 @@ class Node(Object):
         """
         Does node have at least one child?
         """
-        if len(self.children) > 0:
+        if self.doc.tree_arrays.first_child[self.i] >= 0:
             return True
         return False
         
 
     def is_ancestor(self, node):
         """
-        Is <node> an ancestor?
+        Is <node> an ancestor?  Answered by the Document's TreeIndex if it is up to date, else by climbing toward the root.
         """
+        index = self.doc.current_tree_index()
+        if index is not None  and  self in index  and  node in index:
+            return index.is_ancestor(node, self)
+
         focus = self
         while focus:
             if focus.parent == node:
@@ -746,16 +887,11 @@ class Node(Object):
 
     def is_descendant(self, node):
         """
-        is <node> a descendant of self?
+        is <node> a descendant of self?  (i.e. am I one of its ancestors?)
         """
-        if self.is_child(node):       # Base case
-            return True
-
-        for child in self.children:   # Recursion
-            if child.is_descendant(node):
-                return True
-
-        return False   # After testing self and each child, node is not a descendant
+        if node is None:
+            return False
+        return node.is_ancestor(self)
     
     ############################################################################
     # Access
@@ -902,12 +1038,16 @@ class Node(Object):
 
     def node_of_token(self, token):
         """
-        Starts at ROOT!
+        Given a token, find the Node to which it currently belongs. There can only be one.  Only Nodes in the same tree as this one
+        are considered.
 
-        Given a token, find the Node to which it currently belongs. There can only be one.
+        The owner comes straight from the Document's token index.
         """
-        root = self.get_root()
-        node = root.node_with_token(token)
+        if token is None:
+            return None
+        node = self.doc.get_node_of_token(token)
+        if node is None  or  node.get_root() is not self.get_root():
+            return None
         return node
 
 
@@ -939,38 +1079,20 @@ class Node(Object):
         return texts
 
 
-    def get_lemmas(self, options={'picky':True}):
+    def get_lemmas(self, options=None):
         """
         Get a string representing, in tree order, the tokens comprising this Node
 
-        Can be choosy if self has multiple tokens
+        Can be choosy if self has multiple tokens (options 'picky').  Without options, all lemmas, from the cached TokenAttributes.
 
         """
-        if len(self.tokens) == 1:
-            options['picky'] = False
-        
-        lemmas = []
-        try:
-            for token in self.tokens:
-                if options.get('picky'):
-                    if token.pos_ in ['PUNCT', 'DET']:
-                        continue
-                if re.search(r'^-[A-Z]+-$', token.lemma_):
-                    lemmas.append(token.text.lower())
-                else:
-                    lemmas.append(token.lemma_)
-        except:
-            pass
-
-        if len(lemmas) == 0:  # Try again, but accept all
-            if not options.get('last_chance'):
-                return self.get_lemmas(options={'picky':False, 'last_chance':True})
-        
-        return lemmas
+        if options is None:
+            return list(self.get_token_attributes().lemmas)
+        return token_lemmas(self.tokens or [], picky=options.get('picky'))
 
 
     def get_lemmas_str(self):
-        return ' '.join(self.get_lemmas())
+        return self.get_token_attributes().lemmas_str
 
 
     def ner_by_token(self, token):
@@ -984,19 +1106,13 @@ class Node(Object):
     
 
     def has_lemma(self, lemma_set):
-        verbose = False
-        self_lemmas = set(self.get_lemmas())
-        insec = self_lemmas.intersection(lemma_set)
-        if verbose:  err([self_lemmas, lemma_set, insec])
-        if len(insec) > 0:
-            return True
-        return False
+        return not self.get_token_attributes().lemma_set.isdisjoint(lemma_set)
 
     
     def has_child_lemmas(self, lemmas):
         child_lemmas = set([])
         for child in self.children:
-            child_lemmas.update(child.get_lemmas())
+            child_lemmas.update(child.get_token_attributes().lemma_set)
         for lemma in lemmas:
             if lemma not in child_lemmas:
                 return False
@@ -1016,17 +1132,11 @@ class Node(Object):
         Get the part of speech (could be multiple)
 
         """
-        pos = []
-        try:
-            for token in self.tokens:
-                pos.append(token.pos_)
-        except:
-            pass
-        return pos
+        return list(self.get_token_attributes().pos)
 
 
     def get_pos_str(self):
-        return ' '.join(self.get_pos())
+        return self.get_token_attributes().pos_str
 
 
     def get_all_pos(self):
@@ -1042,12 +1152,7 @@ class Node(Object):
             
 
     def has_pos(self, pos_set):
-        self_pos = set(self.get_pos())
-        insec = self_pos.intersection(pos_set)
-
-        if len(insec) > 0:
-            return True
-        return False
+        return not self.get_token_attributes().pos_set.isdisjoint(pos_set)
 
     
     def get_ner(self):
@@ -1055,14 +1160,7 @@ class Node(Object):
         Get the part of speech (could be multiple)
 
         """
-        ner = []
-        try:
-            for token in self.tokens:
-                if token.ent_type > 0:
-                    ner.append(token.ent_type_)
-        except:
-            pass
-        return ner
+        return list(self.get_token_attributes().ner)
 
 
     def get_all_ner(self):
@@ -1082,13 +1180,7 @@ class Node(Object):
         Get the dependency relation type (could be multiple)
 
         """
-        dep = []
-        try:
-            for token in self.tokens:
-                dep.append(token.dep_)
-        except:
-            pass
-        return sorted(dep)
+        return list(self.get_token_attributes().dep)
 
 
     def get_dep_str(self):
@@ -1096,16 +1188,11 @@ class Node(Object):
         A simple str representation of the dependency type
 
         """
-        deps = self.get_dep()
-        return ' ' .join( sorted(deps) )
+        return self.get_token_attributes().dep_str
     
     
     def has_dep(self, dep_set):
-        self_deps = set(self.get_dep())
-        insec = self_deps.intersection(dep_set)
-        if len(insec) > 0:
-            return True
-        return False
+        return not self.get_token_attributes().dep_set.isdisjoint(dep_set)
 
 
     def get_all_dep(self):
@@ -1121,7 +1208,7 @@ class Node(Object):
             
 
     def is_verb(self):
-        if 'VERB' in self.get_pos():
+        if 'VERB' in self.get_token_attributes().pos_set:
             return True
         if self.is_root():
             if self.has_lemma(ROOT_VERBS):
@@ -1130,7 +1217,7 @@ class Node(Object):
 
 
     def is_noun(self):
-        if 'NOUN' in self.get_pos():
+        if 'NOUN' in self.get_token_attributes().pos_set:
             return True
         return False
 
@@ -1141,12 +1228,7 @@ class Node(Object):
         """
         if node is None:
             return False
-        s      = set(self.get_pos())
-        other  = set(node.get_pos())
-        insec  = s.intersection(other)
-        if len(insec) > 0:
-            return True
-        return False
+        return not self.get_token_attributes().pos_set.isdisjoint( node.get_token_attributes().pos_set )
 
     
     def get_entity_type(self):
@@ -1192,17 +1274,7 @@ class Node(Object):
         str
 
         """
-        position = 'O'
-        try:
-            for token in self.tokens:
-                iob = self.iob_by_token(token)
-                if iob == 'B':
-                    position = 'B'
-                if iob == 'I'  and  position == 'O':
-                    position = 'I'
-        except:
-            pass
-        return position
+        return self.get_token_attributes().entity_position
 
 
     def get_entity_beginners(self):
@@ -1220,17 +1292,15 @@ class Node(Object):
         return beginners
 
         
+    @memoized(depends=lambda node: node.doc.tree_version)
     def get_supporting_tokens(self):
         """
         Find all tokens in this subtree, including this Node
         """
-        if not self.done():   # perform once
-            tokens = set(self.tokens)
-            for child in self.children:
-                tokens.update( child.get_supporting_tokens() )
-            self.set('supporting_tokens', tokens)
-
-        return self.get('supporting_tokens')
+        tokens = set(self.tokens)
+        for child in self.children:
+            tokens.update( child.get_supporting_tokens() )
+        return tokens
     
 
     def get_supporting_text(self):
@@ -1333,14 +1403,23 @@ class Node(Object):
         return nodes
 
 
-    def get_negations(self):
+    def is_negation(self):
         """
-        From each of the constituent trees, return a list of all nodes that are conjunctions from the set (and, or)
+        Determine if a Node is a negation from the set (not, no, neither, nor), in a role where its arguments can be delegated to it
         """
-        nodes = []
         if self.has_lemma( set(["not", "no", "neither", "nor"]) ) \
           and  self.has_dep( set(['preconj', 'cc', 'neg', 'det']) ) \
           and  self.has_pos( set(['CCONJ', 'ADV', 'DET']) ):
+            return True
+        return False
+
+
+    def get_negations(self):
+        """
+        From each of the constituent trees, return a list of all nodes that are conjunctions from the set (and, or)
+        """
+        nodes = []
+        if self.is_negation():
             nodes = [self]
         
         for child in self.children:
@@ -1468,6 +1547,9 @@ class Node(Object):
         """
         Number of links to root
         """
+        index = self.doc.current_tree_index()
+        if index is not None  and  self in index:
+            return index.get_depth(self)
         if self.is_root():
             return 0
         else:
@@ -1541,50 +1623,31 @@ class Node(Object):
         return False
 
 
-    def get_graph_distance(self, node, done=set([])):
+    def get_graph_distance(self, node, done=None):
         """
-        Recursively find the number of steps from self to 'node', within the same tree.  Go in both directions (up and down the tree)
-        simultaneously.  Use 'done' to prevent duplicate work.
+        Find the number of steps from self to 'node', within the same tree, via their lowest common ancestor (see TreeIndex)
 
         Parameters
         ----------
         node : Node
     
-        done : set of Nodes
+        done : ignored (formerly the set of nodes already searched)
 
         Returns
         -------
-        int
+        int, or None if 'node' is in another tree
 
         """
-        # Base cases
         if node == self:
             return 0
+        return self.doc.get_tree_index().distance(self, node)
 
-        if self.is_root():
-            branches = set([])
-        else:
-            branches = set([self.parent])
-            
-        for child in self.children:
-            branches.add(child)
-            
-        branches = branches - done   # Remove already-searched nodes
-        done     = branches | done   # Keep track of scheduled work
-        
-        lowest_d = None
-        for b in branches:
-            d = b.get_graph_distance(node, done)
-            if d is None:
-                continue
-            d += 1  # must add one to the recursive computation
-            
-            if lowest_d is None:
-                lowest_d = d
-            elif d < lowest_d:
-                lowest_d = d
 
-        return lowest_d
+    def get_lowest_common_ancestor(self, node):
+        """
+        The lowest Node having both self and 'node' in its subtree (might be either of them), or None if they are in different trees
+        """
+        return self.doc.get_tree_index().lca(self, node)
         
     
     # End Access
@@ -1635,31 +1698,9 @@ class Node(Object):
         Returns
         -------
         numpy array
-            Represents the state of this Node with respect to POS, NER, and Dependencies
+            Represents the state of this Node with respect to POS, NER, and Dependencies:  [dep | pos | ner] multi-hot
         """
-        vector = None
-
-        dep_str = self.get_dep_str()   # Could be a string with multiple dep types
-        if dep_str == 'PUNCT'  and  self.is_leaf():
-            pass
-
-        else:
-            # Get each part of the embedding
-            dep = self.get_dep_embedding()
-            pos = self.get_pos_embedding()
-            ner = self.get_ner_embedding()
-            c = np.concatenate([dep, pos, ner])
-
-            if vector is None:
-                vector = c
-            else:
-                vector = np.maximum.reduce([vector, c])  # binary OR: maintain sparse vector
-
-        if vector is None:  # For cases such as leaf punctuation
-            dep    = self.get_empty_dep_embedding()
-            pos    = self.get_empty_pos_embedding()
-            ner    = self.get_empty_ner_embedding()
-            vector = np.concatenate([dep, pos, ner])
+        vector = role_vectors([self])[0]
 
         if options.get('as_float'):
             vector = vector.astype(float).tolist()
@@ -1667,10 +1708,25 @@ class Node(Object):
         return vector
 
 
+    def get_role_ids(self):
+        """
+        Indices of the nonzero elements of this Node's role vector
+        """
+        if self.get_dep_str() == 'PUNCT'  and  self.is_leaf():
+            return []
+        ids  = dep_encoder.ids(self.get_dep())
+        ids += [ len(dep_encoder) + i for i in pos_encoder.ids(self.get_pos()) ]
+        ids += [ len(dep_encoder) + len(pos_encoder) + i for i in ner_encoder.ids(self.get_ner()) ]
+        return ids
+
+
     def get_pos_embedding(self, vocab=default.get('pos_embedding'), options={}):
         """
         Return a vectorized representation of the POS of this Node
         """
+        if vocab is default.get('pos_embedding'):
+            return pos_encoder.encode(self.get_pos())         # Same vector, built by index
+
         pos_vector = None
         for pos in self.get_pos():
             if pos_vector is None:
@@ -1692,6 +1748,9 @@ class Node(Object):
         """
         Return a vectorized representation of the NER of this Node
         """
+        if vocab is default.get('ner_embedding'):
+            return ner_encoder.encode(self.get_ner())         # Same vector, built by index
+
         ner_vector = None
         for ner in self.get_ner():
             if ner_vector is None:
@@ -1713,6 +1772,9 @@ class Node(Object):
         """
         Return a vectorized representation of the DEP of this Node
         """
+        if vocab is default.get('dep_embedding'):
+            return dep_encoder.encode(self.get_dep())         # Same vector, built by index
+
         dep_vector = None
 
         for dep in self.get_dep():
@@ -1731,75 +1793,26 @@ class Node(Object):
         return vocab['_empty_']
     
 
-    def embed(self, vocab):
+    def embed(self, vocab, resolver=None):
         """
-        Given some vocab (embedding) produce a vector that represents this node
+        Given some vocab (embedding) produce a vector that represents this node, and each of its descendants.  All are looked up
+        together (see embedding_resolver.py), by the resolver of the Document (see Document.get_resolver).
 
-        """
-        verbose = False
-        found_embedding = False
+        Parameters
+        ----------
+        vocab : dict { lemma string -> vector }
 
-        # First try full lemma string
-        lemmas_str = self.get_lemmas_str()
-        lemmas_str = re.sub(r' - ', '-', lemmas_str)
-        lemmas_str = re.sub(r' ', '_', lemmas_str)
-        lemmas_str = re.sub(r'_+', '_', lemmas_str)
-        vec = vocab.get(lemmas_str)
-        
-        if vec is not None:
-            if verbose: print("Found vector for: %s"% lemmas_str)
-            self.embedding = vec
-            found_embedding = True
-        elif verbose: print("NO vector for: %s"% lemmas_str)
-
-        # Remove hyphens
-        if not found_embedding  and  is_non_numeric(lemmas_str):
-            if re.search(r'-', lemmas_str):
-                lemmas_str = re.sub(r'-', '', lemmas_str)
-                lemmas_str = re.sub(r'_+', '_', lemmas_str)
-                vec = vocab.get(lemmas_str)
-                if vec is not None:
-                    if verbose: print("Found vector for: %s"% lemmas_str)
-                    self.embedding = vec
-                    found_embedding = True
-                elif verbose: print("NO vector for: %s"% lemmas_str)
-
-        # Remove underscores
-        if not found_embedding  and  is_non_numeric(lemmas_str):
-            if re.search(r'_', lemmas_str):
-                lemmas_str = re.sub(r'_', '', lemmas_str)
-                vec = vocab.get(lemmas_str)
-                if vec is not None:
-                    if verbose: print("Found vector for: %s"% lemmas_str)
-                    self.embedding = vec
-                    found_embedding = True
-                elif verbose: print("NO vector for: %s"% lemmas_str)
-
-        # Use an averaging of as many vectors as available            
-        if not found_embedding  and  len(self.get_lemmas()) > 1:
-            lemmas = self.get_lemmas()
-            if verbose:
-                print("Found nothing for: %s ... Trying an average ..."% lemmas)
-            self.embedding, found_embedding = average_of_word_embeddings(lemmas, vocab)
-
-        # Try averaging with original text
-        if not found_embedding:
-            texts = self.get_texts()
-            self.embedding, found_embedding = average_of_word_embeddings(texts, vocab)
-
-        # No embedding found
-        if not found_embedding:
-            self.embedding = default.get('empty_embedding')
-            """
-            if re.search(r'[a-zA-Z]', self.get_text()):
-                if is_non_numeric(self.get_text()):
-                    print("\nEMPTY EMBEDDING: [%s]"% self.get_lemmas_str(), self.get_text())
-            """
-            
-        # Recursive application
-        if self.children is not None:
-            for child in self.children:
-                child.embed(vocab)
+        resolver : EmbeddingResolver (optional)
+            For <vocab>, to share lookups with other Documents
+
+        Returns
+        -------
+        numpy array : the embeddings, one row per Node of this subtree, in pre-order
+
+        """
+        arrays = self.doc.tree_arrays
+        nodes  = [ arrays.nodes[i] for i in arrays.pre_order([self.i]) ]
+        return self.doc.get_resolver(vocab, resolver).embed(nodes)
             
 
     def cosine_similarity(self, node):
@@ -2146,7 +2159,8 @@ def combined_lemmas_in_vocab(vocab, lemmas_str_A, lemmas_str_B):
 
 def get_group_ancestor(nodes):
     """
-    For a given set of nodes (from same Document), find the lowest ancestor of all nodes.  It may be a member of 'nodes'
+    For a given set of nodes (from same Document), find the lowest ancestor of all nodes.  It may be a member of 'nodes'.  If the nodes
+    are spread over several trees, the root of the shallowest node's tree is returned.
 
     Parameters
     ----------
@@ -2156,29 +2170,10 @@ def get_group_ancestor(nodes):
     -------
     Node
     """
-    nodes_copy = []
-    nodes_copy.extend(nodes)
-    sorted_nodes  = sorted(nodes, key=lambda x: x.get_depth())
-    first_node    = None
-    
-    for i in sorted_nodes:
-        if first_node is None:
-            first_node = i
-        if i.is_root():
-            return i
-        
-        is_the_ancestor = True
-        for j in nodes_copy:
-            if i != j:
-                if not i.is_descendant(j):
-                    is_the_ancestor = False
-
-        if is_the_ancestor:
-            return i
-
-    # No ancestor was found. Add a parent an recurse
-    nodes.add(first_node.parent)
-    return get_group_ancestor(nodes)
+    nodes = list(nodes)
+    if len(nodes) == 0:
+        return None
+    return nodes[0].doc.get_tree_index().group_ancestor(nodes)
 
 
 def is_non_numeric(a):
@@ -2248,6 +2243,126 @@ def token_is_prunable(token, options={}):
     return False
 
 
+def prunable_array(spacy_doc, parent):
+    """
+    token_is_prunable() for every token at once, and which tokens have any non-whitespace text.  Each distinct word is only tested once.
+
+    Parameters
+    ----------
+    spacy_doc : spacy.Doc
+
+    parent : numpy array of int
+        The spaCy parse:  head of each token, -1 for roots
+
+    Returns
+    -------
+    (prunable, nonspace) : pair of numpy arrays of boolean
+
+    """
+    values = spacy_doc.to_array([ORTH, POS]).reshape((-1, 2))
+    unique, inverse = np.unique(values[:,0], return_inverse=True)
+    texts    = [ spacy_doc.vocab.strings[int(orth)] for orth in unique ]
+    alnum    = np.array([ re.search(r'[a-z0-9]', text) is not None for text in texts ], dtype=bool)[inverse]
+    nonspace = np.array([ re.search(r'\S', text) is not None for text in texts ], dtype=bool)[inverse]
+    is_leaf  = np.bincount(parent[parent >= 0], minlength=len(parent)) == 0
+    prunable = is_leaf  &  ~alnum  &  (values[:,1] == PUNCT)
+    return prunable, nonspace
+
+
+def build_trees(doc):
+    """
+    Build all the Node trees of a Document at once from the arrays of its spaCy parse, without recursion:  the same trees (and IDs) as
+    building a Node for each sentence root, each of which builds Nodes for the token-children that are neither prunable nor whitespace.
+
+    Parameters
+    ----------
+    doc : Document
+
+    Returns
+    -------
+    array of Node, the root of each sentence
+
+    """
+    spacy_doc = doc.spacy_doc
+    n = len(spacy_doc)
+    arrays = doc.tree_arrays = TreeArrays(n)
+    if n == 0:
+        return []
+    roots = [ sen.root.i for sen in spacy_doc.sents ]
+
+    head   = head_array(spacy_doc)
+    parent = np.where(head == np.arange(n), -1, head).astype(np.int32)
+    prunable, nonspace = prunable_array(spacy_doc, parent)
+    rank   = sibling_ranks(parent)                     # Position among the spaCy children, pruned ones included (used in IDs)
+    parent[roots] = -1                                 # Each sentence root heads its own tree
+    depth  = arrays.depth = depth_array(parent)
+
+    # Which tokens get a Node:  the sentence roots, then, level by level, each non-prunable, non-whitespace token under a Node that
+    # has tokens
+    is_node = np.zeros(n, dtype=bool)
+    is_node[roots] = True
+    order  = np.argsort(depth, kind='stable')
+    bounds = np.flatnonzero(np.diff(depth[order])) + 1
+    for level in np.split(order, bounds)[1:]:
+        level = level[ parent[level] >= 0 ]
+        up = parent[level]
+        is_node[level] = ~prunable[level]  &  nonspace[level]  &  is_node[up]  &  nonspace[up]
+
+    # Links, owners and IDs
+    arrays.set_links( np.where(is_node, parent, -1) )
+    owned = np.flatnonzero(is_node & nonspace)
+    arrays.owner[owned] = owned
+
+    ids = arrays.ids
+    for k, r in enumerate(roots):
+        ids[r] = 'root.T' + str(k)
+    parent_list, rank_list, has_text = parent.tolist(), rank.tolist(), nonspace.tolist()
+    for i in order[ is_node[order] ].tolist():
+        p = parent_list[i]
+        if p >= 0:
+            ids[i] = ids[p] + '.' + str(rank_list[i])
+        Node(doc, i, [ spacy_doc[i] ] if has_text[i] else [])
+
+    return [ arrays.nodes[r] for r in roots ]
+
+
+def token_lemmas(tokens, picky=True):
+    """
+    Lemmas of <tokens>, in order:  the lowercased text instead of placeholder lemmas like '-PRON-'.  If <picky> (and there are several
+    tokens), punctuation and determiners are left out, unless nothing else would be left.
+
+    Returns
+    -------
+    array of str
+
+    """
+    if len(tokens) == 1:
+        picky = False
+
+    lemmas = []
+    for token in tokens:
+        if picky  and  token.pos_ in ['PUNCT', 'DET']:
+            continue
+        if PLACEHOLDER_LEMMA.search(token.lemma_):
+            lemmas.append(token.text.lower())
+        else:
+            lemmas.append(token.lemma_)
+
+    if len(lemmas) == 0  and  picky:   # Try again, but accept all
+        return token_lemmas(tokens, picky=False)
+    return lemmas
+
+
+def attribute_cache_stats():
+    """
+    Hits, misses and invalidations of the per-Node TokenAttributes caches (since the start of the process), and the hit rate
+    """
+    stats = dict(attribute_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = float(stats['hits']) / lookups if lookups > 0 else 0.0
+    return stats
+
+
 def num_prepositionals(nodes):
     """
     Number of nodes which are prepositional
@@ -2259,6 +2374,28 @@ def num_prepositionals(nodes):
     return preps
     
     
+def role_vectors(nodes, options={}):
+    """
+    Role vectors (see Node.get_role_vector) for a batch of nodes, filled into one preallocated matrix
+
+    Parameters
+    ----------
+    nodes : list of Node
+
+    Options
+    -------
+    sparse : boolean
+        Return a scipy.sparse CSR matrix
+
+    Returns
+    -------
+    (len(nodes), len(dep_indices) + len(pos_indices) + len(ner_indices)) matrix of int
+
+    """
+    size = len(dep_encoder) + len(pos_encoder) + len(ner_encoder)
+    return multi_hot([ node.get_role_ids() for node in nodes ], size, options)
+
+
 ################################################################################
 # MAIN
 
@@ -2,10 +2,18 @@
 
     Using these Objects as superclasses will help produce cleaner, simpler code.
 
+    Methods whose results should be computed once per object can be decorated with @memoized (see below), optionally with a function
+    giving a "stamp" (e.g. a version number) on which the result depends:
+
+        @memoized(depends=lambda node: node.doc.tree_version)
+        def get_supporting_tokens(self):
+            ...
+
 """
 import sys, os, re
 import argparse
 import types
+import functools
 
 from .utils import mkdir, err, isTrue
 
@@ -15,6 +23,49 @@ from .utils import mkdir, err, isTrue
 default = {
     }
 
+################################################################################
+# FUNCTIONS
+
+def memoized(depends=None):
+    """
+    Decorator:  remember the result of a method, per object (and per argument values, which must be hashable).
+
+    Results are kept in the object's '_memo_' dict under a key made once, when the method is decorated.  A result is reused until it is
+    cleared (see Object.clear_memo), or, if <depends> is given, until depends(object) returns a different value from when the result
+    was computed.
+
+    Parameters
+    ----------
+    depends : function(object) -> any, or None
+
+    Returns
+    -------
+    function : decorator.  The decorated method has a 'memo_key' attribute.
+
+    """
+    def decorate(method):
+        key = '_MEMO_' + method.__name__
+
+        @functools.wraps(method)
+        def wrapper(self, *args):
+            memo = getattr(self, '_memo_', None)
+            if memo is None:
+                memo = self._memo_ = {}
+            entry_key = (key, args) if args else key
+            stamp = None if depends is None else depends(self)
+            entry = memo.get(entry_key)
+            if entry is not None  and  entry[0] == stamp:
+                return entry[1]
+            value = method(self, *args)
+            memo[entry_key] = (stamp, value)
+            return value
+
+        wrapper.memo_key = key
+        return wrapper
+
+    return decorate
+
+
 ################################################################################
 # OBJECTS
 
@@ -23,7 +74,12 @@ class Object(object):
     A custom subclass of object to assist in the handling of options within code and
     to result in cleaner code overall
 
+    Declares no slots of its own, so that a subclass declaring __slots__ (e.g. Node) has no per-instance __dict__.  Subclasses that
+    don't declare __slots__ get a __dict__ as usual.
+
     """
+    __slots__ = ()
+
     def __init__(self, options=None):
         """
         Instantiate the object and set options
@@ -218,9 +274,26 @@ class Object(object):
         return config
 
     
+    def clear_memo(self, *methods):
+        """
+        Forget the results remembered by @memoized methods of this object:  for the named <methods> (str), or for all if none given
+        """
+        memo = getattr(self, '_memo_', None)
+        if not memo:
+            return
+        if len(methods) == 0:
+            memo.clear()
+            return
+        keys = set( '_MEMO_' + name for name in methods )
+        for entry_key in list(memo.keys()):
+            if (entry_key[0] if isinstance(entry_key, tuple) else entry_key) in keys:
+                del memo[entry_key]
+
+
     def done(self):
         """
-        Used to make sure that a given function is only called once or a limited number of times.
+        Used to make sure that a given function is only called once or a limited number of times.  (For remembering results, see
+        @memoized, which is much cheaper.)
 
         Returns
         -------
@@ -0,0 +1,259 @@
+""" parse_cache.py
+
+    Persistent cache of spaCy parses, so that the same text is never run through the model twice (e.g. SQuAD contexts repeated for
+    every question, or the same corpus across experiments).
+
+    Each entry holds the parsed Doc (as a serialized DocBin) and the 'ner' dict made by nlp.generate_spacy_data().  Entries are keyed by
+    a hash of the (already normalized) text together with a signature of the model, its version and the pipeline, and are stored one
+    file per entry in 256 shard directories.
+
+    Concurrency:  entries are written to a temporary file and atomically renamed into place, so readers in other processes see either
+    nothing or a whole entry.  Eviction (least recently used first, when the cache grows past 'max_bytes') is done by one process at a
+    time, under a lock file, and readers treat an entry that vanishes underneath them as a miss.
+
+    Usage:
+
+        export GM_PARSE_CACHE=~/.cache/gmutils/parses       # nlp.py then uses a cache in this directory
+
+"""
+import os, sys, re
+import time
+import hashlib
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from spacy.tokens import DocBin
+
+from gmutils import serialization
+from gmutils.utils import err, mkdir
+
+################################################################################
+# CONFIG
+
+default = {
+    'max_bytes'  : 1 << 30,         # Evict least recently used entries beyond this total size
+    'low_water'  : 0.9,             # Eviction stops once the cache is down to this fraction of 'max_bytes'
+    'rescan'     : 0.02,            # Rescan the directory after this process has written this fraction of 'max_bytes'
+    'signature'  : '',              # Identifies the model/pipeline.  Entries from a different signature are never returned.
+}
+
+SUFFIX   = '.parse'
+LOCKFILE = '.evict.lock'
+STALE    = 3600                     # Seconds after which an orphaned temporary file may be removed
+
+# Token attributes kept for each Doc.  Sentence boundaries are recovered from HEAD (the parser honors the corrected sentence starts).
+ATTRS = ['ORTH', 'LEMMA', 'TAG', 'POS', 'HEAD', 'DEP', 'ENT_IOB', 'ENT_TYPE']
+
+################################################################################
+# FUNCTIONS
+
+def pipeline_signature(nlp, extra=''):
+    """
+    A string identifying a spaCy pipeline:  model name and version, spaCy version, and the names of the pipeline components
+    """
+    import spacy
+    meta = getattr(nlp, 'meta', {}) or {}
+    parts = [ str(meta.get('lang')), str(meta.get('name')), str(meta.get('version')), spacy.__version__, ','.join(nlp.pipe_names), extra ]
+    return '|'.join(parts)
+
+
+################################################################################
+# OBJECTS
+
+class ParseCache(object):
+    """
+    On-disk cache of (spaCy Doc, ner dict) keyed by text
+
+    Attributes
+    ----------
+    directory : str
+
+    signature : str
+
+    stats : dict
+        Counts of hits, misses, writes and evictions by this process
+
+    """
+    def __init__(self, directory, options={}):
+        """
+        Parameters
+        ----------
+        directory : str
+
+        Options
+        -------
+        max_bytes : int
+
+        low_water : float
+
+        rescan : float
+
+        signature : str
+            See pipeline_signature()
+
+        """
+        self.directory  = os.path.expanduser(directory)
+        self.max_bytes  = options.get('max_bytes') or default['max_bytes']
+        self.low_water  = options.get('low_water') or default['low_water']
+        self.signature  = options.get('signature') or default['signature']
+        self.rescan     = options.get('rescan') or default['rescan']
+        self.size       = None                                    # Estimated total size (None: not yet scanned)
+        self.unscanned  = 0                                       # Bytes written by this process since the last scan
+        self.stats      = { 'hits':0, 'misses':0, 'writes':0, 'evicted':0 }
+        mkdir(self.directory)
+
+
+    def key(self, text):
+        h = hashlib.sha1()
+        h.update(self.signature.encode('utf-8'))
+        h.update(b'\0')
+        h.update(text.encode('utf-8'))
+        return h.hexdigest()
+
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key + SUFFIX)
+
+
+    def get(self, text, vocab):
+        """
+        Look up the parse of <text>
+
+        Parameters
+        ----------
+        text : str
+
+        vocab : spaCy Vocab
+            The vocab of the pipeline that would otherwise parse <text>
+
+        Returns
+        -------
+        (spaCy Doc, dict) or None
+
+        """
+        path = self.path(self.key(text))
+        try:
+            entry = serialization.load(path)
+            os.utime(path)                                        # Mark as recently used
+        except (OSError, ValueError, EOFError):                   # Absent, evicted meanwhile, or unreadable
+            self.stats['misses'] += 1
+            return None
+
+        if entry.get('text') != text  or  entry.get('signature') != self.signature:
+            self.stats['misses'] += 1                             # Hash collision (or a foreign entry): treat as a miss
+            return None
+
+        spacy_doc = list(DocBin().from_bytes(entry['doc']).get_docs(vocab))[0]
+        self.stats['hits'] += 1
+        return spacy_doc, entry['ner']
+
+
+    def put(self, text, spacy_doc, ner):
+        """
+        Store the parse of <text>
+        """
+        key  = self.key(text)
+        path = self.path(key)
+        docbin = DocBin(attrs=ATTRS)
+        docbin.add(spacy_doc)
+        entry = { 'text':text, 'signature':self.signature, 'doc':docbin.to_bytes(), 'ner':ner }
+
+        try:
+            mkdir(os.path.dirname(path))
+            serialization.dump(entry, path)
+        except OSError as e:
+            err([path], {'exception':e, 'level':0, 'warning':True})  # A full or read-only disk should not stop the parsing
+            return
+        self.stats['writes'] += 1
+
+        # Other processes write too, so the size estimate is refreshed by a directory scan after every 'rescan' fraction of max_bytes
+        written = os.path.getsize(path)
+        self.unscanned += written
+        if self.size is None  or  self.unscanned > self.rescan * self.max_bytes:
+            self.size = self.scan_size()
+            self.unscanned = 0
+        else:
+            self.size += written
+        if self.size > self.max_bytes:
+            self.evict()
+
+
+    def entries(self):
+        """
+        List (mtime, size, path) for every entry, and remove orphaned temporary files
+        """
+        out = []
+        now = time.time()
+        for shard in os.listdir(self.directory):
+            shard_dir = os.path.join(self.directory, shard)
+            if not os.path.isdir(shard_dir):
+                continue
+            for name in os.listdir(shard_dir):
+                path = os.path.join(shard_dir, name)
+                try:
+                    st = os.stat(path)
+                    if name.endswith(SUFFIX):
+                        out.append( (st.st_mtime, st.st_size, path) )
+                    elif name.endswith('.tmp')  and  now - st.st_mtime > STALE:
+                        os.remove(path)                           # Left behind by a writer that died
+                except OSError:
+                    pass                                          # Removed by another process meanwhile
+        return out
+
+
+    def scan_size(self):
+        return sum( size for mtime, size, path in self.entries() )
+
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache is below low_water * max_bytes.  Only one process evicts at a time; the
+        others skip eviction and carry on.
+        """
+        lock = None
+        try:
+            if fcntl is not None:
+                lock = open(os.path.join(self.directory, LOCKFILE), 'a')
+                try:
+                    fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    self.size = None                              # Someone else is evicting.  Rescan on the next write.
+                    return
+
+            entries = sorted(self.entries())
+            total   = sum( size for mtime, size, path in entries )
+            target  = self.low_water * self.max_bytes
+            for mtime, size, path in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                    self.stats['evicted'] += 1
+                except OSError:
+                    pass
+                total -= size
+            self.size = total
+            self.unscanned = 0
+
+        finally:
+            if lock is not None:
+                lock.close()                                      # Releases the flock
+
+
+    def clear(self):
+        """
+        Remove every entry
+        """
+        for mtime, size, path in self.entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.size = 0
+
+
+################################################################################
+################################################################################
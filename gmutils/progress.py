@@ -0,0 +1,430 @@
+""" progress.py
+
+    A low-overhead progress and throughput monitor for long loops.
+
+    The per-iteration cost is one integer add and one comparison.  Only every N iterations does the Monitor look at the clock, and only
+    when a reporting interval has elapsed does it format a status line (percent done, items/sec, elapsed time, smoothed ETA) and write
+    it to STDERR.  N adapts to the observed rate so that the clock is consulted a few times per interval.
+
+    A Monitor is a dict, so that code written against the original '_monitor' dict (see utils.monitor_setup) keeps working:
+    '_monitor['i']', '_monitor['skip']', '_monitor['progress']', '_monitor['progress_ratio']', and any keys the caller stores itself.
+
+    Counts can be aggregated across threads ('threadsafe') and across processes ('shared', with workers forked after the Monitor is
+    created).  A forked worker adds its count to the shared total every so many items, and once more when it exits.  Only the creating
+    process reports; while the workers do the counting it can call poll():
+
+    m = Monitor(total, {'shared':True})
+    workers = [ multiprocessing.Process(target=work, args=(m, part)) for part in parts ]     # work() calls m.tick() per item
+    for w in workers:  w.start()
+    while any( w.is_alive() for w in workers ):
+        m.poll()
+        time.sleep(0.1)
+    m.close()
+
+"""
+import os, sys, re
+import time
+import weakref
+import threading
+import multiprocessing
+import multiprocessing.util
+
+################################################################################
+# CONFIG
+
+default = {
+    'interval'  : 0.5,          # Seconds between reports
+    'every'     : None,         # Fixed number of iterations between clock checks (None: adapt to the observed rate)
+    'smoothing' : 0.3,          # Weight of the newest rate measurement in the exponential moving average
+}
+
+MAX_EVERY        = 1 << 20
+MAX_EVERY_SHARED = 1 << 12          # Workers add to the shared count at least this often
+
+_shared_monitors = weakref.WeakValueDictionary()       # id -> Monitor with 'shared', to be told when the process forks
+
+################################################################################
+# FUNCTIONS
+
+def format_seconds(sec):
+    """
+    Format a number of seconds as H:MM:SS
+    """
+    if sec is None  or  sec != sec  or  sec == float('inf'):
+        return '?:??:??'
+    sec = int(sec)
+    return "%d:%02d:%02d"% (sec // 3600, (sec % 3600) // 60, sec % 60)
+
+
+def format_rate(rate):
+    """
+    Format items/sec compactly
+    """
+    if rate is None:
+        return '?'
+    if rate >= 1e6:
+        return "%.2fM"% (rate / 1e6)
+    if rate >= 1e3:
+        return "%.2fk"% (rate / 1e3)
+    return "%.2f"% rate
+
+
+def after_fork_in_child():
+    """
+    In a newly forked process, let each shared Monitor start counting for this process (see Monitor.forked)
+    """
+    for m in list(_shared_monitors.values()):
+        m.forked()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=after_fork_in_child)
+
+
+################################################################################
+# OBJECTS
+
+class Monitor(dict):
+    """
+    Progress monitor.  Call tick() (or utils.monitor()) once per item.
+
+    Attributes
+    ----------
+    i : int
+        Items counted by this process (including any initially skipped)
+
+    total_i : int
+
+    Dict keys (refreshed at each report)
+    ---------
+    i, total_i, skip, progress, progress_ratio, last_done, last_line, rate, eta, elapsed
+
+    """
+    __slots__ = ('i', 'next_check', '__dict__', '__weakref__')     # Slots keep the hot-path attributes fast on a dict subclass
+
+    def __init__(self, total_i, options={}):
+        """
+        Parameters
+        ----------
+        total_i : int
+
+        Options
+        -------
+        skip : float
+            Percentage.  '_monitor['skip']' stays set until progress passes it (see utils.monitor_setup)
+
+        skipped : float
+            Percentage already processed by a previous run.  The count starts there.
+
+        silent : boolean
+
+        interval : float
+            Seconds between reports
+
+        every : int
+            Iterations between clock checks
+
+        threadsafe : boolean
+            Guard the counter with a lock so several threads can share this Monitor
+
+        shared : boolean
+            Aggregate counts across processes forked after this Monitor is created.  A worker's count is added to the total at least
+            every MAX_EVERY_SHARED items, and when it exits (normally, or as a multiprocessing.Process; call flush() before os._exit).
+            Only the creating process writes reports (see poll).
+
+        """
+        dict.__init__(self)
+        self.total_i   = total_i
+        self.silent    = bool(options.get('silent'))
+        self.interval  = options.get('interval') or default['interval']
+        self.fixed     = options.get('every') or default['every']
+        self.alpha     = options.get('smoothing') or default['smoothing']
+
+        self.i = 0
+        if options.get('skipped'):
+            self.i = int( (float(total_i) * float(options.get('skipped'))) / 100. )
+
+        self.pid       = os.getpid()
+        self.exit_pid  = self.pid                                      # Process in which a flush at exit is arranged (see check)
+        self.shared    = None
+        self.flushed   = self.i                                        # Portion of self.i already added to self.shared
+        self.max_every = MAX_EVERY
+        if options.get('shared'):
+            self.shared    = multiprocessing.Value('q', self.i)
+            self.max_every = MAX_EVERY_SHARED
+            _shared_monitors[id(self)] = self
+
+        self.lock = None
+        if options.get('threadsafe'):
+            self.lock   = threading.Lock()
+            self.tick   = self.tick_locked
+
+        self.t0         = time.time()
+        self.last_time  = self.t0
+        self.last_count = self.i
+        self.rate       = None                                         # Smoothed items/sec
+        self.every      = min(self.fixed or 1, self.max_every)
+        self.next_check = self.i + self.every
+
+        skip = options.get('skip')
+        dict.update(self, { 'total_i':total_i, 'skip':skip, 'last_done':0.0, 'progress':'', 'progress_ratio':self.ratio(self.i) })
+        self.skip_check()
+
+
+    ############################################################################
+    # Counting
+
+    def tick(self, n=1):
+        """
+        Count <n> more items.  This is the hot path: keep it minimal.
+        """
+        self.i += n
+        if self.i >= self.next_check:
+            self.check()
+        return self
+
+
+    def tick_locked(self, n=1):
+        """
+        tick() for use from several threads
+        """
+        with self.lock:
+            self.i += n
+            if self.i >= self.next_check:
+                self.check()
+        return self
+
+
+    def count(self):
+        """
+        Current aggregate count (all threads / processes sharing this Monitor)
+        """
+        if self.shared is None:
+            return self.i
+        return self.shared.value + (self.i - self.flushed)
+
+
+    def flush(self):
+        """
+        Add this process's unreported count to the shared counter
+        """
+        if self.shared is None:
+            return self.i
+        with self.shared.get_lock():
+            self.shared.value += self.i - self.flushed
+            total = self.shared.value
+        self.flushed = self.i
+        return total
+
+
+    def forked(self):
+        """
+        Called in a newly forked process:  what was counted so far belongs to the parent.  The first tick here goes to check(), which
+        arranges for this process's own count to be added to the shared total when it exits.
+        """
+        self.flushed    = self.i
+        self.next_check = self.i + 1
+
+
+    def refresh(self):
+        """
+        Flush, look at the clock, and measure and report if an interval has passed
+
+        Returns
+        -------
+        int : the aggregate count
+
+        """
+        now = time.time()
+        count = self.flush()
+        dt = now - self.last_time
+        if dt >= self.interval:
+            self.measure(count, now, dt)
+            if os.getpid() == self.pid:
+                self.report(count)
+        return count
+
+
+    def check(self):
+        """
+        Slow path: maybe report, and decide when to check again
+        """
+        if self.shared is not None  and  self.exit_pid != os.getpid():
+            # First check in a forked worker (registered here, not at the fork:  multiprocessing.Process clears finalizers as it starts)
+            multiprocessing.util.Finalize(None, self.flush, exitpriority=10)
+            self.exit_pid = os.getpid()
+        self.refresh()
+
+        # Adapt the number of iterations between clock checks: aim for a few checks per interval
+        if self.fixed is None:
+            if self.rate:
+                self.every = int(min(self.max_every, max(1, self.rate * self.interval / 4.)))
+            else:
+                self.every = min(self.max_every, 2 * self.every)           # No rate yet: ramp up
+        self.next_check = self.i + self.every
+        self.skip_check()
+
+
+    def poll(self):
+        """
+        Report (if an interval has passed) without counting anything:  for the creating process while forked workers count
+
+        Returns
+        -------
+        int : the aggregate count
+
+        """
+        count = self.refresh()
+        self.skip_check()
+        return count
+
+
+    def skip_check(self):
+        """
+        Clear the 'skip' key at exactly the same item as the original per-iteration test (skip < percent done)
+        """
+        skip = dict.get(self, 'skip')
+        if not skip:
+            return
+        count = self.count()
+        if skip < 100.0 * self.ratio(count):
+            self['skip'] = False
+            return
+
+        # Come back no later than the item at which the threshold is crossed (item by item once within rounding distance of it)
+        try:
+            threshold = int(float(skip) * float(self.total_i) / 100.)
+        except (TypeError, ValueError):
+            return
+        self.next_check = min(self.next_check, self.i + max(1, threshold - count))
+
+
+    def measure(self, count, now, dt):
+        """
+        Update the smoothed rate
+        """
+        rate = (count - self.last_count) / dt
+        if self.rate is None:
+            self.rate = rate
+        else:
+            self.rate = self.alpha * rate + (1. - self.alpha) * self.rate
+        self.last_time  = now
+        self.last_count = count
+
+
+    def ratio(self, count):
+        try:
+            return float(count) / float(self.total_i)
+        except (TypeError, ZeroDivisionError):
+            return 0.0
+
+
+    ############################################################################
+    # Reporting
+
+    def elapsed(self):
+        return time.time() - self.t0
+
+
+    def eta(self, count=None):
+        """
+        Seconds remaining at the smoothed rate
+        """
+        if count is None:
+            count = self.count()
+        if not self.rate  or  self.total_i is None:
+            return None
+        return max(0, self.total_i - count) / self.rate
+
+
+    def estimated_total(self):
+        """
+        Estimated total seconds for the whole loop
+        """
+        ratio = self.ratio(self.count())
+        if ratio <= 0:
+            return None
+        return self.elapsed() / ratio
+
+
+    def status(self, count=None):
+        """
+        A one-line summary of progress
+        """
+        if count is None:
+            count = self.count()
+        line = "%04.4f%% %d/%s [%s it/s, elapsed %s, ETA %s]"% ( 100.0 * self.ratio(count), count, str(self.total_i), format_rate(self.rate),
+                                                                  format_seconds(self.elapsed()), format_seconds(self.eta(count)) )
+        postfix = dict.get(self, 'postfix')
+        if postfix:
+            line += ' ' + postfix
+        return line
+
+
+    def set_postfix(self, text):
+        """
+        Extra text appended to the status line at the next report (e.g. a training loss)
+        """
+        self['postfix'] = text
+
+
+    def report(self, count):
+        """
+        Refresh the dict keys and write the status line
+        """
+        ratio = self.ratio(count)
+        done  = 100.0 * ratio
+        line  = self.status(count)
+        dict.update(self, { 'progress_ratio':ratio, 'progress':"%04.4f%% "% done, 'last_done':done, 'rate':self.rate,
+                            'eta':self.eta(count), 'elapsed':self.elapsed() })
+
+        if not self.silent:
+            last_line = dict.get(self, 'last_line')
+            if last_line:
+                sys.stderr.write("\b" * len(last_line))
+                if len(last_line) > len(line):
+                    line += ' ' * (len(last_line) - len(line))        # Blank out the tail of a longer previous line
+            sys.stderr.write(line)
+            sys.stderr.flush()
+            self['last_line'] = line
+
+
+    def close(self):
+        """
+        Flush counts, write a final report, and end the line
+        """
+        count = self.flush()
+        now = time.time()
+        if now > self.last_time:
+            self.measure(count, now, now - self.last_time)
+        if os.getpid() == self.pid:
+            self.report(count)
+            if not self.silent:
+                sys.stderr.write('\n')
+
+
+    ############################################################################
+    # dict compatibility:  'i' always reads the live count
+
+    def __getitem__(self, key):
+        if key == 'i':
+            return self.count()
+        return dict.__getitem__(self, key)
+
+
+    def get(self, key, default=None):
+        if key == 'i':
+            return self.count()
+        return dict.get(self, key, default)
+
+
+    def __setitem__(self, key, val):
+        if key == 'i':
+            self.i = self.flushed = val
+            self.next_check = val + self.every
+            return
+        dict.__setitem__(self, key, val)
+
+
+################################################################################
+################################################################################
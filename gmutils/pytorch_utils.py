@@ -5,12 +5,12 @@
 """
 import sys, os, re
 import random
-import inspect
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import numpy as np
 
+from gmutils import log
 from gmutils.utils import err, argparser, isTrue, read_dir
 
 torch.set_printoptions(linewidth=260)
@@ -26,12 +26,8 @@ def print_info(T):
     """
     Returns some info about a tensor or variable
     """
-    callerframerecord = inspect.stack()[1]    # 0 represents this line
-                                              # 1 represents line at caller
-    frame = callerframerecord[0]
-    info  = inspect.getframeinfo(frame)
-    file  = os.path.basename(info.filename)
-    line  = info.lineno
+    filename, line, _ = log.caller()
+    file  = os.path.basename(filename)
 
     sys.stderr.write("\nINFO from file: %s"% file + " Line: %d"% line + "\n\tsize: %s"% str(T.size()) + "\n\ttype: %s\n"% str(type(T)))
     sys.stderr.write("\tType: %s\n"% str(T.type()))
@@ -0,0 +1,252 @@
+""" rewrite.py
+
+    Worklist-driven rewriting of the Node trees of a Document, as done by Document.preprocess().
+
+    A rule pairs a test (is this Node a candidate?) with an alteration (Node.agglomerate_*, Node.delegate_to_*).  Each rule is applied
+    until nothing more changes, as before, but without sweeping every tree again after each change:  the candidates are queued once, in
+    pre-order, and a change re-queues only the Nodes it touched and their neighbors.  The TreeArrays record what was touched (every
+    link, unlink, and change of token owner) while a rule runs.  The neighbors of a touched Node are its parent, its children, and the
+    owners of the tokens just before its tokens (whose "next token" may now belong to it).
+
+    The rules run one after the other, each to its own fixpoint, in the order preprocess() has always applied them.  Each rule's
+    candidates, calls, changes, re-queued Nodes and time taken (including the tests) are counted (see format_stats).
+
+"""
+import os, sys, re
+import time
+from collections import deque
+
+from gmutils.utils import err
+from gmutils.node import Node, MODIFIER_DEPS
+
+################################################################################
+# CONFIG
+
+default = {
+    'max_visits' : 10,              # Per token, per rule.  A rule still altering the trees beyond this (e.g. two Nodes swapping back
+                                    # and forth) is stopped, with a warning.
+}
+
+STAT_KEYS = ['candidates', 'calls', 'changes', 'requeued', 'seconds']
+
+################################################################################
+# FUNCTIONS
+
+def is_entity_beginner(node):
+    return node.get_entity_position() == 'B'
+
+
+def is_modifier(node):
+    return node.has_dep(MODIFIER_DEPS)
+
+
+def verbs_preps_rule(vocab=None):
+    """
+    Rule agglomerating verbs with their prepositional children (see Node.agglomerate_verbs_preps)
+    """
+    return Rule('verbs_preps', Node.is_verb, lambda node: node.agglomerate_verbs_preps(vocab=vocab))
+
+
+def new_stats():
+    stats = { key:0 for key in STAT_KEYS }
+    stats['seconds'] = 0.0
+    return stats
+
+
+def add_stats(total, stats):
+    """
+    Add the counts in <stats> into <total> (e.g. to sum over many Documents).  Both are dicts as in RewriteEngine.stats.
+
+    Returns
+    -------
+    dict : <total>
+
+    """
+    for name, counts in stats.items():
+        into = total.setdefault(name, new_stats())
+        for key in STAT_KEYS:
+            into[key] += counts.get(key, 0)
+    return total
+
+
+def format_stats(stats):
+    """
+    A table of rule statistics, most costly rule first
+
+    Returns
+    -------
+    str
+
+    """
+    lines = [ "%-14s %10s %8s %8s %9s %10s"% ('rule', 'candidates', 'calls', 'changes', 'requeued', 'ms') ]
+    for name, counts in sorted(stats.items(), key=lambda x: -x[1]['seconds']):
+        lines.append( "%-14s %10d %8d %8d %9d %10.2f"% (name, counts['candidates'], counts['calls'], counts['changes'], counts['requeued'],
+                                                        1000 * counts['seconds']) )
+    return '\n'.join(lines)
+
+
+################################################################################
+# OBJECTS
+
+class Rule(object):
+    """
+    One tree alteration
+
+    Attributes
+    ----------
+    name : str
+
+    select : function(Node) -> bool
+        Is the Node a candidate for this rule?
+
+    apply : function(Node) -> bool
+        Alter the trees around the Node.  Returns True if anything was altered.
+
+    """
+    def __init__(self, name, select, apply):
+        self.name   = name
+        self.select = select
+        self.apply  = apply
+
+
+    def __repr__(self):
+        return 'Rule(%s)'% self.name
+
+
+class RewriteEngine(object):
+    """
+    Applies Rules to the trees of one Document, each until nothing more changes
+
+    Attributes
+    ----------
+    doc : Document
+
+    stats : dict { rule name -> dict { stat -> number } }
+        See STAT_KEYS
+
+    """
+    def __init__(self, doc, options={}):
+        """
+        Options
+        -------
+        max_visits : int
+
+        """
+        self.doc        = doc
+        self.max_visits = options.get('max_visits') or default['max_visits']
+        self.stats      = {}
+        self.order      = None              # (doc.tree_version, node numbers in pre-order), reused until the trees change
+
+
+    def candidates(self, rule):
+        """
+        All Nodes of all trees passing rule.select(), in pre-order
+        """
+        arrays = self.doc.tree_arrays
+        if self.order is None  or  self.order[0] != self.doc.tree_version:
+            self.order = ( self.doc.tree_version, arrays.pre_order([ tree.i for tree in self.doc.trees ]) )
+        nodes = arrays.nodes
+        return [ nodes[i] for i in self.order[1] if rule.select(nodes[i]) ]
+
+
+    def neighbors(self, touched):
+        """
+        The live Nodes among <touched> (node numbers), with their parents, children, and the owners of the tokens just before theirs,
+        in order of node number
+        """
+        arrays = self.doc.tree_arrays
+        nodes  = arrays.nodes
+        found  = set()
+        for i in touched:
+            node = nodes[i]
+            if node is None  or  node.is_dead:
+                continue
+            found.add(i)
+            p = arrays.parent[i]
+            if p >= 0:
+                found.add(int(p))
+            found.update( arrays.children(i) )
+            for token in node.tokens:
+                if token.i > 0:
+                    j = arrays.owner[token.i - 1]
+                    if j >= 0:
+                        found.add(int(j))
+
+        out = []
+        for i in sorted(found):
+            node = nodes[i]
+            if node is not None  and  not node.is_dead:
+                out.append(node)
+        return out
+
+
+    def run(self, rule):
+        """
+        Apply <rule> until nothing more changes
+
+        Returns
+        -------
+        bool : whether anything was altered
+
+        """
+        t0     = time.perf_counter()
+        arrays = self.doc.tree_arrays
+        stats  = self.stats.setdefault(rule.name, new_stats())
+        queue  = deque(self.candidates(rule))
+        queued = set( node.i for node in queue )
+        stats['candidates'] += len(queue)
+
+        altered = False
+        limit   = self.max_visits * (len(arrays) + 1)
+        calls   = 0
+        while queue:
+            node = queue.popleft()
+            queued.discard(node.i)
+            if node.is_dead:
+                continue
+            if calls >= limit:
+                err(["Rule '%s' still altering the trees after %d calls.  Stopped."% (rule.name, calls)], {'warning':True})
+                break
+
+            arrays.touched = set()
+            try:
+                a = rule.apply(node)
+            finally:
+                touched = arrays.touched
+                arrays.touched = None
+            calls += 1
+            if a:
+                stats['changes'] += 1
+                altered = True
+
+            for other in self.neighbors(touched):
+                if other.i not in queued  and  rule.select(other):
+                    queue.append(other)
+                    queued.add(other.i)
+                    stats['requeued'] += 1
+
+        stats['calls']   += calls
+        stats['seconds'] += time.perf_counter() - t0
+        return altered
+
+
+################################################################################
+# RULES
+
+RULES = { rule.name:rule for rule in [
+    Rule('compound_adj',  Node.is_compound_prefix,  Node.agglomerate_compound_adj),
+    Rule('entities',      is_entity_beginner,       Node.agglomerate_entities),
+    Rule('negations',     Node.is_negation,         Node.delegate_to_negation),
+    Rule('modifiers',     is_modifier,              Node.agglomerate_modifier),
+    Rule('twins',         Node.has_twins,           Node.agglomerate_twins),
+    Rule('verbauxes',     Node.is_verb,             Node.agglomerate_verbaux),
+    Rule('conjunctions',  Node.is_conjunction,      Node.delegate_to_conjunction),
+    Rule('idioms',        Node.is_idiom_parent,     Node.agglomerate_idiom),
+] }
+
+# The rules applied by Document.preprocess(), in order
+PREPROCESS = ['compound_adj', 'entities', 'negations', 'modifiers', 'twins', 'verbauxes', 'conjunctions', 'idioms']
+
+
+################################################################################
+################################################################################
@@ -0,0 +1,198 @@
+""" sentence_cache.py
+
+    Sentence-level deduplicated parsing.  Boilerplate (disclaimers, headers, signatures) repeats across many documents; parsing each
+    unique sentence once and reassembling whole-document Docs from the per-sentence parses saves time in proportion to how much of a
+    corpus repeats.
+
+    Each parsed sentence is kept as a compact record:  its words, trailing spaces, a Doc.to_array() matrix of token attributes (HEAD is
+    stored as a relative offset, so records can be placed anywhere in a document), and its NER tags.  Records are held in a bounded
+    in-memory LRU cache.  nlp.py also consults the on-disk ParseCache, if one is configured, before running the model.
+
+"""
+import os, sys, re
+from collections import OrderedDict
+import numpy as np
+
+from spacy.tokens import Doc
+from spacy.attrs import LEMMA, TAG, POS, HEAD, DEP, ENT_IOB, ENT_TYPE
+from spacy.symbols import SPACE
+
+################################################################################
+# CONFIG
+
+default = {
+    'max_sentences' : 100000,       # Records kept in memory
+}
+
+ATTRS    = [LEMMA, TAG, POS, HEAD, DEP, ENT_IOB, ENT_TYPE]
+SPACE_TAG = '_SP'
+IOB_O    = 2                        # ENT_IOB value for 'O'
+
+################################################################################
+# FUNCTIONS
+
+def sentence_spans(spacy_doc):
+    """
+    Character offsets of each sentence of a Doc, with surrounding whitespace excluded
+
+    Parameters
+    ----------
+    spacy_doc : spaCy Doc with sentence boundaries (e.g. from the sentencizer)
+
+    Returns
+    -------
+    list of (start_char, end_char)
+
+    """
+    text  = spacy_doc.text
+    spans = []
+    for sen in spacy_doc.sents:
+        start, end = sen.start_char, sen.end_char
+        while start < end  and  text[start].isspace():
+            start += 1
+        while end > start  and  text[end-1].isspace():
+            end -= 1
+        if end > start:
+            spans.append( (start, end) )
+    return spans
+
+
+def make_record(spacy_doc, ner):
+    """
+    Compact, position-independent form of one parsed sentence
+
+    Parameters
+    ----------
+    spacy_doc : spaCy Doc
+
+    ner : dict (see nlp.ner_dict)
+
+    Returns
+    -------
+    (list of str, list of bool, numpy array, list of (str, str))
+
+    """
+    words  = [ token.text for token in spacy_doc ]
+    spaces = [ bool(token.whitespace_) for token in spacy_doc ]
+    return words, spaces, spacy_doc.to_array(ATTRS), [ ner[i] for i in range(len(spacy_doc)) ]
+
+
+def assemble(vocab, text, spans, records):
+    """
+    Build one Doc for all of <text> from the records of its sentences
+
+    Parameters
+    ----------
+    vocab : spaCy Vocab
+
+    text : str
+
+    spans : list of (start_char, end_char), as from sentence_spans()
+
+    records : list, one per span, as from make_record()
+
+    Returns
+    -------
+    spaCy Doc (whose text is exactly <text>), dict of NER tags (token.i -> (ent_type_, ent_iob_))
+
+    """
+    words, spaces, rows, ner = [], [], [], []
+    space_tag = vocab.strings.add(SPACE_TAG)
+
+    def add_gap(gap, following):
+        """
+        Whitespace between sentences.  As spaCy's tokenizer does, a single leading space becomes the previous token's trailing
+        space, and any remainder becomes a token of its own, attached to a neighboring token.
+        """
+        if len(words) > 0  and  gap.startswith(' '):
+            spaces[-1] = True
+            gap = gap[1:]
+        if not gap:
+            return
+        head = -1 if len(words) > 0 else (1 if following else 0)
+        row = np.zeros((1, len(ATTRS)), dtype=np.uint64)
+        row[0, ATTRS.index(LEMMA)]   = vocab.strings.add(gap)
+        row[0, ATTRS.index(TAG)]     = space_tag
+        row[0, ATTRS.index(POS)]     = SPACE
+        row[0, ATTRS.index(HEAD)]    = np.array(head, dtype=np.int64).astype(np.uint64)
+        row[0, ATTRS.index(ENT_IOB)] = IOB_O
+        words.append(gap)
+        spaces.append(False)
+        rows.append(row)
+        ner.append( ('', 'O') )
+
+    pos = 0
+    for (start, end), (r_words, r_spaces, r_array, r_ner) in zip(spans, records):
+        add_gap(text[pos:start], True)
+        words.extend(r_words)
+        spaces.extend(r_spaces)
+        spaces[-1] = False                                  # Trailing whitespace is handled as the next gap
+        rows.append(r_array)
+        ner.extend(r_ner)
+        pos = end
+    add_gap(text[pos:], False)
+
+    spacy_doc = Doc(vocab, words=words, spaces=spaces)
+    if len(rows) > 0:
+        spacy_doc.from_array(ATTRS, np.concatenate(rows).astype(np.uint64))
+
+    return spacy_doc, { i:tags for i, tags in enumerate(ner) }
+
+
+################################################################################
+# OBJECTS
+
+class SentenceCache(object):
+    """
+    Bounded LRU cache of parsed-sentence records, keyed by sentence text
+
+    Attributes
+    ----------
+    stats : dict
+        Counts of hits and misses
+
+    """
+    def __init__(self, options={}):
+        """
+        Options
+        -------
+        max_sentences : int
+
+        """
+        self.max_sentences = options.get('max_sentences') or default['max_sentences']
+        self.records = OrderedDict()
+        self.stats   = { 'hits':0, 'misses':0 }
+
+
+    def __len__(self):
+        return len(self.records)
+
+
+    def __contains__(self, sentence):
+        return sentence in self.records
+
+
+    def get(self, sentence):
+        try:
+            record = self.records[sentence]
+        except KeyError:
+            self.stats['misses'] += 1
+            return None
+        self.records.move_to_end(sentence)
+        self.stats['hits'] += 1
+        return record
+
+
+    def put(self, sentence, record):
+        self.records[sentence] = record
+        self.records.move_to_end(sentence)
+        while len(self.records) > self.max_sentences:
+            self.records.popitem(last=False)
+
+
+    def clear(self):
+        self.records.clear()
+
+
+################################################################################
+################################################################################
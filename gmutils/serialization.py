@@ -0,0 +1,437 @@
+""" serialization.py
+
+    Fast, crash-safe serialization of large objects to disk
+
+    Objects are pickled with protocol 5.  Large contiguous buffers (NumPy arrays, the blocks inside pandas DataFrames) are handed over
+    out-of-band and written raw, aligned, after the pickle stream.  Uncompressed files can therefore be memory-mapped on load so that
+    arrays are backed directly by the file.  Each file is written to a temporary file first, then atomically renamed into place.
+
+    File layout:
+
+        MAGIC | section | section | ... | header (JSON) | header length (uint64) | MAGIC
+
+    where each section holds one pickle stream followed by its out-of-band buffers.  A plain object is written as a single section.
+    A dict written with the 'lazy' option gets one section per member, so that members can be loaded on first access.
+
+"""
+import os, sys, re
+import json
+import mmap
+import gzip
+import pickle
+import stat
+import struct
+import tempfile
+from contextlib import contextmanager
+from collections.abc import MutableMapping
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+################################################################################
+# CONFIG
+
+MAGIC      = b'GMUTILS\x05'     # 8 bytes.  Begins and ends every file written by dump()
+VERSION    = 1
+PROTOCOL   = 5
+ALIGNMENT  = 64                 # Byte alignment of each raw buffer (keeps memory-mapped arrays aligned)
+
+# An uncompressed joblib file is a pickle stream with the raw data of each array written right after a reference to joblib's
+# NumpyArrayWrapper.  Only this many leading bytes are searched for that reference, so a joblib file whose first array comes later
+# is reported as 'pickle'.
+JOBLIB_SNIFF  = 1 << 20
+JOBLIB_MODULE = b'numpy_pickle'     # joblib.numpy_pickle, or sklearn.externals.joblib.numpy_pickle
+
+default = {
+    'compress'  : None,         # One of: None, 'zstd', 'lz4', 'gzip'
+    'level'     : None,         # Compression level.  None means the codec's own default
+}
+
+DEFAULT_LEVELS = {
+    'zstd' : 3,
+    'lz4'  : 0,
+    'gzip' : 6,
+}
+
+################################################################################
+# COMPRESSION
+
+def compress(data, codec=None, level=None):
+    """
+    Compress a bytes-like object with a named codec
+
+    Parameters
+    ----------
+    data : bytes-like
+
+    codec : str or None
+
+    level : int or None
+
+    Returns
+    -------
+    bytes-like
+
+    """
+    if codec is None:
+        return data
+    if level is None:
+        level = DEFAULT_LEVELS.get(codec)
+
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ValueError("Compression 'zstd' requires the 'zstandard' package")
+        return zstandard.ZstdCompressor(level=level).compress(data)
+
+    elif codec == 'lz4':
+        if lz4 is None:
+            raise ValueError("Compression 'lz4' requires the 'lz4' package")
+        return lz4.frame.compress(data, compression_level=level)
+
+    elif codec == 'gzip':
+        return gzip.compress(data, compresslevel=level)
+
+    raise ValueError("Unknown compression codec: %s"% str(codec))
+
+
+def decompress(data, codec=None):
+    """
+    Inverse of compress()
+    """
+    if codec is None:
+        return data
+
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ValueError("Decompression 'zstd' requires the 'zstandard' package")
+        return zstandard.ZstdDecompressor().decompress(data)
+
+    elif codec == 'lz4':
+        if lz4 is None:
+            raise ValueError("Decompression 'lz4' requires the 'lz4' package")
+        return lz4.frame.decompress(data)
+
+    elif codec == 'gzip':
+        return gzip.decompress(data)
+
+    raise ValueError("Unknown compression codec: %s"% str(codec))
+
+
+################################################################################
+# FUNCTIONS
+
+def file_mode(filepath):
+    """
+    Permission bits for a file written to <filepath>:  those of the file already there, or else what open() would give a new file
+    under the current umask
+    """
+    try:
+        return stat.S_IMODE(os.stat(filepath).st_mode)
+    except OSError:
+        pass
+    umask = os.umask(0)                                # The umask can only be read by setting it
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+@contextmanager
+def atomic_write(filepath, mode='wb'):
+    """
+    Open a temporary file next to <filepath> for writing.  On success it is flushed, synced, and renamed onto <filepath>.  On failure
+    it is removed, leaving any previous version of <filepath> untouched.
+
+    Usage:
+
+        with atomic_write(filepath) as FH:
+            FH.write(data)
+
+    """
+    directory = os.path.dirname(os.path.abspath(filepath))
+    fd, tmppath = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(filepath) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as FH:
+            yield FH
+            FH.flush()
+            os.fsync(FH.fileno())
+        os.chmod(tmppath, file_mode(filepath))         # mkstemp makes the file owner-only (0600)
+        os.replace(tmppath, filepath)
+    except:
+        try:
+            os.remove(tmppath)
+        except OSError:
+            pass
+        raise
+
+
+def padding(offset):
+    """
+    Number of bytes needed to bring <offset> up to the next multiple of ALIGNMENT
+    """
+    return (-offset) % ALIGNMENT
+
+
+def write_section(FH, thing, codec=None, level=None):
+    """
+    Pickle <thing> to an open file, writing its out-of-band buffers raw (or compressed) after the pickle stream.
+
+    Returns
+    -------
+    dict : the section's entry for the file header
+
+    """
+    buffers = []
+    stream  = pickle.dumps(thing, protocol=PROTOCOL, buffer_callback=buffers.append)
+
+    raw_len = len(stream)
+    stream  = compress(stream, codec, level)
+    section = { 'pickle' : [FH.tell(), len(stream), raw_len], 'buffers' : [] }
+    FH.write(stream)
+
+    for buf in buffers:
+        raw = buf.raw()                         # memoryview onto the contiguous buffer
+        FH.write(b'\0' * padding(FH.tell()))
+        data = compress(raw, codec, level)
+        section['buffers'].append( [FH.tell(), len(data), raw.nbytes] )
+        FH.write(data)
+
+    return section
+
+
+def dump(thing, filepath, options={}):
+    """
+    Serialize <thing> and atomically save it to <filepath>
+
+    Parameters
+    ----------
+    thing : anything picklable
+
+    filepath : str
+
+    Options
+    -------
+    compress : str
+        One of 'zstd', 'lz4', or 'gzip'.  Compressed files cannot be memory-mapped on load.
+
+    level : int
+        Compression level
+
+    lazy : boolean
+        If <thing> is a dict with str keys, write each member to its own section so that load() can defer reading it
+
+    """
+    codec = options.get('compress', default['compress'])
+    level = options.get('level', default['level'])
+    if codec is not None  and  codec not in DEFAULT_LEVELS:
+        raise ValueError("Unknown compression codec: %s"% str(codec))
+
+    lazy = bool(options.get('lazy'))  and  isinstance(thing, dict)  and  all(isinstance(k, str) for k in thing.keys())
+
+    with atomic_write(filepath) as FH:
+        FH.write(MAGIC)
+        header = { 'version':VERSION, 'protocol':PROTOCOL, 'codec':codec, 'lazy':lazy, 'sections':[] }
+
+        if lazy:
+            for key, val in thing.items():
+                section = write_section(FH, val, codec, level)
+                section['key'] = key
+                header['sections'].append(section)
+        else:
+            header['sections'].append( write_section(FH, thing, codec, level) )
+
+        header_bytes = json.dumps(header).encode('utf-8')
+        FH.write(header_bytes)
+        FH.write(struct.pack('<Q', len(header_bytes)))
+        FH.write(MAGIC)
+
+
+def is_gmutils_file(filepath):
+    """
+    Determine whether <filepath> was written by dump()
+    """
+    try:
+        with open(filepath, 'rb') as FH:
+            return FH.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def detect_format(filepath):
+    """
+    Sniff the leading bytes of a file to determine how it was serialized
+
+    Returns
+    -------
+    str : one of 'gmutils', 'pickle', 'joblib', 'gzip', 'zstd', 'lz4', 'unknown'
+
+    """
+    with open(filepath, 'rb') as FH:
+        head = FH.read(JOBLIB_SNIFF)
+
+    if head[:len(MAGIC)] == MAGIC:
+        return 'gmutils'
+    if head[:1] == b'\x80':                    # PROTO opcode: plain pickle (also dill), or uncompressed joblib
+        if JOBLIB_MODULE in head:
+            return 'joblib'
+        return 'pickle'
+    if head[:2] == b'\x1f\x8b':
+        return 'gzip'
+    if head[:4] == b'\x28\xb5\x2f\xfd':
+        return 'zstd'
+    if head[:4] == b'\x04\x22\x4d\x18':
+        return 'lz4'
+    return 'unknown'
+
+
+def read_header(FH):
+    """
+    Read the JSON header from the end of an open file written by dump()
+    """
+    FH.seek(-(8 + len(MAGIC)), os.SEEK_END)
+    trailer = FH.read(8 + len(MAGIC))
+    if trailer[8:] != MAGIC:
+        raise ValueError("Truncated or corrupt serialized file: %s"% FH.name)
+    header_len = struct.unpack('<Q', trailer[:8])[0]
+    FH.seek(-(8 + len(MAGIC) + header_len), os.SEEK_END)
+    header = json.loads(FH.read(header_len).decode('utf-8'))
+    if header.get('version', 0) > VERSION:
+        raise ValueError("Serialized file has a newer format version (%s) than this code supports"% str(header.get('version')))
+    return header
+
+
+def read_section(source, section, codec=None):
+    """
+    Unpickle one section from either an open file or a memory map
+
+    Parameters
+    ----------
+    source : file object or mmap.mmap
+
+    section : dict (as made by write_section)
+
+    codec : str or None
+
+    """
+    def read(extent):
+        offset, length, raw_len = extent
+        if isinstance(source, mmap.mmap):
+            data = memoryview(source)[offset:offset+length]   # ACCESS_COPY map: writable, copy-on-write
+        else:
+            data = bytearray(length)                          # Writable, so that arrays built on it are writable
+            source.seek(offset)
+            source.readinto(data)
+        if codec is None:
+            return data
+        return bytearray(decompress(data, codec))
+
+    stream  = read(section['pickle'])
+    buffers = [ read(extent) for extent in section['buffers'] ]
+
+    return pickle.loads(stream, buffers=buffers)
+
+
+def load(filepath, options={}):
+    """
+    Load an object saved with dump()
+
+    Parameters
+    ----------
+    filepath : str
+
+    Options
+    -------
+    mmap : boolean
+        Memory-map the file (only for uncompressed files).  Arrays are then copy-on-write views into the file rather than copies in RAM.
+
+    lazy : boolean
+        If the file was written with 'lazy', return a LazyDict that reads each member on first access
+
+    Returns
+    -------
+    the deserialized object
+
+    """
+    with open(filepath, 'rb') as FH:
+        header = read_header(FH)
+        codec  = header.get('codec')
+
+        source = FH
+        if options.get('mmap')  and  codec is None:
+            source = mmap.mmap(FH.fileno(), 0, access=mmap.ACCESS_COPY)   # Stays valid after FH is closed
+
+        if header.get('lazy')  and  options.get('lazy'):
+            if source is FH:
+                source = None                                               # LazyDict opens the file as needed
+            return LazyDict(filepath, header, source)
+
+        if header.get('lazy'):
+            return { s['key']:read_section(source, s, codec) for s in header['sections'] }
+
+        return read_section(source, header['sections'][0], codec)
+
+
+################################################################################
+# OBJECTS
+
+class LazyDict(MutableMapping):
+    """
+    A dict-like view onto a file written by dump() with the 'lazy' option.  Each member is read from disk only when first accessed,
+    and then kept.
+
+    """
+    def __init__(self, filepath, header, source=None):
+        self.filepath = filepath
+        self.codec    = header.get('codec')
+        self.source   = source                                          # mmap.mmap, or None to open the file per access
+        self.sections = { s['key']:s for s in header['sections'] }
+        self.loaded   = {}
+
+    def __getitem__(self, key):
+        try:
+            return self.loaded[key]
+        except KeyError:
+            pass
+        section = self.sections[key]                                    # raises KeyError for unknown members
+        if self.source is None:
+            with open(self.filepath, 'rb') as FH:
+                val = read_section(FH, section, self.codec)
+        else:
+            val = read_section(self.source, section, self.codec)
+        self.loaded[key] = val
+        return val
+
+    def __setitem__(self, key, val):
+        self.sections[key] = None
+        self.loaded[key] = val
+
+    def __delitem__(self, key):
+        del self.sections[key]
+        self.loaded.pop(key, None)
+
+    def __iter__(self):
+        return iter(self.sections)
+
+    def __len__(self):
+        return len(self.sections)
+
+    def __contains__(self, key):
+        return key in self.sections
+
+    def __repr__(self):
+        return 'LazyDict(%s, loaded=%s)'% (str(list(self.sections.keys())), str(list(self.loaded.keys())))
+
+    def materialize(self):
+        """
+        Load all members and return a plain dict
+        """
+        return { key:self[key] for key in self.sections }
+
+
+################################################################################
+################################################################################
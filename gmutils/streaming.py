@@ -0,0 +1,482 @@
+""" streaming.py
+
+    Read plain or compressed text files (.gz, .bz2, .xz, .zip, .zst) as a stream of lines or fixed-size byte chunks, with bounded
+    memory and deterministic closing of file handles.
+
+    Usage:
+
+        with FileReader('corpus.txt.gz') as reader:
+            for line in reader:
+                ...
+
+        with FileReader('corpus.txt.gz', {'processes':8}) as reader:     # Multi-member gzip (pigz, bgzip, concatenated .gz)
+            for chunk in reader.iter_chunks(1 << 20):
+                ...
+
+"""
+import os, sys, re
+import io
+import bz2
+import gzip
+import lzma
+import zlib
+import codecs
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+################################################################################
+# CONFIG
+
+default = {
+    'encoding'    : 'utf-8',
+    'errors'      : 'strict',
+    'chunk_size'  : 1 << 20,        # Bytes per chunk of decompressed output
+    'processes'   : 1,              # > 1 enables parallel decompression of multi-member gzip files
+    'block_size'  : 1 << 23,        # Compressed bytes handed to each worker when decompressing in parallel
+    'block_limit' : 1 << 25,        # Most decompressed bytes a worker returns at once (a larger member is streamed by the reader)
+}
+
+MAGIC = [
+    (b'\x1f\x8b',                  'gzip'),
+    (b'BZh',                       'bz2'),
+    (b'\xfd7zXZ\x00',              'xz'),
+    (b'PK\x03\x04',                'zip'),
+    (b'\x28\xb5\x2f\xfd',          'zstd'),
+]
+
+EXTENSIONS = {
+    '.gz'   : 'gzip',
+    '.bz2'  : 'bz2',
+    '.xz'   : 'xz',
+    '.lzma' : 'xz',
+    '.zip'  : 'zip',
+    '.zst'  : 'zstd',
+}
+
+GZIP_MEMBER = b'\x1f\x8b\x08'       # ID1, ID2, CM=deflate: the start of every gzip member
+
+################################################################################
+# FUNCTIONS
+
+def detect_codec(filepath):
+    """
+    Determine the compression codec of a file from its leading bytes, falling back on its extension
+
+    Returns
+    -------
+    str or None : one of 'gzip', 'bz2', 'xz', 'zip', 'zstd', or None for an uncompressed file
+
+    """
+    try:
+        with open(filepath, 'rb') as FH:
+            head = FH.read(8)
+        for magic, codec in MAGIC:
+            if head.startswith(magic):
+                return codec
+        if len(head) > 0:
+            return None
+    except OSError:
+        pass
+
+    ext = os.path.splitext(filepath)[1].lower()
+    return EXTENSIONS.get(ext)
+
+
+def zip_members(zf, filepath, member=None):
+    """
+    Choose which member(s) of a ZipFile to read:  the one requested, else the one named like the archive minus its extension, else
+    the only one, else all files in archive order.
+    """
+    names = [ info.filename for info in zf.infolist() if not info.is_dir() ]
+    if member is not None:
+        return [member]
+
+    inner = os.path.basename(filepath)
+    inner = re.sub(r'\.zip$', '', inner)
+    inner = re.sub(r'\.gz$', '', inner)
+    for name in names:
+        if name == inner  or  os.path.basename(name) == inner:
+            return [name]
+
+    return names
+
+
+def find_gzip_members(filepath, n, size=None):
+    """
+    Propose up to <n> offsets at which to split a gzip file, each being a plausible start of a gzip member.  Candidates are only
+    hints: parallel decompression verifies that they chain together and falls back to sequential decompression otherwise.
+
+    Returns
+    -------
+    sorted list of int, always beginning with 0
+
+    """
+    if size is None:
+        size = os.path.getsize(filepath)
+    offsets = [0]
+
+    with open(filepath, 'rb') as FH:
+        for k in range(1, n):
+            target = max(k * size // n, offsets[-1] + 1)
+            candidate = next_gzip_member(FH, target)
+            if candidate is None:
+                break                                                  # No more candidates before EOF
+            offsets.append(candidate)
+
+    return offsets
+
+
+def next_gzip_member(FH, offset, window=1 << 16):
+    """
+    Scan forward from <offset> for the next plausible gzip member header
+
+    Returns
+    -------
+    int or None
+
+    """
+    while True:
+        FH.seek(offset)
+        buf = FH.read(window + len(GZIP_MEMBER) - 1)
+        if len(buf) < len(GZIP_MEMBER):
+            return None
+        i = buf.find(GZIP_MEMBER)
+        while i >= 0:
+            if gzip_member_plausible(FH, offset + i):
+                return offset + i
+            i = buf.find(GZIP_MEMBER, i + 1)
+        offset += window
+
+
+def gzip_member_plausible(FH, offset, probe=1 << 14):
+    """
+    Cheaply test whether a gzip member starts at <offset> by decompressing its first few bytes
+    """
+    try:
+        FH.seek(offset)
+        d = zlib.decompressobj(wbits=31)
+        d.decompress(FH.read(probe), 1)
+        return True
+    except zlib.error:
+        return False
+
+
+def iter_gzip_member(FH, offset, chunk_size):
+    """
+    Decompress the one gzip member beginning at byte <offset> of an open file, never holding more than <chunk_size> decompressed
+    bytes at once
+
+    Yields
+    ------
+    (bytes, int or None) : a chunk of at most <chunk_size> bytes, and, with the last chunk (which may be empty), the offset just after
+        the member
+
+    """
+    FH.seek(offset)
+    d    = zlib.decompressobj(wbits=31)
+    read = 0
+    buf  = b''
+    while not d.eof:
+        if not buf:
+            buf = FH.read(1 << 20)
+            if not buf:
+                raise zlib.error("Truncated gzip member at offset %d"% offset)
+            read += len(buf)
+        chunk = d.decompress(buf, chunk_size)
+        buf = d.unconsumed_tail
+        if len(chunk) > 0  and  not d.eof:
+            yield chunk, None
+    yield chunk, offset + read - len(d.unused_data)                    # At EOF, the input left over is all in unused_data
+
+
+def decompress_gzip_range(filepath, start, end, limit=None):
+    """
+    Worker:  decompress whole gzip members beginning at byte <start>, continuing until a member begins at or after <end>, or until the
+    next member would take the output past <limit> bytes
+
+    Returns
+    -------
+    (bytes, int) : decompressed data, and the offset just after the last member decompressed.  This is before <end> if stopped by
+        <limit>, and is <start> if the first member alone is larger than <limit>.
+
+    """
+    if limit is None:
+        limit = default['block_limit']
+    out, size = [], 0
+    offset = start
+    with open(filepath, 'rb') as FH:
+        while offset < end:
+            member, n = [], 0
+            for chunk, after in iter_gzip_member(FH, offset, 1 << 20):
+                member.append(chunk)
+                n += len(chunk)
+                if size + n > limit:
+                    return b''.join(out), offset
+            out.extend(member)
+            size += n
+            offset = after
+
+    return b''.join(out), offset
+
+
+def split_lines(chunks, encoding='utf-8', errors='strict'):
+    """
+    Turn an iterator of byte chunks into an iterator of decoded lines (without line endings)
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors=errors)
+    partial = ''
+    for chunk in chunks:
+        text = partial + decoder.decode(chunk)
+        lines = text.split('\n')
+        partial = lines.pop()
+        for line in lines:
+            yield line.rstrip('\r')
+    partial += decoder.decode(b'', final=True)
+    if len(partial) > 0:
+        yield partial.rstrip('\r')
+
+
+################################################################################
+# OBJECTS
+
+class FileReader(object):
+    """
+    A single streaming reader for plain and compressed text files.  Use it as a context manager (or call close()) so that every
+    underlying file handle is closed as soon as reading stops.
+
+    Attributes
+    ----------
+    filepath : str
+
+    codec : str or None
+        Detected (or given) compression codec
+
+    """
+    def __init__(self, filepath, options=None):
+        """
+        Parameters
+        ----------
+        filepath : str
+
+        Options
+        -------
+        codec : str
+            Override codec detection
+
+        encoding : str
+
+        errors : str
+            How to handle undecodable bytes (as in bytes.decode)
+
+        member : str
+            For a zip archive, the member to read
+
+        processes : int
+            Number of worker processes for multi-member gzip decompression
+
+        """
+        if options is None:
+            options = {}
+        self.filepath   = filepath
+        self.codec      = options.get('codec') or detect_codec(filepath)
+        self.encoding   = options.get('encoding') or default['encoding']
+        self.errors     = options.get('errors') or default['errors']
+        self.member     = options.get('member')
+        self.chunk_size = options.get('chunk_size') or default['chunk_size']
+        self.processes  = options.get('processes') or default['processes']
+        self.block_size = options.get('block_size') or default['block_size']
+        self.block_limit = options.get('block_limit') or default['block_limit']
+        self.handles    = []                                           # Everything opened, closed in reverse order by close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def __iter__(self):
+        return self.iter_lines()
+
+
+    def close(self):
+        """
+        Close every file handle opened by this reader
+        """
+        while self.handles:
+            handle = self.handles.pop()
+            try:
+                handle.close()
+            except Exception:
+                pass
+
+
+    def track(self, handle):
+        self.handles.append(handle)
+        return handle
+
+
+    def open_streams(self):
+        """
+        Yield one binary stream of decompressed bytes per logical input (only zip archives can have more than one)
+        """
+        codec = self.codec
+        if codec == 'zip':
+            zf = self.track(zipfile.ZipFile(self.filepath))
+            for name in zip_members(zf, self.filepath, self.member):
+                yield self.track(zf.open(name))
+            return
+
+        raw = self.track(open(self.filepath, 'rb'))
+        if codec is None:
+            yield raw
+        elif codec == 'gzip':
+            yield self.track(gzip.GzipFile(fileobj=raw))
+        elif codec == 'bz2':
+            yield self.track(bz2.BZ2File(raw))
+        elif codec == 'xz':
+            yield self.track(lzma.LZMAFile(raw))
+        elif codec == 'zstd':
+            if zstandard is None:
+                raise ValueError("Reading '%s' requires the 'zstandard' package"% self.filepath)
+            yield self.track(zstandard.ZstdDecompressor().stream_reader(raw))
+        else:
+            raise ValueError("Unknown compression codec: %s"% str(codec))
+
+
+    def iter_chunks(self, chunk_size=None):
+        """
+        Yield the decompressed content as bytes objects of at most <chunk_size> bytes
+
+        """
+        if chunk_size is None:
+            chunk_size = self.chunk_size
+
+        if self.codec == 'gzip'  and  self.processes > 1:
+            for block in self.iter_gzip_parallel():
+                for i in range(0, len(block), chunk_size):
+                    yield block[i:i+chunk_size]
+            return
+
+        try:
+            for stream in self.open_streams():
+                while True:
+                    chunk = stream.read(chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+        finally:
+            self.close()
+
+
+    def iter_lines(self):
+        """
+        Yield decoded lines, without line endings
+        """
+        if self.codec == 'gzip'  and  self.processes > 1:
+            for line in split_lines(self.iter_gzip_parallel(), self.encoding, self.errors):
+                yield line
+            return
+
+        try:
+            for stream in self.open_streams():
+                text = io.TextIOWrapper(stream, encoding=self.encoding, errors=self.errors)
+                for line in text:
+                    yield line.rstrip('\r\n')
+                text.detach()                                          # Leave closing <stream> to self.close()
+        finally:
+            self.close()
+
+
+    def iter_gzip_parallel(self):
+        """
+        Decompress a multi-member gzip file in parallel, yielding decompressed blocks in file order.
+
+        Memory stays bounded:  each worker returns at most block_limit bytes, and at most 2 x processes workers' blocks are in flight.
+        A worker stops early (at a member boundary) rather than go past block_limit, and the rest of its range is handed out again.  A
+        member larger than block_limit is streamed here instead, chunk by chunk.  A file with only one member (an ordinary .gz), or
+        whose proposed member boundaries turn out to be wrong, is decompressed sequentially.
+        """
+        size    = os.path.getsize(self.filepath)
+        n       = max(1, size // self.block_size)
+        offsets = find_gzip_members(self.filepath, n, size) + [size]
+        ranges  = list(zip(offsets[:-1], offsets[1:]))
+        window  = 2 * self.processes
+
+        def submit(pool, start, end):
+            return (start, end, pool.submit(decompress_gzip_range, self.filepath, start, end, self.block_limit))
+
+        expected = 0                                                   # Offset where the next verified member begins
+        if len(ranges) > 1:
+            with ProcessPoolExecutor(max_workers=self.processes) as pool, open(self.filepath, 'rb') as FH:
+                pending = []
+                r = 0
+                while r < len(ranges)  or  pending:
+                    while r < len(ranges)  and  len(pending) < window:
+                        pending.append( submit(pool, *ranges[r]) )
+                        r += 1
+
+                    start, end, future = pending.pop(0)
+                    try:
+                        data, after = future.result()
+                    except zlib.error:
+                        data, after = None, None
+
+                    if start != expected  or  data is None:            # Bad split point: finish sequentially
+                        for f in pending:
+                            f[2].cancel()
+                        break
+                    if len(data) > 0:
+                        yield data
+                    expected = after
+
+                    if expected < end:                                 # Stopped by block_limit
+                        if expected == start:                          # One member larger than block_limit: stream it here
+                            for chunk, after in iter_gzip_member(FH, expected, self.chunk_size):
+                                if len(chunk) > 0:
+                                    yield chunk
+                            expected = after
+                        if expected < end:
+                            pending.insert(0, submit(pool, expected, end))
+
+        if expected < size:
+            with open(self.filepath, 'rb') as FH:
+                FH.seek(expected)
+                with gzip.GzipFile(fileobj=FH) as stream:
+                    while True:
+                        chunk = stream.read(self.chunk_size)
+                        if not chunk:
+                            break
+                        yield chunk
+
+
+################################################################################
+# FUNCTIONS
+
+def iter_lines(filepath, options=None):
+    """
+    Generator over the lines of a plain or compressed file.  The file is closed when the generator is exhausted or closed.
+    """
+    with FileReader(filepath, options) as reader:
+        for line in reader.iter_lines():
+            yield line
+
+
+def iter_chunks(filepath, chunk_size=None, options=None):
+    """
+    Generator over fixed-size chunks of the decompressed content of a file
+    """
+    with FileReader(filepath, options) as reader:
+        for chunk in reader.iter_chunks(chunk_size):
+            yield chunk
+
+
+################################################################################
+################################################################################
@@ -8,7 +8,7 @@ import numpy as np
 import tensorflow as tf
 
 from gmutils.utils import err, argparser
-from gmutils.objects import Object
+from gmutils.objects import Object, memoized
 
 ################################################################################
 # CONFIG
@@ -160,27 +160,26 @@ class TensorflowGraph(Object):
         return tf.constant(val, dtype=self.get('dtype'), shape=(1, 1))
 
         
+    @memoized()
     def empty_float(self):
         """
         Get the empty float and use it again.  It's a constant and it's empty
         """
-        if not self.done():
-            enode = tf.constant(0.0, dtype=self.get('dtype'), shape=(1, 1))
-            self.set('empty_float', enode)
-        return self.get('empty_float')
+        return tf.constant(0.0, dtype=self.get('dtype'), shape=(1, 1))
 
         
     def empty_node(self, dim=None):
         """
-        Get the empty node and use it again.  It's a constant.  Assumes all node vectors same dim
+        Get the empty node and use it again.  It's a constant.  One is made for each dim.
         """
         if dim is None:
-            dim = self.get('dim')   # WARNING: if you need empty nodes of different dimensions, use another func
-        
-        if not self.done():
-            enode = tf.constant( [0.0]*dim, dtype=self.get('dtype'), shape=(1, dim) )
-            self.set('empty_node', enode)
-        return self.get('empty_node')
+            dim = self.get('dim')
+        return self.empty_node_of_dim(dim)
+
+
+    @memoized()
+    def empty_node_of_dim(self, dim):
+        return tf.constant( [0.0]*dim, dtype=self.get('dtype'), shape=(1, dim) )
             
             
     def print(self, tensor, text):
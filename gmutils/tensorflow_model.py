@@ -9,6 +9,7 @@ import numpy as np
 import tensorflow as tf
 
 from gmutils.utils import err, argparser, read_dir
+from gmutils.progress import Monitor
 from gmutils.model import Model
 
 ################################################################################
@@ -92,6 +93,12 @@ class TensorflowModel(Model):
         """
         Estimate the length of time it takes to finish one epoch
         """
+        if isinstance(self._monitor, Monitor):
+            sec = self._monitor.estimated_total()
+            if sec is None:
+                return 0.0
+            return sec / 3600.0
+        
         global squadx_train_t0
         try:
             squadx_train_t0
@@ -140,27 +147,27 @@ class TensorflowModel(Model):
 
                 # Output training state to the command line
                 if not self.get('silent'):
-                    last_update_line = self._monitor.get('update_line')
                     lrate            = self._monitor.get('learning_rate')
-                    progress         = self._monitor['progress']
                     epoch_time       = self.estimate_epoch_time()
-                    
-                    # err([self._monitor['progress'], epoch, self._monitor['i'], step, loss_val, lr])
-                    update_line =  "%s (e %d, b %d, s %d) [loss %0.16f] {lr %08f} (epoch per: %0.2f hrs)"% (
-                        progress,
+                    state = "(e %d, b %d, s %d) [loss %0.16f] {lr %08f} (epoch per: %0.2f hrs)"% (
                         epoch,
                         self._monitor['i'],
                         step,
                         loss_val,
                         lrate,
                         epoch_time )
-                    
-                    if last_update_line is not None:
-                        sys.stderr.write('\b' * (len(last_update_line) + 1))   # 0 for no newline
-                    sys.stderr.write('\n')
-                    sys.stderr.write(update_line)
-                    sys.stderr.flush()
-                    self._monitor['update_line'] = update_line
+
+                    if isinstance(self._monitor, Monitor):
+                        self._monitor.set_postfix(state)   # Written with the progress line, at the Monitor's own interval
+                    else:
+                        last_update_line = self._monitor.get('update_line')
+                        update_line = "%s %s"% (self._monitor['progress'], state)
+                        if last_update_line is not None:
+                            sys.stderr.write('\b' * (len(last_update_line) + 1))   # 0 for no newline
+                        sys.stderr.write('\n')
+                        sys.stderr.write(update_line)
+                        sys.stderr.flush()
+                        self._monitor['update_line'] = update_line
                     
                 return output
             
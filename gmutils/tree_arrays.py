@@ -0,0 +1,262 @@
+""" tree_arrays.py
+
+    Struct-of-arrays storage for the Node trees of one Document.
+
+    Every Node is created for one token (its head token), and is numbered by that token's index.  The shape of the trees lives in flat
+    int32 arrays indexed by node number (parent, first/last child, next/previous sibling), and which node holds each token in an int32
+    array indexed by token.  A Node object is then only a small view (see node.py) holding its number, its tokens and its Document.
+
+    The arrays are built from spaCy's own dependency tree, read straight from Doc.to_array(HEAD), leaving out the tokens that do not
+    become Nodes (punctuation, whitespace; see node.build_trees).  Tree operations relink nodes afterwards.  -1 means "none".
+
+"""
+import os, sys, re
+import numpy as np
+
+from spacy.attrs import HEAD
+
+################################################################################
+# FUNCTIONS
+
+def head_array(spacy_doc):
+    """
+    Absolute index of each token's syntactic head (a root is its own head)
+
+    Returns
+    -------
+    numpy array of int32
+
+    """
+    n = len(spacy_doc)
+    if n == 0:
+        return np.zeros(0, dtype=np.int32)
+    relative = spacy_doc.to_array([HEAD]).reshape(-1).astype(np.int64)     # uint64 two's complement -> signed offsets
+    return (np.arange(n, dtype=np.int64) + relative).astype(np.int32)
+
+
+def depth_array(parent):
+    """
+    Depth of each node given the parent array (-1 for roots), by climbing all nodes at once
+
+    """
+    depth    = np.zeros(len(parent), dtype=np.int32)
+    ancestor = parent.copy()
+    while True:
+        above = ancestor >= 0
+        if not above.any():
+            return depth
+        depth += above
+        ancestor[above] = parent[ ancestor[above] ]
+
+
+def group_by_parent(parent):
+    """
+    The non-root nodes grouped by parent, each group in order of node number
+
+    Returns
+    -------
+    child : numpy array of int32
+        Node numbers
+
+    start : numpy array of int
+        Where each group begins in <child>
+
+    """
+    index = np.arange(len(parent), dtype=np.int32)
+    child = index[parent >= 0]
+    child = child[ np.argsort(parent[child], kind='stable') ]
+    p     = parent[child]
+    start = np.flatnonzero( np.concatenate(([True], p[1:] != p[:-1])) ) if len(child) > 0 else np.zeros(0, dtype=np.int64)
+    return child, start
+
+
+def sibling_ranks(parent):
+    """
+    Position of each node among its parent's children (0 for the first; 0 for roots too)
+    """
+    rank = np.zeros(len(parent), dtype=np.int32)
+    child, start = group_by_parent(parent)
+    if len(child) > 0:
+        group_start = np.repeat(start, np.diff(np.append(start, len(child))))
+        rank[child] = np.arange(len(child)) - group_start
+    return rank
+
+
+################################################################################
+# OBJECTS
+
+class TreeArrays(object):
+    """
+    The trees of one Document, as arrays
+
+    Attributes
+    ----------
+    parent, first_child, last_child, next_sibling, prev_sibling : numpy arrays of int32
+        Links between nodes, indexed by node number
+
+    depth : numpy array of int32
+        Depth of each token in the parse the trees were built from
+
+    owner : numpy array of int32
+        token.i -> number of the Node holding that token
+
+    nodes : list of Node (or None), by node number
+
+    ids : list of str (or None), by node number.  The ID of each Node (see Node.get)
+
+    touched : set of int, or None
+        When a set, the numbers of all nodes linked, unlinked, or given tokens are added to it (see rewrite.py)
+
+    """
+    def __init__(self, n):
+        self.parent       = np.full(n, -1, dtype=np.int32)
+        self.first_child  = np.full(n, -1, dtype=np.int32)
+        self.last_child   = np.full(n, -1, dtype=np.int32)
+        self.next_sibling = np.full(n, -1, dtype=np.int32)
+        self.prev_sibling = np.full(n, -1, dtype=np.int32)
+        self.depth        = np.zeros(n, dtype=np.int32)
+        self.owner        = np.full(n, -1, dtype=np.int32)
+        self.nodes        = [None] * n
+        self.ids          = [None] * n
+        self.touched      = None
+
+
+    @classmethod
+    def from_doc(cls, spacy_doc):
+        """
+        Arrays holding spaCy's dependency tree for <spacy_doc>, with children in token order (as Token.children gives them).  No
+        tokens are owned yet.
+
+        """
+        n = len(spacy_doc)
+        arrays = cls(n)
+        if n == 0:
+            return arrays
+
+        index  = np.arange(n, dtype=np.int32)
+        head   = head_array(spacy_doc)
+        arrays.set_links( np.where(head == index, -1, head).astype(np.int32) )
+        arrays.depth = depth_array(arrays.parent)
+        return arrays
+
+
+    def set_links(self, parent):
+        """
+        Replace all links:  each node's children become the nodes whose <parent> it is, in order of node number
+
+        Parameters
+        ----------
+        parent : numpy array of int32 (-1 for roots and for nodes not in any tree)
+
+        """
+        self.parent = parent.astype(np.int32)
+        for links in (self.first_child, self.last_child, self.next_sibling, self.prev_sibling):
+            links.fill(-1)
+
+        child, start = group_by_parent(self.parent)
+        if len(child) == 0:
+            return
+        p     = self.parent[child]
+        first = np.zeros(len(child), dtype=bool)
+        first[start] = True
+        last  = np.append(first[1:], True)
+        self.first_child[ p[first] ] = child[first]
+        self.last_child[ p[last] ]   = child[last]
+        self.next_sibling[ child[:-1][~last[:-1]] ] = child[1:][~first[1:]]
+        self.prev_sibling[ child[1:][~first[1:]] ]  = child[:-1][~last[:-1]]
+
+
+    def __len__(self):
+        return len(self.parent)
+
+
+    def children(self, i):
+        """
+        Numbers of the children of node <i>, in order
+        """
+        out = []
+        c = int(self.first_child[i])
+        while c >= 0:
+            out.append(c)
+            c = int(self.next_sibling[c])
+        return out
+
+
+    def pre_order(self, roots):
+        """
+        Numbers of all nodes in the trees under <roots> (node numbers), in pre-order, tree after tree
+        """
+        parent, first, nxt = self.parent.tolist(), self.first_child.tolist(), self.next_sibling.tolist()
+        out = []
+        for r in roots:
+            i = r
+            while True:
+                out.append(i)
+                if first[i] >= 0:                      # Down
+                    i = first[i]
+                    continue
+                while i != r  and  nxt[i] < 0:         # Up, until there is a next sibling
+                    i = parent[i]
+                if i == r:
+                    break
+                i = nxt[i]                             # Across
+        return out
+
+
+    def num_children(self, i):
+        n = 0
+        c = self.first_child[i]
+        while c >= 0:
+            n += 1
+            c = self.next_sibling[c]
+        return n
+
+
+    def unlink(self, i):
+        """
+        Detach node <i> from its parent (if any)
+        """
+        p = self.parent[i]
+        if p < 0:
+            return
+        if self.touched is not None:
+            self.touched.update( (int(p), i) )
+        prev, nxt = self.prev_sibling[i], self.next_sibling[i]
+        if prev >= 0:
+            self.next_sibling[prev] = nxt
+        else:
+            self.first_child[p] = nxt
+        if nxt >= 0:
+            self.prev_sibling[nxt] = prev
+        else:
+            self.last_child[p] = prev
+        self.parent[i] = self.prev_sibling[i] = self.next_sibling[i] = -1
+
+
+    def link(self, p, i):
+        """
+        Make node <i> the last child of node <p> (detaching it from any previous parent)
+        """
+        self.unlink(i)
+        if self.touched is not None:
+            self.touched.update( (p, i) )
+        last = self.last_child[p]
+        if last >= 0:
+            self.next_sibling[last] = i
+        else:
+            self.first_child[p] = i
+        self.prev_sibling[i] = last
+        self.last_child[p] = i
+        self.parent[i] = p
+
+
+    def nbytes(self):
+        """
+        Memory held by the arrays (not counting the Node objects)
+        """
+        return sum( a.nbytes for a in (self.parent, self.first_child, self.last_child, self.next_sibling, self.prev_sibling, self.depth,
+                                       self.owner) )
+
+
+################################################################################
+################################################################################
@@ -0,0 +1,189 @@
+""" tree_index.py
+
+    Ancestry index over the Node trees of one Document.
+
+    Nodes are numbered in pre-order (so that each subtree is a contiguous interval of positions, as in an Euler tour), along with the
+    depth of each node and a binary-lifting table of ancestors.  Given these, "is A an ancestor of B?" is two comparisons, and the lowest
+    common ancestor of two nodes, or the graph distance between them, takes O(log n) steps.
+
+    The index describes the trees as they were when it was built.  Document keeps it (see Document.get_tree_index) together with a
+    version number that every tree operation increments, and rebuilds it on demand once the trees have changed.
+
+"""
+import os, sys, re
+import numpy as np
+
+################################################################################
+# OBJECTS
+
+class TreeIndex(object):
+    """
+    Pre-order intervals, depths, and ancestor tables for a forest of Nodes
+
+    Attributes
+    ----------
+    nodes : list of Node
+        In pre-order, tree after tree
+
+    position : dict { Node -> int }
+
+    parent : numpy array of int
+        Position of each node's parent (a root is its own parent)
+
+    last : numpy array of int
+        Position of the last node in each node's subtree.  The subtree of the node at position i is [i, last[i]].
+
+    depth : numpy array of int
+
+    root : numpy array of int
+        Position of the root of each node's tree
+
+    up : list of numpy arrays of int
+        up[j][i] is the position of the 2^j-th ancestor of node i (stopping at the root)
+
+    """
+    def __init__(self, trees):
+        """
+        Parameters
+        ----------
+        trees : list of Node (roots)
+
+        """
+        self.nodes    = []
+        self.position = {}
+        parents = []
+        for tree in trees:
+            stack = [ (tree, -1) ]
+            while stack:
+                node, parent = stack.pop()
+                if node in self.position:              # Only ever indexed once, even if the links are inconsistent
+                    continue
+                i = len(self.nodes)
+                self.position[node] = i
+                self.nodes.append(node)
+                parents.append(i if parent < 0 else parent)
+                for child in reversed(node.children or []):
+                    stack.append( (child, i) )
+
+        n      = len(self.nodes)
+        depth  = [0] * n
+        root   = list(range(n))
+        sizes  = [1] * n
+        for i in range(n):                             # Pre-order:  parents come before their children
+            p = parents[i]
+            if p != i:
+                depth[i] = depth[p] + 1
+                root[i]  = root[p]
+        for i in range(n-1, -1, -1):                   # ... and each subtree ends before its parent's does
+            p = parents[i]
+            if p != i:
+                sizes[p] += sizes[i]
+
+        self.parent = np.array(parents, dtype=np.int64)
+        self.depth  = np.array(depth, dtype=np.int64)
+        self.root   = np.array(root, dtype=np.int64)
+        self.last   = np.arange(n, dtype=np.int64) + np.array(sizes, dtype=np.int64) - 1
+
+        # Binary lifting
+        self.up = [ self.parent ]
+        levels = int(self.depth.max()).bit_length() if n > 0 else 0
+        for j in range(1, max(levels, 1)):
+            self.up.append( self.up[-1][ self.up[-1] ] )
+
+
+    def __len__(self):
+        return len(self.nodes)
+
+
+    def __contains__(self, node):
+        return node in self.position
+
+
+    def is_ancestor(self, a, b):
+        """
+        Is Node <a> a proper ancestor of Node <b>?
+        """
+        i, j = self.position[a], self.position[b]
+        return i < j <= self.last[i]
+
+
+    def get_depth(self, node):
+        return int(self.depth[ self.position[node] ])
+
+
+    def get_root(self, node):
+        return self.nodes[ self.root[ self.position[node] ] ]
+
+
+    def lca_position(self, i, j):
+        """
+        Position of the lowest common ancestor of the nodes at positions <i> and <j> (which may be either of them), or -1 if they are
+        in different trees
+        """
+        if self.root[i] != self.root[j]:
+            return -1
+        if i <= j <= self.last[i]:
+            return i
+        if j <= i <= self.last[j]:
+            return j
+        for up in reversed(self.up):                   # Climb from i to just below the common ancestor
+            k = up[i]
+            if not (k <= j <= self.last[k]):
+                i = k
+        return int(self.parent[i])
+
+
+    def lca(self, a, b):
+        """
+        Lowest common ancestor of Nodes <a> and <b> (possibly one of them), or None if they are in different trees (or not in any)
+        """
+        i, j = self.position.get(a), self.position.get(b)
+        if i is None  or  j is None:
+            return None
+        k = self.lca_position(i, j)
+        if k < 0:
+            return None
+        return self.nodes[k]
+
+
+    def distance(self, a, b):
+        """
+        Number of edges between Nodes <a> and <b>, or None if they are in different trees (or not in any)
+        """
+        i, j = self.position.get(a), self.position.get(b)
+        if i is None  or  j is None:
+            return None
+        k = self.lca_position(i, j)
+        if k < 0:
+            return None
+        return int(self.depth[i] + self.depth[j] - 2 * self.depth[k])
+
+
+    def group_ancestor(self, nodes):
+        """
+        Lowest common ancestor of all of <nodes> (possibly one of them).  If they span several trees, the root of the tree of the
+        shallowest node.
+
+        Parameters
+        ----------
+        nodes : iterable of Node
+
+        Returns
+        -------
+        Node
+
+        """
+        positions = [ self.position[node] for node in nodes ]
+        if len(positions) == 0:
+            return None
+        k = positions[0]
+        for i in positions[1:]:
+            k = self.lca_position(k, i)
+            if k < 0:
+                shallowest = min(positions, key=lambda p: self.depth[p])
+                return self.nodes[ self.root[shallowest] ]
+        return self.nodes[k]
+
+
+################################################################################
+################################################################################
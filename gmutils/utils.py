@@ -5,23 +5,23 @@
 """
 import os, sys, re
 import time
+import itertools
 import traceback
 import json
 import gzip
 import zipfile
 import pickle
-from sklearn.externals import joblib
-import dill
-import inspect
-import requests
 import argparse
 import csv
 import math
 import numpy as np
-import scipy
-import pandas as pd
-from sklearn.model_selection import ShuffleSplit
-from scipy import spatial
+
+from gmutils import log
+from gmutils import serialization
+from gmutils.serialization import atomic_write
+from gmutils.streaming import FileReader
+from gmutils.line_index import LineIndex, count_lines
+from gmutils.progress import Monitor
 
 np.set_printoptions(linewidth=260)
                         
@@ -167,64 +167,42 @@ def err(vars=[], options={}):
     Paramters
     ---------
     vars : list or str
-        a list of values to be printed
+        a list of values to be printed.  Wrap expensive values in log.Lazy so they are only computed if printed.
 
     Options
     -------
-    verbose : boolean
+    level : int
+        Urgency of this call (default 2)
 
     exception : Exception (optional)
 
     ex : create and Exception
 
+    format : str
+        'text' (default) or 'json' (one JSON object per line).  Also set by the GM_LOG_FORMAT env var.
+
     GM_LEVEL (env var)
-        Lowest value allows all errors and warnings to print
+        Lowest value allows all errors and warnings to print.  Calls below it return before any frame inspection or formatting.
 
     """
-    verbose = False
-    
     # Information about the urgency of this call
     call_level = options.get('level')
-    if call_level is None:  call_level = 2    # default is 2 (more urgent than level 1)
-    os_level = 0
-    try:
-        os_level = int(os.environ['GM_LEVEL'])
-    except:  pass
-        
-    callerframerecord = inspect.stack()[1]    # 0 represents this line
-                                              # 1 represents line at caller
-    frame = callerframerecord[0]
-    info  = inspect.getframeinfo(frame)
-    file  = os.path.basename(info.filename)
-    line  = info.lineno
+    if call_level is None:  call_level = log.INFO    # default is 2 (more urgent than level 1)
+    os_level = log.os_level()
+    show = call_level+1 >= os_level
 
     # Parse exception
     exception = options.get('exception')
     if exception is None:
         if options.get('ex'):
             exception = ValueError(options.get('ex'))
-            
-    if isFalse(options, 'silent')  and  call_level+1 >= os_level:
-        sys.stderr.write("\nDEBUG (Line %d) from file %s:\n"% (line, info.filename))
-            
-        # Print vars to STDERR if present
-        if len(vars) > 0:
-            if isinstance(vars, str):
-                sys.stderr.write('\tVAR  |%s|\n' % vars)
-            else:
-                if verbose:  sys.stderr.write("err 217: " + str(vars) + "\n")
-                for v in vars:
-                    if verbose:  sys.stderr.write("err 219: " + str(v) + "\n")
-                    sys.stderr.write('\tVAR  |%s|  %s\n'% (str(v), str(type(v))) )
-                sys.stderr.write('\n')
-
-    # Conditional printing of the exception
-    if isTrue(options, 'warning')  or  call_level+1 >= os_level:
-        if isFalse(options, 'silent'):
-            if exception:
-                for arg in exception.args:
-                    sys.stderr.write("ERROR: {}\n".format(arg))
-                sys.stderr.write("\n\t"+ str(sys.exc_info()[0]) +"\n")
+
+    # Only look up the caller and format <vars> if something will be written
+    if isFalse(options, 'silent'):
+        if show:
+            log.write( log.make_record(call_level, vars=vars, exception=exception, depth=1), options )
+        elif exception  and  isTrue(options, 'warning'):
+            log.write( log.make_record(call_level, exception=exception, depth=1), options, header=False )
             
     # Conditional return
     if isTrue(options, 'exit'):
@@ -247,28 +225,21 @@ def read_zipfile(file, options={}):
     -------
     'one str' : if True, will return a single str (By default, each line is a separate str)
 
+    member : str
+        Name of the member to read (by default: 'file' minus the extension, else every member in order)
+
     Returns
     -------
     str or array of str
     """
-    zipfile = Zipfile(file)
-    innerfile = re.sub(r'\.zip$', '', file)
-    innerfile = re.sub(r'\.gz$', '', innerfile)
-    
-    final = []
-    with open(zipfile.open(innerfile)) as resource:
-        for line in resource:
-            final.append(line.rstrip())
-
-    if isTrue(options, 'one str'):
-        return "\n".join(final)
-
-    return final
+    options = dict(options)
+    options['codec'] = 'zip'
+    return read_file(file, options=options)
     
 
 def read_file(file, options={}):
     """
-    Read text from 'file'
+    Read text from 'file'.  Compressed files (.gz, .bz2, .xz, .zip, .zst) are detected and decompressed on the fly.
 
     Parameters
     ----------
@@ -278,6 +249,8 @@ def read_file(file, options={}):
     -------
     'one str' : if True, will return a single str (By default, each line is a separate str)
 
+    See gmutils.streaming.FileReader for further options (encoding, processes, etc.)
+
     Returns
     -------
     str or array of str
@@ -285,13 +258,9 @@ def read_file(file, options={}):
     if isVerbose(options):
         sys.stderr.write("Reading file '%s' ...\n"% file)
 
-    if re.search(r'\.zip$', file)  or  re.search(r'\.zip$', file):
-        return read_zipfile(file, options=options)
-        
     final = []
-    with open(file) as resource:
-        for line in resource:
-            final.append(line.rstrip())
+    for line in iter_file(file, options=options):
+        final.append(line)
 
     if isTrue(options, 'one str'):
         return "\n".join(final)
@@ -301,12 +270,25 @@ def read_file(file, options={}):
 
 def iter_file(file, options=None):
     """
-    Create an iterator for 'file' to read it line by line
+    Create an iterator for 'file' to read it line by line.  Compressed files are decompressed as a stream.  The file is closed as soon
+    as the iterator is exhausted or closed.
 
     Parameters
     ----------
     file : str
 
+    Options
+    -------
+    start_line : int
+        Begin at this line.  For uncompressed files, a line index (see line_index.py) is used to seek directly to it.
+
+    save_line_index : boolean
+        With 'start_line' or 'start_percent', save the line index next to an uncompressed file (if none is saved yet) so that later
+        starts need not scan the file
+
+    start_percent : float
+        Begin this percentage of the way through the file's lines.  Pairs with monitor_setup(file, options={'skipped':start_percent})
+
     Returns
     -------
     iterator
@@ -315,10 +297,44 @@ def iter_file(file, options=None):
     if isVerbose(options):
         sys.stderr.write("Creating iterator for file '%s' ...\n"% file)
 
-    FH = open(file, 'r')
-    iterator = iter(FH)
-    for line in iterator:
-        yield line.rstrip()
+    if not isinstance(options, dict):
+        options = None
+    start = 0
+    if options is not None:
+        if options.get('start_line'):
+            start = int(options.get('start_line'))
+        elif options.get('start_percent'):
+            start = int( (float(num_lines_in_file(file)) * float(options.get('start_percent'))) / 100. )
+
+    with FileReader(file, options) as reader:
+        if start > 0  and  reader.codec is None:
+            lines = LineIndex(file, {'save':options.get('save_line_index')}).iter_lines(start, encoding=reader.encoding)
+        else:
+            lines = itertools.islice(reader.iter_lines(), start, None)
+        for line in lines:
+            yield line.rstrip()
+
+
+def iter_file_chunks(file, chunk_size=None, options=None):
+    """
+    Create an iterator over 'file' in decompressed byte chunks of at most 'chunk_size' bytes
+
+    Parameters
+    ----------
+    file : str
+
+    chunk_size : int
+
+    Returns
+    -------
+    iterator of bytes
+
+    """
+    if not isinstance(options, dict):
+        options = None
+    with FileReader(file, options) as reader:
+        for chunk in reader.iter_chunks(chunk_size):
+            yield chunk
 
 
 def generate_file_iterator(dirpath, options={}):
@@ -515,7 +531,8 @@ def is_KerasModel(thing):
 
 def serialize(thing, file=None, directory=None, options={}):
     """
-    Serialize an object and save it to disk
+    Serialize an object and save it to disk.  By default the file is written via gmutils.serialization (pickle protocol 5, raw
+    out-of-band arrays, atomic rename).
 
     Parameters
     ----------
@@ -524,13 +541,25 @@ def serialize(thing, file=None, directory=None, options={}):
     file : str
 
     directory : str
-    """
-    # Informative STDERR output
-    if isVerbose(options):
-        thingType = re.sub(r"^.*'(.*)'.*$", r"\1", (str(type(thing))))
-        thingType = re.sub(r"__main__\.", "", thingType)
-        sys.stderr.write("Saving %s to %s ...\n"% ( thingType, file))
 
+    Options
+    -------
+    joblib : boolean
+        Use joblib instead
+
+    dill : boolean
+        Use dill instead
+
+    compress : str
+        One of 'zstd', 'lz4', or 'gzip'
+
+    level : int
+        Compression level
+
+    lazy : boolean
+        For a dict, store each member separately so that it can be loaded on first access
+
+    """
     # Determine location
     try:
         if file is None:
@@ -538,7 +567,13 @@ def serialize(thing, file=None, directory=None, options={}):
         if directory is None:
             directory = thing.get('default_dir')
     except: pass
-            
+
+    # Informative STDERR output
+    if isVerbose(options):
+        thingType = re.sub(r"^.*'(.*)'.*$", r"\1", (str(type(thing))))
+        thingType = re.sub(r"__main__\.", "", thingType)
+        sys.stderr.write("Saving %s to %s ...\n"% ( thingType, file))
+
     # Serialize a Keras Model
     if is_KerasModel(thing):
         return serialize_KerasModel(thing, directory)
@@ -550,18 +585,30 @@ def serialize(thing, file=None, directory=None, options={}):
         filepath = directory +'/'+ file
         
     if isTrue(options, 'joblib'):
-        joblib.dump(thing, file)
+        with atomic_write(filepath) as FH:
+            get_joblib().dump(thing, FH)
     elif isTrue(options, 'dill'):
-        with open(file,'wb') as FH:
+        import dill
+        with atomic_write(filepath) as FH:
             dill.dump(thing, FH)
     else:
-        with open(file,'wb') as FH:
-            pickle.dump(thing, FH)
+        serialization.dump(thing, filepath, options=options)
+
+
+def get_joblib():
+    """
+    joblib, imported on first use.  Before scikit-learn 0.23 it was only found as sklearn.externals.joblib.
+    """
+    try:
+        import joblib
+    except ImportError:
+        from sklearn.externals import joblib
+    return joblib
 
 
 def deserialize(file=None, directory=None, options={}):
     """
-    De-Serialize an object from disk
+    De-Serialize an object from disk.  The format (gmutils.serialization, pickle, dill, or joblib) is detected from the file itself.
 
     Parameters
     ----------
@@ -569,6 +616,14 @@ def deserialize(file=None, directory=None, options={}):
 
     directory : str
 
+    Options
+    -------
+    mmap : boolean
+        Memory-map arrays from an uncompressed gmutils.serialization file instead of reading them into RAM
+
+    lazy : boolean
+        Return a LazyDict for a dict saved with 'lazy'
+
     """
     # options['verbose'] = True
     
@@ -577,24 +632,35 @@ def deserialize(file=None, directory=None, options={}):
         weights_file = directory + '/trained_model.h5'
         if os.path.isfile(weights_file):
             return deserialize_KerasModel(directory, options)
+        if file is not None:
+            file = directory +'/'+ file
         
     if isVerbose(options):
         sys.stderr.write("Deserializing %s ...\n"% file)
 
     if isTrue(options, 'joblib'):
-        thing = joblib.load(file)
-        return thing
-    elif isTrue(options, 'dill'):
+        return get_joblib().load(file)
+    if isTrue(options, 'dill'):
+        import dill
+        with open(file,'rb') as FH:
+            return dill.load(FH)
+
+    kind = serialization.detect_format(file)
+    if kind == 'gmutils':
+        return serialization.load(file, options=options)
+    elif kind == 'pickle':
         with open(file,'rb') as FH:
             try:
-                thing = dill.load(FH)
-                return thing
-            except:
-                return thing
+                return pickle.load(FH)
+            except Exception:                         # Pickles of lambdas, closures, etc. only load with dill
+                FH.seek(0)
+                try:
+                    import dill
+                    return dill.load(FH)
+                except Exception:                     # Or joblib, if its first array was beyond what detect_format() reads
+                    return get_joblib().load(file)
     else:
-        with open(file,'rb') as FH:
-            thing = pickle.load(FH)
-            return thing
+        return get_joblib().load(file)                # joblib handles its own compressed formats (and 'joblib')
 
 
 def serialize_Model(thing, directory, options={}):
@@ -678,13 +744,20 @@ def mkdirs(paths):
 
 def num_lines_in_file(file):
     """
-    Get the number of lines in a file
+    Get the number of lines in a file, counted as by 'wc -l' (newlines).  For uncompressed files this is O(1) if a line index (see
+    line_index.py) has been saved next to the file; none is created here.  Compressed files are counted by streaming through them.
     """
-    for line in os.popen("wc -l %s"% file):
-        if re.search('^\s*\d', line):
-            lno = re.sub(r'^\s*(\d+)\s.*$', r'\1', line)
-            return int(lno)
-    return -1
+    try:
+        reader = FileReader(file)
+        if reader.codec is None:
+            return count_lines(file)
+        n = 0
+        with reader:
+            for chunk in reader.iter_chunks():
+                n += chunk.count(b'\n')
+        return n
+    except OSError:
+        return -1
 
 
 def num_from_filename(file):
@@ -713,15 +786,30 @@ def monitor_setup(file, total_i=None, options={}):
     for line in read_file(filename):
         _monitor = monitor(_monitor)
 
+    # Resume <skip> percent of the way through a file without reading the lines before it
+    _monitor = monitor_setup(filename, options={'skipped':skip})
+    for line in iter_file(filename, {'start_percent':skip}):
+        _monitor = monitor(_monitor)
+
     Parameters
     ----------
     file : str
 
     total_i : int
 
+    Options
+    -------
+    skip, skipped, silent : see gmutils.progress.Monitor
+
+    interval : float
+        Seconds between status-line updates
+
+    threadsafe, shared : boolean
+        Aggregate counts across threads / forked processes
+
     Returns
     -------
-    dict
+    Monitor (a dict)
 
     """
     if total_i is None:
@@ -730,36 +818,31 @@ def monitor_setup(file, total_i=None, options={}):
         else:
             total_i = num_lines_in_file(file)  # Assumes the input must be a file
         
-    last_done = 0.0
     # sys.stderr.write("\tLines to read: %d\n"% total_i)
-    i = 0
-    _monitor = { 'total_i':total_i,
-                 'i':i,
-                 'last_done':last_done,
-                 'skip':options.get('skip'),
-                }
-
-    # Handle the situation where a previous _monitor already skipped ahead
-    if options.get('skipped'):
-        skipped = options.get('skipped')
-        _monitor['i'] = int( (float(total_i) * float(skipped)) / 100. )
-       
-    return _monitor
+    return Monitor(total_i, options=options)   # A dict: also handles 'skip' and 'skipped' (a previous _monitor already skipped ahead)
 
         
 def monitor(_monitor, options={}):
     """
     To monitor progress on the command line.  See monitor_setup() above.
 
+    With a Monitor (from monitor_setup) this only counts the item; the clock is consulted every so many items, and the status line
+    (percent done, items/sec, elapsed, ETA) is rewritten at most every 'interval' seconds.  A plain dict is still handled the old way.
+
     Parameters
     ----------
-    _monitor : dict
+    _monitor : Monitor or dict
 
     Returns
     -------
     _monitor
 
     """
+    if isinstance(_monitor, Monitor):
+        if options:
+            _monitor.silent = bool(options.get('silent'))
+        return _monitor.tick()
+
     total_i = _monitor.get('total_i')
     i = _monitor.get('i') + 1
     last_done = _monitor.get('last_done')
@@ -813,6 +896,8 @@ def split_data(X, Y, ratios):
     """
     out = []  # output array
 
+    import pandas as pd
+
     # Load everything together in one dataframe
     df = pd.DataFrame(X)
     if '_Y_' in df:
@@ -926,6 +1011,8 @@ def pandasize(X):
     -------
     pandas Series or DataFrame
     """
+    import pandas as pd
+
     make_series = False   # Assume DataFrame until otherwise indicated
     
     if isinstance(X, pd.Series):
@@ -972,7 +1059,8 @@ def cosine_similarity(A, B):
     """
     if A is None or B is None:
         return 0.0   # more useful that None is many situations
-    
+
+    from scipy import spatial
     distance = spatial.distance.cosine(A, B)
     if math.isnan(distance):
         return 0.0
@@ -0,0 +1,117 @@
+""" random_docs.py
+
+    Random parsed spaCy Docs (and Documents built on them) for the tests.  No spaCy model is needed:  words, heads, dependency labels,
+    POS tags, lemmas and entities are chosen at random and set directly on a Doc.
+
+    The words are chosen to exercise the tree rewriting in Document.preprocess():  compound adjectives ("half - time"), entities,
+    negations, modifiers, conjunctions, auxiliaries, idioms ("take part in"), punctuation and whitespace tokens.
+
+"""
+import os, sys, re
+import random
+import numpy as np
+import pytest
+
+from spacy.vocab import Vocab
+from spacy.tokens import Doc, Span
+from spacy.attrs import HEAD, DEP, POS, LEMMA
+from spacy.parts_of_speech import IDS
+
+################################################################################
+# CONFIG
+
+WORDS = [ # text, POS, dep
+    ('the', 'DET', 'det'), ('a', 'DET', 'det'), ('cat', 'NOUN', 'nsubj'), ('dog', 'NOUN', 'dobj'), ('run', 'VERB', 'ROOT'),
+    ('and', 'CCONJ', 'cc'), ('or', 'CCONJ', 'cc'), ('not', 'ADV', 'neg'), ('no', 'DET', 'det'), ('nor', 'CCONJ', 'cc'),
+    (',', 'PUNCT', 'punct'), ('.', 'PUNCT', 'punct'), ('big', 'ADJ', 'amod'), ('half', 'ADJ', 'amod'), ('-', 'PUNCT', 'punct'),
+    ('time', 'NOUN', 'compound'), ('take', 'VERB', 'ROOT'), ('part', 'NOUN', 'dobj'), ('in', 'ADP', 'prep'), ('be', 'VERB', 'aux'),
+    ('have', 'VERB', 'auxpass'), ('quickly', 'ADV', 'advmod'), ('Paris', 'PROPN', 'pobj'), ('John', 'PROPN', 'nsubj'),
+    ('very', 'ADV', 'advmod'), ('red', 'ADJ', 'amod'), ('\n', 'SPACE', 'dep'),
+]
+
+VERBS = [ w for w in WORDS if w[1] == 'VERB' ]
+
+################################################################################
+# FUNCTIONS
+
+def random_doc(seed, num_sentences=3, max_len=14, vocab=None):
+    """
+    A parsed spaCy Doc of <num_sentences> random trees, one per sentence
+
+    Returns
+    -------
+    spacy.tokens.Doc
+
+    """
+    rng = random.Random(seed)
+    if vocab is None:
+        vocab = Vocab()
+
+    words, heads, tags = [], [], []
+    for s in range(num_sentences):
+        n    = rng.randint(1, max_len)
+        base = len(words)
+        root = base + rng.randrange(n)
+        attached = [root]
+        for i in range(base, base + n):
+            word = rng.choice(VERBS) if i == root else rng.choice(WORDS)
+            words.append(word[0])
+            tags.append( (word[1], 'ROOT' if i == root else word[2]) )
+            heads.append(i)
+        for i in range(base, base + n):
+            if i != root:
+                heads[i] = rng.choice(attached)
+                attached.append(i)
+
+    spaces = [ rng.random() < 0.8  and  not w.isspace() for w in words ]
+    doc = Doc(vocab, words=words, spaces=spaces)
+    rows = [ [ (h - i) & 0xFFFFFFFFFFFFFFFF, vocab.strings.add(dep), IDS[pos], vocab.strings.add(w.lower()) ]
+             for i, (w, h, (pos, dep)) in enumerate(zip(words, heads, tags)) ]
+    if len(rows) > 0:
+        doc.from_array([HEAD, DEP, POS, LEMMA], np.array(rows, dtype=np.uint64))
+
+    ents, i = [], 0                                                    # Runs of proper nouns become entities
+    while i < len(doc):
+        j = i
+        while j < len(doc)  and  doc[j].pos_ == 'PROPN':
+            j += 1
+        if j > i:
+            ents.append( Span(doc, i, j, label='GPE') )
+        i = max(j, i + 1)
+    doc.ents = ents
+
+    return doc
+
+
+def ner_of(spacy_doc):
+    """
+    The 'ner' dict given to a Document (as made by nlp.generate_spacy_data)
+    """
+    return { token.i : (token.ent_type_, token.ent_iob_) for token in spacy_doc }
+
+
+def document_module():
+    """
+    gmutils.document, or skip the calling test module if it cannot be imported (gmutils.nlp loads a spaCy model on import)
+    """
+    try:
+        from gmutils import document
+    except Exception as e:
+        pytest.skip("gmutils.document unavailable: %s"% str(e), allow_module_level=True)
+    return document
+
+
+def make_document(seed, num_sentences=3, max_len=14):
+    """
+    A Document built, as Document.from_texts builds them, from a random parse
+    """
+    Document  = document_module().Document
+    spacy_doc = random_doc(seed, num_sentences, max_len)
+    doc = Document.__new__(Document)
+    doc.set_options({})
+    doc.set_spacy_data(spacy_doc, ner_of(spacy_doc), spacy_doc.vocab)
+    return doc
+
+
+################################################################################
+################################################################################
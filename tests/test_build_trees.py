@@ -0,0 +1,84 @@
+""" test_build_trees.py
+
+    The Node trees built from the arrays of a spaCy parse (node.build_trees) against building them recursively, one Node per
+    token-child, as Nodes were originally built
+
+"""
+import os, sys, re
+import random
+import numpy as np
+import pytest
+
+from random_docs import make_document, random_doc, document_module
+
+document_module()
+from gmutils.node import Node, token_is_prunable
+
+################################################################################
+# FUNCTIONS
+
+def recursive_tree(token, ID):
+    """
+    Nested (ID, token indices, children) for the Node built on <token>:  whitespace tokens are left out, and a child Node is built for
+    each token-child that is not prunable, then dropped if it holds no tokens.  The number in a child's ID is its position among all
+    of the token's children.
+    """
+    tokens   = [ t for t in [token] if re.search(r'\S', t.text) ]
+    children = []
+    for t in tokens:
+        for k, child in enumerate(t.children):
+            if token_is_prunable(child):
+                continue
+            sub = recursive_tree(child, ID + '.' + str(k))
+            if len(sub[1]) > 0:
+                children.append(sub)
+    return ( ID, tuple( t.i for t in tokens ), tuple(children) )
+
+
+def shape(node):
+    return ( node.get('ID'), tuple( token.i for token in node.tokens ), tuple( shape(child) for child in node.children ) )
+
+
+################################################################################
+# TESTS
+
+def test_same_trees_as_recursive_build():
+    for seed in range(500):
+        rng = random.Random(seed)
+        doc = make_document(seed, num_sentences=rng.randint(1, 5), max_len=rng.choice([3, 14, 40]))
+        expected = [ recursive_tree(sen.root, 'root.T' + str(k)) for k, sen in enumerate(doc.spacy_doc.sents) ]
+        assert [ shape(tree) for tree in doc.trees ] == expected
+
+
+def test_token_owners():
+    for seed in range(200):
+        doc = make_document(seed)
+        arrays = doc.tree_arrays
+        held = np.full(len(doc.spacy_doc), -1)
+        for tree in doc.trees:
+            for node in tree.get_nodes():
+                for token in node.tokens:
+                    held[token.i] = node.i
+                assert node.parent is None  or  node in node.parent.children
+        assert list(arrays.owner) == list(held)
+
+
+def test_nodes_have_no_dict():
+    doc = make_document(0)
+    for tree in doc.trees:
+        for node in tree.get_nodes():
+            assert not hasattr(node, '__dict__')
+            assert isinstance(node, Node)
+
+
+def test_empty_document():
+    Document  = document_module().Document
+    spacy_doc = random_doc(0, num_sentences=0)
+    doc = Document.__new__(Document)
+    doc.set_options({})
+    doc.set_spacy_data(spacy_doc, {}, spacy_doc.vocab)
+    assert doc.trees == []
+
+
+################################################################################
+################################################################################
@@ -0,0 +1,125 @@
+""" test_document_text.py
+
+    Character-offset queries on a Document:  char -> token lookups and char spans (against spaCy's own Doc.char_span), and aligning
+    answer strings with its text
+
+"""
+import os, sys, re
+import random
+import pytest
+
+from random_docs import make_document, document_module
+from gmutils.normalize import naked_words, simplify_for_distance
+
+document_module()
+
+################################################################################
+# FUNCTIONS
+
+def naive_token_at_char_index(doc, index):
+    """
+    The last token starting at or before <index>, by scanning all tokens
+    """
+    last_token = None
+    for token in doc.spacy_doc:
+        if token.idx > index:
+            return last_token
+        last_token = token
+    return last_token
+
+
+def reference_char_span(doc, start, end):
+    """
+    spaCy's Doc.char_span(), or else the tokens containing <start> through the token containing <end>
+    """
+    span = doc.spacy_doc.char_span(start, end)
+    if span is None:
+        start_token = naive_token_at_char_index(doc, start)
+        end_token   = naive_token_at_char_index(doc, end)
+        span = doc.spacy_doc[start_token.i:end_token.i+1]
+    return span
+
+
+def random_pairs(doc, rng, n):
+    """
+    Start/end char offsets:  some on token boundaries, some anywhere in the text
+    """
+    tokens = list(doc.spacy_doc)
+    size   = len(doc.get_text())
+    pairs  = []
+    for q in range(n):
+        if rng.random() < 0.5:
+            a = rng.choice(tokens)
+            b = tokens[ rng.randint(a.i, min(len(tokens) - 1, a.i + 3)) ]
+            pairs.append( (a.idx, b.idx + len(b.text)) )
+        else:
+            start = rng.randint(tokens[0].idx, size)
+            pairs.append( (start, rng.randint(start, size)) )
+    return pairs
+
+
+def naive_char_offsets(doc, text, start_char=0):
+    """
+    The first run of Document words containing the words of <text>, by trying every position
+    """
+    raw    = doc.get_text().split(' ')
+    simple = [ simplify_for_distance(word) for word in raw ]
+    starts = [ sum( len(w) + 1 for w in raw[:i] ) for i in range(len(raw)) ]
+    words  = naked_words(text)
+    for i in range(len(raw) - len(words) + 1):
+        if starts[i] >= start_char  and  all( words[k] in simple[i+k] for k in range(len(words)) ):
+            return (starts[i], starts[i] + len(' '.join(raw[i:i+len(words)])))
+    return None
+
+
+################################################################################
+# TESTS
+
+def test_token_at_char_index():
+    for seed in range(100):
+        doc  = make_document(seed)
+        size = len(doc.get_text())
+        for index in range(size + 2):
+            assert doc.get_token_at_char_index(index) == naive_token_at_char_index(doc, index)
+
+
+def test_char_spans_match_spacy():
+    for seed in range(300):
+        doc   = make_document(seed)
+        pairs = random_pairs(doc, random.Random(seed), 20)
+        spans = doc.char_spans(pairs)
+        for (start, end), span in zip(pairs, spans):
+            expected = reference_char_span(doc, start, end)
+            assert (span.start, span.end) == (expected.start, expected.end), (start, end, doc.get_text())
+            assert doc.char_span(start, end).start == span.start
+
+
+def test_text_to_char_offsets():
+    for seed in range(200):
+        doc = make_document(seed)
+        raw = doc.get_text().split(' ')
+        rng = random.Random(seed)
+        for q in range(5):
+            i = rng.randrange(len(raw))
+            j = rng.randint(i + 1, min(len(raw), i + 4))
+            text  = ' '.join(raw[i:j])
+            start = rng.choice([0, rng.randint(0, len(doc.get_text()))])
+            expected = naive_char_offsets(doc, text, start)
+            if expected is None:
+                with pytest.raises(ValueError):
+                    doc.text_to_char_offsets(text, start_char=start)
+            else:
+                assert doc.text_to_char_offsets(text, start_char=start) == expected
+
+
+def test_texts_to_char_offsets_keeps_going_past_a_miss():
+    doc   = make_document(7)
+    raw   = doc.get_text().split(' ')
+    texts = [ raw[0], 'zzzzz', ' '.join(raw[-2:]) ]
+    out   = doc.texts_to_char_offsets(texts)
+    assert out == [ naive_char_offsets(doc, text) for text in texts ]
+    assert out[1] is None  and  out[0] is not None  and  out[2] is not None
+
+
+################################################################################
+################################################################################
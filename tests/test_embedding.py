@@ -0,0 +1,204 @@
+""" test_embedding.py
+
+    Batched Node embeddings (EmbeddingResolver, as used by Document.embed) against looking up each Node on its own, and who holds on
+    to a resolver and its vocab
+
+"""
+import os, sys, re
+import gc
+import random
+import weakref
+import numpy as np
+import pytest
+
+from random_docs import WORDS, make_document, document_module
+
+document_module()
+from gmutils.embedding_resolver import EmbeddingResolver, candidate_keys
+
+################################################################################
+# OBJECTS
+
+class Vocab(dict):
+    """
+    A dict that can be weakly referenced
+    """
+    pass
+
+
+################################################################################
+# FUNCTIONS
+
+def random_vocab(seed, dim=8, share=0.6):
+    """
+    Vectors for some (<share>) of the words, lemmas and joined lemmas that random Documents hold, leaving others out
+    """
+    rng   = np.random.RandomState(seed)
+    keys  = set( w[0].lower() for w in WORDS ) | set(['take_part', 'half-time', 'halftime', 'big_cat', 'not_run'])
+    vocab = Vocab()
+    for key in sorted(keys):
+        if rng.rand() < share:
+            vocab[key] = rng.rand(dim).astype(np.float32)
+    return vocab
+
+
+def naive_embedding(node, vocab, dim):
+    """
+    The embedding of <node> alone (see embedding_resolver.py)
+    """
+    attrs = node.get_token_attributes()
+    for key in candidate_keys(attrs.lemmas_str):
+        if key in vocab:
+            return vocab[key]
+    lemmas, texts = list(attrs.lemmas), node.get_texts()
+    for words in ( lemmas if len(lemmas) > 1 else [], texts ):
+        vecs = [ vocab[w] for w in words if w in vocab ]
+        if len(vecs) > 0:
+            return np.sum(vecs, axis=0) / len(words)
+    return np.zeros(dim)
+
+
+def pre_order(node):
+    out = [node]
+    for child in node.children:
+        out.extend(pre_order(child))
+    return out
+
+
+def all_nodes(doc):
+    nodes = []
+    for tree in doc.trees:
+        nodes.extend(pre_order(tree))
+    return nodes
+
+
+################################################################################
+# TESTS
+
+def test_embed_matches_naive():
+    for seed in range(200):
+        vocab = random_vocab(seed)
+        doc   = make_document(seed)
+        if seed % 2:
+            doc.preprocess(vocab)
+        else:
+            doc.embed(vocab)
+        nodes = all_nodes(doc)
+        assert doc.embedded_nodes == nodes
+        for k, node in enumerate(nodes):
+            expected = naive_embedding(node, vocab, 8)
+            assert np.allclose(node.embedding, expected), (seed, node.get_texts())
+            assert np.allclose(doc.embeddings[k], expected)
+
+
+def test_node_embed_matches_naive():
+    vocab = random_vocab(1)
+    doc   = make_document(1)
+    for tree in doc.trees:
+        for child in tree.children:
+            nodes  = pre_order(child)
+            matrix = child.embed(vocab)
+            assert matrix.shape[0] == len(nodes)
+            for k, node in enumerate(nodes):
+                assert np.allclose(matrix[k], naive_embedding(node, vocab, matrix.shape[1]))   # 300 if nothing was found
+
+
+def test_shared_resolver():
+    vocab    = random_vocab(2)
+    resolver = EmbeddingResolver(vocab)
+    first, second = make_document(2), make_document(2)
+    first.preprocess(vocab, resolver)
+    looked_up = resolver.stats['hits'] + resolver.stats['misses']
+    second.preprocess(vocab, resolver)
+    assert first.resolver is resolver  and  second.resolver is resolver
+    assert resolver.stats['hits'] + resolver.stats['misses'] == looked_up        # All remembered from the first Document
+    assert np.allclose(first.embeddings, second.embeddings)
+
+
+def test_resolver_for_another_vocab():
+    doc = make_document(3)
+    with pytest.raises(Exception):
+        doc.embed(random_vocab(3), EmbeddingResolver(random_vocab(4)))
+
+
+def test_vocab_released_with_document():
+    vocab = random_vocab(4)
+    doc   = make_document(4)
+    doc.embed(vocab)
+    ref = weakref.ref(vocab)
+    del vocab, doc
+    gc.collect()
+    assert ref() is None
+
+
+def test_new_vocab_new_resolver():
+    doc = make_document(5)
+    old, new = random_vocab(5), random_vocab(6)
+    doc.embed(old)
+    ref = weakref.ref(old)
+    resolver = doc.resolver
+    doc.embed(new)
+    assert doc.resolver is not resolver  and  doc.resolver.vocab is new
+    del old, resolver
+    gc.collect()
+    assert ref() is None
+    for node in all_nodes(doc):
+        assert np.allclose(node.embedding, naive_embedding(node, new, 8))
+
+
+def test_clear_forgets_misses():
+    vocab    = random_vocab(7)
+    resolver = EmbeddingResolver(vocab)
+    doc      = make_document(7)
+    doc.embed(vocab, resolver)
+    missing  = next( w[0] for w in WORDS if w[0] not in vocab  and  not w[0].isspace() )
+    vocab[missing] = np.ones(8, dtype=np.float32)
+    resolver.clear()
+    doc.embed(vocab, resolver)
+    for node in all_nodes(doc):
+        assert np.allclose(node.embedding, naive_embedding(node, vocab, 8))
+
+
+def check_vectorized(doc, arrays):
+    """
+    Each row of <arrays> (from doc.vectorize) is what Node.get_vector() gives, and the row links are those of the trees
+    """
+    nodes = all_nodes(doc)
+    row   = { node:k for k, node in enumerate(nodes) }
+    assert np.allclose(arrays['vectors'], np.array([ node.get_vector() for node in nodes ], dtype=np.float32))
+    for k, node in enumerate(nodes):
+        children = node.children
+        assert arrays['parent'][k] == (row[node.parent] if node.parent is not None else -1)
+        assert arrays['first_child'][k] == (row[children[0]] if len(children) > 0 else -1)
+        assert arrays['ID'][k] == node.get('ID')
+    assert list(arrays['roots']) == [ row[tree] for tree in doc.trees ]
+
+
+def test_vectorize():
+    for seed in range(50):
+        vocab = random_vocab(seed)
+        doc   = make_document(seed)
+        doc.preprocess(vocab)
+        check_vectorized(doc, doc.vectorize())
+
+
+def test_vectorize_after_subtree_embedded_again():
+    """
+    Nodes embedded again after Document.embed (here with another vocab) are vectorized with their new embeddings
+    """
+    doc = make_document(8, num_sentences=2)
+    doc.embed(random_vocab(8))
+    other = random_vocab(9, share=1.0)                                  # So that every subtree gets 8 dimensions
+    for tree in doc.trees:
+        if len(tree.children) > 0:
+            tree.children[0].embed(other)
+    check_vectorized(doc, doc.vectorize())
+
+    doc.embed(other)                                                    # All from one matrix again
+    arrays = doc.vectorize()
+    check_vectorized(doc, arrays)
+    assert np.allclose(arrays['vectors'][:, -8:], doc.embeddings)
+
+
+################################################################################
+################################################################################
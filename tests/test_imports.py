@@ -0,0 +1,83 @@
+""" test_imports.py
+
+    The lazy exports of the gmutils package:  the core imports without the heavy dependencies, and a submodule that fails to import is
+    reported as such, with the original exception as its cause
+
+"""
+import os, sys, re
+import json
+import importlib
+import subprocess
+import pytest
+
+import gmutils
+
+################################################################################
+# CONFIG
+
+HEAVY = ['sklearn', 'pandas', 'scipy', 'joblib', 'dill', 'requests', 'tensorflow', 'spacy', 'elasticsearch', 'pymongo']
+
+################################################################################
+# FUNCTIONS
+
+def heavy_modules_after(statement):
+    """
+    The HEAVY modules loaded by <statement>, run in a fresh interpreter
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = "import sys, json\n%s\nprint(json.dumps([ m for m in %r if m in sys.modules ]))"% (statement, HEAVY)
+    env  = dict(os.environ, PYTHONPATH=root)                          # Nothing else (e.g. a sitecustomize) imported up front
+    env.pop('GM_EAGER_IMPORT', None)
+    proc = subprocess.run([sys.executable, '-c', code], cwd=root, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    assert proc.returncode == 0, proc.stderr.decode('utf-8', 'replace')
+    return json.loads(proc.stdout.decode('utf-8').strip().split('\n')[-1])
+
+
+################################################################################
+# TESTS
+
+@pytest.mark.parametrize('statement', [ "import gmutils", "from gmutils import normalize, damerauLevenshtein", "import gmutils.utils" ])
+def test_core_import_is_light(statement):
+    assert heavy_modules_after(statement) == []
+
+
+def test_joblib_on_first_use():
+    assert 'joblib' in heavy_modules_after("from gmutils.utils import get_joblib;  get_joblib().dump")
+
+
+def test_failed_submodule_raises_import_error(monkeypatch):
+    def broken(name, package=None):
+        raise AttributeError("'NoneType' object has no attribute 'add_pipe'")
+
+    monkeypatch.setitem(gmutils._exports, 'Broken', 'broken_module')
+    monkeypatch.setattr(importlib, 'import_module', broken)
+    with pytest.raises(ImportError) as e:
+        from gmutils import Broken
+    assert 'gmutils.broken_module' in str(e.value)  and  "'Broken'" in str(e.value)
+    assert isinstance(e.value.__cause__, AttributeError)
+
+    with pytest.raises(ImportError):
+        hasattr(gmutils, 'Broken')
+
+
+def test_missing_submodule(monkeypatch):
+    monkeypatch.setitem(gmutils._exports, 'Missing', 'no_such_module')
+    with pytest.raises(ImportError) as e:
+        gmutils.Missing
+    assert isinstance(e.value.__cause__, ModuleNotFoundError)
+
+
+def test_unknown_name():
+    assert not hasattr(gmutils, 'no_such_name')
+    with pytest.raises(AttributeError):
+        gmutils.no_such_name
+
+
+def test_lazy_export_cached():
+    Object = gmutils.Object
+    from gmutils.objects import Object as original
+    assert Object is original  and  'Object' in vars(gmutils)
+
+
+################################################################################
+################################################################################
@@ -0,0 +1,95 @@
+""" test_line_index.py
+
+    gmutils.line_index against reading the file line by line, and the line counts of utils.num_lines_in_file
+
+"""
+import os, sys, re
+import gzip
+import random
+import pytest
+
+from gmutils import line_index
+from gmutils.line_index import LineIndex, count_lines, index_path, build_line_index
+from gmutils.utils import num_lines_in_file, iter_file
+
+################################################################################
+# FUNCTIONS
+
+def write_lines(path, n, final_newline=True, seed=0):
+    rng = random.Random(seed)
+    lines = [ 'x' * rng.randint(0, 40) + str(i) for i in range(n) ]
+    text = '\n'.join(lines) + ('\n' if final_newline else '')
+    with open(path, 'w') as FH:
+        FH.write(text)
+    return lines
+
+
+################################################################################
+# TESTS
+
+@pytest.mark.parametrize('final_newline', [True, False])
+def test_index_matches_lines(tmp_path, final_newline):
+    path  = str(tmp_path / 'corpus.txt')
+    lines = write_lines(path, 1000, final_newline)
+    index = LineIndex(path)
+
+    assert len(index) == len(lines)
+    assert [ index.get_line(n) for n in range(len(lines)) ] == lines
+    assert list(index.iter_lines(600)) == lines[600:]
+    assert index.line_at_offset(index.offset(123) + 1) == 123
+
+    parts = index.split(7)
+    assert parts[0][0] == 0  and  parts[-1][1] == len(lines)
+    assert all( a[1] == b[0] for a, b in zip(parts[:-1], parts[1:]) )
+
+
+def test_small_scan_steps(tmp_path, monkeypatch):
+    path = str(tmp_path / 'corpus.txt')
+    write_lines(path, 500)
+    whole = build_line_index(path)
+    monkeypatch.setattr(line_index, 'SCAN_BYTES', 97)
+    assert list(build_line_index(path)) == list(whole)
+
+
+def test_no_index_written_unless_asked(tmp_path):
+    path = str(tmp_path / 'corpus.txt')
+    write_lines(path, 100)
+    LineIndex(path)
+    num_lines_in_file(path)
+    list(iter_file(path, {'start_line':50}))
+    assert not os.path.exists(index_path(path))
+
+    LineIndex(path, {'save':True})
+    assert os.path.exists(index_path(path))
+    assert len(LineIndex(path)) == 100
+
+
+@pytest.mark.parametrize('final_newline', [True, False])
+@pytest.mark.parametrize('saved', [True, False])
+def test_count_lines_like_wc(tmp_path, final_newline, saved):
+    path = str(tmp_path / 'corpus.txt')
+    write_lines(path, 100, final_newline)
+    if saved:
+        LineIndex(path, {'save':True})
+    wc = open(path, 'rb').read().count(b'\n')
+    assert count_lines(path) == wc
+    assert num_lines_in_file(path) == wc
+
+
+def test_num_lines_in_file_compressed(tmp_path):
+    path = str(tmp_path / 'corpus.txt.gz')
+    with gzip.open(path, 'wt') as FH:
+        FH.write('a\nb\nc')
+    assert num_lines_in_file(path) == 2
+    assert num_lines_in_file(str(tmp_path / 'missing.txt')) == -1
+
+
+def test_iter_file_start(tmp_path):
+    path  = str(tmp_path / 'corpus.txt')
+    lines = write_lines(path, 200)
+    assert list(iter_file(path, {'start_line':150})) == [ line.rstrip() for line in lines[150:] ]
+    assert list(iter_file(path, {'start_percent':50})) == [ line.rstrip() for line in lines[100:] ]
+
+
+################################################################################
+################################################################################
@@ -0,0 +1,145 @@
+""" test_memoized.py
+
+    Results remembered by @memoized (objects.py) on the tree version:  Node.get_supporting_tokens() and Document.get_num_nodes() are
+    recomputed once the trees change (absorb, adopt, disown, Document.preprocess), and whenever clear_memo() is called
+
+"""
+import os, sys, re
+import random
+import pytest
+
+from random_docs import make_document, document_module
+
+document_module()
+
+################################################################################
+# FUNCTIONS
+
+def pre_order(node):
+    out = [node]
+    for child in node.children:
+        out.extend(pre_order(child))
+    return out
+
+
+def all_nodes(doc):
+    nodes = []
+    for tree in doc.trees:
+        nodes.extend(pre_order(tree))
+    return nodes
+
+
+def naive_supporting_tokens(node):
+    return set( token for n in pre_order(node) for token in n.tokens )
+
+
+def naive_num_nodes(doc):
+    return len([ node for node in all_nodes(doc) if len(node.tokens) > 0 ])
+
+
+def remember(doc):
+    """
+    Compute (and so memoize) the results for every Node, and for the Document
+    """
+    for node in all_nodes(doc):
+        node.get_supporting_tokens()
+    return doc.get_num_nodes()
+
+
+def check(doc):
+    for node in all_nodes(doc):
+        assert node.get_supporting_tokens() == naive_supporting_tokens(node), node.get('ID')
+    assert doc.get_num_nodes() == naive_num_nodes(doc)
+
+
+def movable(doc):
+    """
+    A non-root Node whose parent is not root, and the root of another tree (or None)
+    """
+    for tree in doc.trees:
+        for node in pre_order(tree)[1:]:
+            if node.parent is not tree:
+                others = [ t for t in doc.trees if t is not tree ]
+                return node, (others[0] if len(others) > 0 else None)
+    return None, None
+
+
+################################################################################
+# TESTS
+
+def test_recomputed_after_preprocess():
+    for seed in range(150):
+        doc = make_document(seed, num_sentences=random.Random(seed).randint(1, 4))
+        remember(doc)
+        doc.preprocess({})
+        check(doc)
+
+
+def test_recomputed_after_absorb():
+    changed = 0
+    for seed in range(60):
+        doc = make_document(seed)
+        node, _ = movable(doc)
+        if node is None:
+            continue
+        parent = node.parent
+        root   = next( tree for tree in doc.trees if node in pre_order(tree) )
+        under  = set(pre_order(parent))
+        other  = [ n for n in pre_order(root) if n not in under ]      # Never empty:  parent is not the root
+        before = remember(doc)
+        old    = set(parent.get_supporting_tokens())
+
+        random.Random(seed).choice(other).absorb(node)                  # Takes node's tokens (and children) away from parent
+        assert parent.get_supporting_tokens() < old
+        assert doc.get_num_nodes() == before - 1
+        check(doc)
+        changed += 1
+    assert changed > 10
+
+
+def test_recomputed_after_adopt_and_disown():
+    moved = 0
+    for seed in range(60):
+        doc = make_document(seed)
+        node, other = movable(doc)
+        if node is None  or  other is None:
+            continue
+        parent = node.parent
+        before = remember(doc)
+        parent.disown(node)
+        assert doc.get_num_nodes() == before - len([ n for n in pre_order(node) if len(n.tokens) > 0 ])
+        assert not node.get_supporting_tokens() <= parent.get_supporting_tokens()
+        check(doc)
+
+        other.adopt(node)
+        assert node.get_supporting_tokens() <= other.get_supporting_tokens()
+        assert doc.get_num_nodes() == before
+        check(doc)
+        moved += 1
+    assert moved > 10
+
+
+def test_clear_memo():
+    """
+    Changes made behind the Document's back (here:  without tree_changed) are only seen after clear_memo
+    """
+    doc  = make_document(3)
+    node, _ = movable(doc)
+    parent  = node.parent
+    num     = remember(doc)
+    tokens  = set(parent.get_supporting_tokens())
+
+    doc.tree_arrays.unlink(node.i)
+    assert parent.get_supporting_tokens() == tokens  and  doc.get_num_nodes() == num         # Still the remembered results
+
+    parent.clear_memo('get_num_nodes')                                  # Another method:  nothing forgotten
+    assert parent.get_supporting_tokens() == tokens
+    parent.clear_memo('get_supporting_tokens')
+    assert parent.get_supporting_tokens() == naive_supporting_tokens(parent) != tokens
+
+    doc.clear_memo()
+    assert doc.get_num_nodes() == naive_num_nodes(doc) < num
+
+
+################################################################################
+################################################################################
@@ -0,0 +1,138 @@
+""" test_progress.py
+
+    The progress Monitor:  counts aggregated across threads and forked processes, and the 'skip' / 'skipped' behaviour of the
+    original '_monitor' dict (see utils.monitor)
+
+"""
+import os, sys, re
+import time
+import threading
+import multiprocessing
+import pytest
+
+from gmutils.progress import Monitor, MAX_EVERY_SHARED
+from gmutils.utils import monitor, monitor_setup
+
+################################################################################
+# FUNCTIONS
+
+def fork_context():
+    try:
+        return multiprocessing.get_context('fork')
+    except ValueError:
+        pytest.skip("processes cannot be forked here")
+
+
+def work(m, n):
+    for k in range(n):
+        m.tick()
+
+
+def run_workers(m, counts):
+    """
+    Tick <m> counts[k] times in the k-th of several forked processes, polling from this one until they are done
+
+    Returns
+    -------
+    array of int : the aggregate counts seen while polling
+
+    """
+    ctx = fork_context()
+    workers = [ ctx.Process(target=work, args=(m, n)) for n in counts ]
+    for w in workers:
+        w.start()
+    polled = []
+    while any( w.is_alive() for w in workers ):
+        polled.append(m.poll())
+        time.sleep(0.005)
+    for w in workers:
+        w.join()
+        assert w.exitcode == 0
+    return polled
+
+
+def dict_states(total_i, n, options):
+    """
+    'i' and 'skip' after each of <n> items, counted with the original '_monitor' dict
+    """
+    _monitor = { 'total_i':total_i, 'i':0, 'last_done':0.0, 'skip':options.get('skip') }
+    if options.get('skipped'):
+        _monitor['i'] = int( (float(total_i) * float(options.get('skipped'))) / 100. )
+    states = []
+    for k in range(n):
+        _monitor = monitor(_monitor, {'silent':True})
+        states.append( (_monitor['i'], bool(_monitor['skip'])) )
+    return states
+
+
+################################################################################
+# TESTS
+
+def test_threads():
+    m = Monitor(160000, {'threadsafe':True, 'silent':True})
+    threads = [ threading.Thread(target=work, args=(m, 20000)) for t in range(8) ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert m.count() == 160000  and  m['i'] == 160000
+
+
+def test_processes():
+    m = Monitor(400000, {'shared':True, 'silent':True, 'interval':0.01})
+    polled = run_workers(m, [100000] * 4)
+    assert m.count() == 400000  and  m['i'] == 400000
+    assert polled == sorted(polled)                                     # The parent sees the count grow while the workers run
+    m.close()
+    assert m['progress_ratio'] == 1.0
+
+
+def test_processes_counting_few_items():
+    """
+    Workers that count fewer items than the Monitor waits for between checks still add them all when they exit
+    """
+    m = Monitor(100, {'shared':True, 'silent':True, 'every':1000})
+    run_workers(m, [1, 2, 3, 0, 5])
+    assert m.count() == 11
+
+
+def test_parent_count_not_counted_twice():
+    m = Monitor(1000, {'shared':True, 'silent':True})
+    m.tick(7)                                                           # Not yet flushed when the workers are forked
+    run_workers(m, [10, 20])
+    assert m.count() == 37
+    m.tick(3)
+    assert m.count() == 40  and  m.flush() == 40
+
+
+def test_shared_checks_stay_frequent():
+    m = Monitor(None, {'shared':True, 'silent':True, 'interval':0.001})
+    work(m, 3 * MAX_EVERY_SHARED)
+    assert m.every <= MAX_EVERY_SHARED
+    assert m.shared.value >= 2 * MAX_EVERY_SHARED
+
+
+@pytest.mark.parametrize('options', [ {}, {'skip':30}, {'skip':30, 'skipped':10}, {'skipped':50}, {'skip':99.9}, {'skip':0.5} ])
+def test_skip_matches_dict(options):
+    total_i = 1000
+    m = monitor_setup(None, total_i, dict(options, silent=True))
+    assert isinstance(m, Monitor)
+    states = []
+    for k in range(total_i):
+        m = monitor(m)
+        states.append( (m['i'], bool(m['skip'])) )
+    assert states == dict_states(total_i, total_i, options)
+
+
+def test_skip_across_processes():
+    """
+    In the creating process, 'skip' is cleared once the aggregate count passes it
+    """
+    m = Monitor(1000, {'shared':True, 'silent':True, 'skip':40})
+    run_workers(m, [300, 300])
+    m.poll()
+    assert m['skip'] is False
+
+
+################################################################################
+################################################################################
@@ -0,0 +1,117 @@
+""" test_rewrite.py
+
+    The worklist-driven RewriteEngine (as run by Document.preprocess) against the sweeps it replaced:  for each rule in turn, every
+    tree is searched for candidates in pre-order and the rule applied to each, again and again until a whole sweep alters nothing
+
+"""
+import os, sys, re
+import random
+import pytest
+
+from random_docs import make_document, document_module
+
+document_module()
+from gmutils.rewrite import RULES, PREPROCESS, RewriteEngine, Rule
+
+################################################################################
+# CONFIG
+
+MAX_SWEEPS = 50             # Some trees make the negation rule swap two Nodes back and forth forever
+
+################################################################################
+# FUNCTIONS
+
+def pre_order(node):
+    out = [node]
+    for child in node.children:
+        out.extend(pre_order(child))
+    return out
+
+
+def sweep(doc, rule):
+    """
+    Apply <rule> by sweeping all trees until nothing changes
+
+    Returns
+    -------
+    bool : whether the sweeps stopped on their own (within MAX_SWEEPS)
+
+    """
+    for s in range(MAX_SWEEPS):
+        altered = False
+        for tree in doc.trees:
+            for node in [ node for node in pre_order(tree) if rule.select(node) ]:
+                if not node.is_dead  and  rule.apply(node):
+                    altered = True
+        if not altered:
+            return True
+    return False
+
+
+def shape(node):
+    """
+    Nested (token indices, children).  Token indices are sorted:  the order in which an agglomeration adds tokens can depend on the
+    iteration order of a set.
+    """
+    return ( tuple(sorted( token.i for token in node.tokens )), tuple( shape(child) for child in node.children ) )
+
+
+def forest(doc):
+    return [ shape(tree) for tree in doc.trees ]
+
+
+################################################################################
+# TESTS
+
+def test_engine_matches_sweeps():
+    compared = 0
+    for seed in range(400):
+        num_sentences = random.Random(seed).randint(1, 4)
+        swept = make_document(seed, num_sentences)
+        if not all( sweep(swept, RULES[name]) for name in PREPROCESS ):
+            continue
+
+        doc = make_document(seed, num_sentences)
+        doc.rewrite(PREPROCESS)
+        assert forest(doc) == forest(swept), seed
+        compared += 1
+
+    assert compared > 350
+
+
+@pytest.mark.parametrize('name', PREPROCESS)
+def test_each_rule_matches_sweeps(name):
+    for seed in range(200):
+        swept = make_document(seed)
+        if not sweep(swept, RULES[name]):
+            continue
+        doc = make_document(seed)
+        doc.rewrite([name])
+        assert forest(doc) == forest(swept), seed
+
+
+def test_engine_stops_oscillating_rules():
+    """
+    A rule that never stops altering the trees is cut off after max_visits calls per token
+    """
+    doc  = make_document(0)
+    flip = Rule('flip', lambda node: True, lambda node: True)
+    engine = RewriteEngine(doc, {'max_visits':3})
+    before = forest(doc)
+    engine.run(flip)
+    assert forest(doc) == before
+    assert engine.stats['flip']['calls'] <= 3 * (len(doc.tree_arrays) + 1)
+
+
+def test_stats():
+    doc = make_document(5)
+    doc.rewrite(PREPROCESS)
+    stats = doc.rewrite_stats
+    assert set(stats.keys()) == set(PREPROCESS)
+    for counts in stats.values():
+        assert counts['changes'] <= counts['calls'] <= counts['candidates'] + counts['requeued']
+    assert sum( counts['changes'] for counts in stats.values() ) > 0
+
+
+################################################################################
+################################################################################
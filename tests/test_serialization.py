@@ -0,0 +1,113 @@
+""" test_serialization.py
+
+    Round trips through gmutils.serialization, and the files it leaves behind
+
+"""
+import os, sys, re
+import pickle
+import numpy as np
+import pytest
+
+from gmutils import serialization
+from gmutils.serialization import dump, load, atomic_write, detect_format, LazyDict
+from gmutils.utils import serialize, deserialize
+
+################################################################################
+# FUNCTIONS
+
+def sample():
+    return { 'vectors' : np.arange(1000, dtype=np.float32).reshape(100, 10),
+             'words'   : [ 'w%d'% i for i in range(100) ],
+             'meta'    : { 'dim':10 } }
+
+
+def same(a, b):
+    assert sorted(a.keys()) == sorted(b.keys())
+    assert np.array_equal(a['vectors'], b['vectors'])
+    assert a['words'] == b['words']  and  a['meta'] == b['meta']
+
+
+@pytest.fixture
+def umask():
+    old = os.umask(0o022)
+    yield 0o022
+    os.umask(old)
+
+
+################################################################################
+# TESTS
+
+@pytest.mark.parametrize('options', [ {}, {'mmap':True}, {'lazy':True}, {'mmap':True, 'lazy':True} ])
+def test_round_trip(tmp_path, options):
+    path = str(tmp_path / 'thing.gm')
+    dump(sample(), path, options={'lazy':options.get('lazy')})
+    out = load(path, options=options)
+    if options.get('lazy'):
+        assert isinstance(out, LazyDict)
+        out = out.materialize()
+    same(sample(), out)
+
+
+def test_round_trip_gzip(tmp_path):
+    path = str(tmp_path / 'thing.gm')
+    dump(sample(), path, options={'compress':'gzip'})
+    same(sample(), load(path, options={'mmap':True}))      # mmap is ignored for compressed files
+
+
+def test_atomic_write_failure_keeps_old_file(tmp_path):
+    path = str(tmp_path / 'thing.txt')
+    with open(path, 'w') as FH:
+        FH.write('old')
+    with pytest.raises(RuntimeError):
+        with atomic_write(path, 'w') as FH:
+            FH.write('new')
+            raise RuntimeError()
+    assert open(path).read() == 'old'
+    assert os.listdir(str(tmp_path)) == ['thing.txt']
+
+
+def test_atomic_write_new_file_respects_umask(tmp_path, umask):
+    path = str(tmp_path / 'thing.txt')
+    with atomic_write(path, 'w') as FH:
+        FH.write('x')
+    assert os.stat(path).st_mode & 0o777 == 0o666 & ~umask
+
+
+def test_atomic_write_keeps_mode_of_existing_file(tmp_path, umask):
+    path = str(tmp_path / 'thing.txt')
+    with open(path, 'w') as FH:
+        FH.write('old')
+    os.chmod(path, 0o664)
+    with atomic_write(path, 'w') as FH:
+        FH.write('new')
+    assert os.stat(path).st_mode & 0o777 == 0o664
+
+
+def test_detect_format(tmp_path):
+    path = str(tmp_path / 'thing')
+    dump(sample(), path)
+    assert detect_format(path) == 'gmutils'
+
+    with open(path, 'wb') as FH:
+        pickle.dump(sample(), FH)
+    assert detect_format(path) == 'pickle'
+    same(sample(), deserialize(path))
+
+
+def test_detect_format_joblib(tmp_path):
+    joblib = pytest.importorskip('joblib')
+    path = str(tmp_path / 'thing')
+    joblib.dump(sample(), path)
+    assert detect_format(path) == 'joblib'
+    same(sample(), deserialize(path))
+
+
+def test_serialize_default_backend(tmp_path):
+    path = str(tmp_path / 'thing')
+    serialize(sample(), path)
+    assert detect_format(path) == 'gmutils'
+    same(sample(), deserialize(path, options={'mmap':True}))
+
+
+################################################################################
+################################################################################
@@ -0,0 +1,142 @@
+""" test_streaming.py
+
+    gmutils.streaming.FileReader against the plain contents of each kind of file, including parallel reading of gzip files
+
+"""
+import os, sys, re
+import io
+import bz2
+import gzip
+import lzma
+import random
+import zipfile
+import pytest
+
+from gmutils.streaming import FileReader, iter_lines, iter_chunks, detect_codec, find_gzip_members, decompress_gzip_range
+
+################################################################################
+# FUNCTIONS
+
+def sample_lines(n=5000, seed=0):
+    rng = random.Random(seed)
+    words = ['alpha', 'beta', 'gamma', 'delta', 'épsilon', '東京']
+    return [ ' '.join( rng.choice(words) for _ in range(rng.randint(0, 12)) ) for _ in range(n) ]
+
+
+def write(path, codec, data):
+    if codec is None:
+        with open(path, 'wb') as FH:
+            FH.write(data)
+    elif codec == 'gzip':
+        with gzip.open(path, 'wb') as FH:
+            FH.write(data)
+    elif codec == 'bz2':
+        with bz2.open(path, 'wb') as FH:
+            FH.write(data)
+    elif codec == 'xz':
+        with lzma.open(path, 'wb') as FH:
+            FH.write(data)
+    elif codec == 'zip':
+        with zipfile.ZipFile(path, 'w') as zf:
+            zf.writestr(re.sub(r'\.zip$', '', os.path.basename(path)), data)
+
+
+def write_members(path, data, member_size):
+    """
+    A multi-member gzip file (as written by pigz or bgzip):  <data> compressed in pieces of <member_size> bytes
+    """
+    with open(path, 'wb') as FH:
+        for i in range(0, len(data), member_size):
+            FH.write(gzip.compress(data[i:i+member_size]))
+
+
+################################################################################
+# TESTS
+
+@pytest.mark.parametrize('codec, ext', [ (None, '.txt'), ('gzip', '.gz'), ('bz2', '.bz2'), ('xz', '.xz'), ('zip', '.zip') ])
+def test_lines_and_chunks(tmp_path, codec, ext):
+    lines = sample_lines()
+    data  = ('\n'.join(lines) + '\n').encode('utf-8')
+    path  = str(tmp_path / ('corpus.txt' + ext if ext != '.txt' else 'corpus.txt'))
+    write(path, codec, data)
+
+    assert detect_codec(path) == codec
+    assert list(iter_lines(path)) == lines
+    chunks = list(iter_chunks(path, 1000))
+    assert b''.join(chunks) == data
+    assert max( len(c) for c in chunks ) <= 1000
+
+
+def test_reader_closes_handles(tmp_path):
+    path = str(tmp_path / 'corpus.txt.gz')
+    write(path, 'gzip', b'a\nb\nc\n')
+    reader = FileReader(path)
+    lines = reader.iter_lines()
+    assert next(lines) == 'a'
+    lines.close()
+    assert reader.handles == []
+
+
+def test_parallel_multi_member(tmp_path):
+    data = ('\n'.join(sample_lines(20000)) + '\n').encode('utf-8')
+    path = str(tmp_path / 'corpus.txt.gz')
+    write_members(path, data, 1 << 14)
+    assert len(find_gzip_members(path, 8)) > 1
+
+    options = { 'processes':2, 'block_size':1 << 13, 'chunk_size':1 << 12 }
+    with FileReader(path, options) as reader:
+        assert b''.join(reader.iter_chunks()) == data
+    assert list(iter_lines(path, options)) == data.decode('utf-8').split('\n')[:-1]
+
+
+def test_parallel_single_member_streams(tmp_path):
+    """
+    An ordinary .gz file has nothing to split, and is read in chunk_size pieces, not as one block
+    """
+    data = ('\n'.join(sample_lines(20000)) + '\n').encode('utf-8')
+    path = str(tmp_path / 'corpus.txt.gz')
+    write(path, 'gzip', data)
+
+    with FileReader(path, { 'processes':2, 'block_size':1 << 12, 'chunk_size':1 << 12 }) as reader:
+        blocks = list(reader.iter_gzip_parallel())
+    assert b''.join(blocks) == data
+    assert max( len(b) for b in blocks ) <= 1 << 12
+
+
+def test_parallel_block_limit(tmp_path):
+    """
+    No block is larger than block_limit, even where one member alone decompresses to more than that
+    """
+    data = ('\n'.join(sample_lines(20000)) + '\n').encode('utf-8')
+    path = str(tmp_path / 'corpus.txt.gz')
+    with open(path, 'wb') as FH:
+        FH.write(gzip.compress(data[:1 << 12]))
+        FH.write(gzip.compress(data[1 << 12 : 1 << 18]))                 # Larger than block_limit
+        for i in range(1 << 18, len(data), 1 << 12):
+            FH.write(gzip.compress(data[i : i + (1 << 12)]))
+
+    options = { 'processes':2, 'block_size':1 << 12, 'block_limit':1 << 14, 'chunk_size':1 << 12 }
+    with FileReader(path, options) as reader:
+        blocks = list(reader.iter_gzip_parallel())
+    assert b''.join(blocks) == data
+    assert max( len(b) for b in blocks ) <= 1 << 14
+
+
+def test_decompress_gzip_range_limit(tmp_path):
+    data = bytes(range(256)) * 64
+    path = str(tmp_path / 'corpus.gz')
+    write_members(path, data, 1 << 12)
+    size = os.path.getsize(path)
+
+    out, after = decompress_gzip_range(path, 0, size, limit=len(data))
+    assert out == data  and  after == size
+
+    out, after = decompress_gzip_range(path, 0, size, limit=(1 << 13) + 10)        # Stops at a member boundary
+    assert out == data[:1 << 13]  and  0 < after < size
+
+    out, after = decompress_gzip_range(path, 0, size, limit=100)                   # First member alone is too large
+    assert out == b''  and  after == 0
+
+
+################################################################################
+################################################################################
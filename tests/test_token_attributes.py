@@ -0,0 +1,146 @@
+""" test_token_attributes.py
+
+    The per-Node cache of token-derived attributes (Node.get_token_attributes):  after the tokens of Nodes are changed (absorb, kill,
+    rootswitch_with_child, and all of Document.preprocess), each Node reads the same lemmas, POS, dependencies, entity types and
+    entity position as computed afresh from its tokens
+
+"""
+import os, sys, re
+import random
+import pytest
+
+from random_docs import make_document, document_module
+
+document_module()
+from gmutils.node import attribute_stats, attribute_cache_stats
+
+################################################################################
+# FUNCTIONS
+
+def fresh(node):
+    """
+    The attributes of <node>, computed from its tokens
+    """
+    tokens = node.tokens or []
+    lemmas = [ token.text.lower() if re.search(r'^-[A-Z]+-$', token.lemma_) else token.lemma_ for token in tokens ]
+    position = 'O'
+    for token in tokens:
+        iob = node.doc.ner.get(token.i, ('', 'O'))[1]
+        if iob == 'B':
+            position = 'B'
+        if iob == 'I'  and  position == 'O':
+            position = 'I'
+    return {
+        'lemmas'          : lemmas,
+        'lemmas_str'      : ' '.join(lemmas),
+        'pos'             : [ token.pos_ for token in tokens ],
+        'dep'             : sorted( token.dep_ for token in tokens ),
+        'ner'             : [ token.ent_type_ for token in tokens if token.ent_type > 0 ],
+        'entity_position' : position,
+    }
+
+
+def cached(node):
+    """
+    The same attributes, as the Node's methods give them
+    """
+    return {
+        'lemmas'          : node.get_lemmas(),
+        'lemmas_str'      : node.get_lemmas_str(),
+        'pos'             : node.get_pos(),
+        'dep'             : node.get_dep(),
+        'ner'             : node.get_ner(),
+        'entity_position' : node.get_entity_position(),
+    }
+
+
+def all_nodes(doc):
+    nodes = []
+    for tree in doc.trees:
+        nodes.extend(tree.get_nodes())
+    return nodes
+
+
+def check(nodes):
+    for node in nodes:
+        assert cached(node) == fresh(node), node.get('ID')
+
+
+def node_with_child(doc):
+    for node in all_nodes(doc):
+        if len(node.children) > 0:
+            return node
+    return None
+
+
+################################################################################
+# TESTS
+
+def test_attributes_after_preprocess():
+    invalidated = 0
+    for seed in range(200):
+        doc = make_document(seed, num_sentences=random.Random(seed).randint(1, 4))
+        check(all_nodes(doc))                                           # Fill the caches before the tokens move
+        before = attribute_stats['invalidations']
+        doc.preprocess({})
+        invalidated += attribute_stats['invalidations'] - before
+        check(all_nodes(doc))
+    assert invalidated > 0
+
+
+def test_reads_are_cached():
+    doc   = make_document(1)
+    nodes = all_nodes(doc)
+    check(nodes)
+    before = attribute_cache_stats()
+    check(nodes)
+    after = attribute_cache_stats()
+    assert after['misses'] == before['misses']
+    assert after['hits'] >= before['hits'] + 6 * len(nodes)
+
+
+def test_absorb():
+    for seed in range(50):
+        doc    = make_document(seed)
+        parent = node_with_child(doc)
+        if parent is None:
+            continue
+        child = parent.children[-1]
+        check([parent, child])
+        before = attribute_stats['invalidations']
+        parent.absorb(child)
+        assert attribute_stats['invalidations'] >= before + 2           # The absorbing Node, and the one killed
+        assert child.is_dead
+        check(all_nodes(doc) + [child])
+        assert child.get_lemmas() == []  and  child.get_entity_position() == 'O'
+
+
+def test_kill():
+    doc  = make_document(2)
+    node = node_with_child(doc).children[0]
+    check([node])
+    before = attribute_stats['invalidations']
+    node.parent.disown(node)
+    node.kill()
+    assert attribute_stats['invalidations'] == before + 1
+    check([node])
+
+
+def test_rootswitch_with_child():
+    for seed in range(50):
+        doc  = make_document(seed)
+        root = next(( tree for tree in doc.trees if len(tree.children) > 0 ), None)
+        if root is None:
+            continue
+        child = root.children[0]
+        old_root, old_child = fresh(root), fresh(child)
+        check([root, child])
+        before = attribute_stats['invalidations']
+        root.rootswitch_with_child(child)
+        assert attribute_stats['invalidations'] == before + 2
+        assert cached(root) == old_child  and  cached(child) == old_root
+        check(all_nodes(doc))
+
+
+################################################################################
+################################################################################
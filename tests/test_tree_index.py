@@ -0,0 +1,111 @@
+""" test_tree_index.py
+
+    Ancestry, depth, lowest-common-ancestor and distance queries (TreeIndex, and the Node methods using it) against climbing the trees
+    one parent at a time
+
+"""
+import os, sys, re
+import random
+import pytest
+
+from random_docs import make_document, document_module
+
+document_module()
+from gmutils.node import get_group_ancestor
+from gmutils.tree_index import TreeIndex
+
+################################################################################
+# FUNCTIONS
+
+def ancestors(node):
+    """
+    The proper ancestors of <node>, nearest first, by following parent links
+    """
+    out = []
+    focus = node.parent
+    while focus is not None:
+        out.append(focus)
+        focus = focus.parent
+    return out
+
+
+def naive_lca(a, b):
+    above_b = set([b] + ancestors(b))
+    for node in [a] + ancestors(a):
+        if node in above_b:
+            return node
+    return None
+
+
+def naive_distance(a, b):
+    k = naive_lca(a, b)
+    if k is None:
+        return None
+    return len(ancestors(a)) + len(ancestors(b)) - 2 * len(ancestors(k))
+
+
+def all_nodes(doc):
+    nodes = []
+    for tree in doc.trees:
+        nodes.extend(tree.get_nodes())
+    return nodes
+
+
+def check_document(doc, rng, queries=40):
+    nodes = all_nodes(doc)
+    index = TreeIndex(doc.trees)
+    assert len(index) == len(nodes)
+
+    for node in nodes:
+        depth = len(ancestors(node))
+        assert index.get_depth(node) == depth  and  node.get_depth() == depth
+        assert index.get_root(node) is ([node] + ancestors(node))[-1]
+
+    for q in range(queries):
+        a, b = rng.choice(nodes), rng.choice(nodes)
+        expected = a in ancestors(b)
+        assert index.is_ancestor(a, b) == expected
+        assert b.is_ancestor(a) == expected  and  a.is_descendant(b) == expected
+        assert index.lca(a, b) is naive_lca(a, b)
+        assert a.get_lowest_common_ancestor(b) is naive_lca(a, b)
+        assert index.distance(a, b) == naive_distance(a, b)
+        assert a.get_graph_distance(b) == naive_distance(a, b)
+
+        tree  = rng.choice(doc.trees)
+        group = set( rng.choice(tree.get_nodes()) for _ in range(rng.randint(1, 4)) )
+        expected = None
+        for node in group:
+            expected = node if expected is None else naive_lca(expected, node)
+        assert get_group_ancestor(set(group)) is expected
+
+
+################################################################################
+# TESTS
+
+def test_tree_index_matches_climbing():
+    for seed in range(300):
+        doc = make_document(seed, num_sentences=random.Random(seed).randint(1, 4))
+        check_document(doc, random.Random(seed))
+
+
+def test_tree_index_after_preprocess():
+    """
+    The Document's index is rebuilt once the trees have changed
+    """
+    for seed in range(150):
+        doc = make_document(seed)
+        doc.get_tree_index()                                            # Built for the original trees
+        doc.preprocess({})
+        check_document(doc, random.Random(seed))
+
+
+def test_group_ancestor_across_trees():
+    doc = make_document(3, num_sentences=3)
+    group = [ tree.get_nodes()[-1] for tree in doc.trees ]
+    least = min( len(ancestors(node)) for node in group )
+    roots = [ ([node] + ancestors(node))[-1] for node in group if len(ancestors(node)) == least ]
+    assert any( get_group_ancestor(set(group)) is root for root in roots )
+
+
+################################################################################
+################################################################################